@@ -0,0 +1,561 @@
+"""Benchmark harness for LocalSync.
+
+For each cache size it generates a synthetic apt cache, then measures:
+
+- ``startup``: time until a server's port accepts connections, until it
+  answers and until ingestion is done, cold (empty catalogue) and warm
+  (restart over the same catalogue);
+- ``micro``: in-process timings of ``get_package``, ``resolve_file``,
+  ``describe``, the full listing and ``Config.add_to_cache``/``flush_cache``;
+- ``http``: latency percentiles and throughput of each endpoint under
+  concurrent load;
+- ``install``: client resolve, plan and download time for packages and
+  their dependencies spread over several local servers.
+
+Results are written as JSON; ``compare`` prints the change between two runs::
+
+    python -m benchmarks.bench --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.bench compare baseline.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.synthetic import generate_cache, generate_large, package_name
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKDIR = os.path.join(REPO_ROOT, "bench-work")
+READY_TIMEOUT = 1800
+# Heavier endpoints get fewer requests so a 100k run finishes in reasonable time.
+REQUEST_SHARE = {"cache_list_full": 0.1, "pool_large": 0.01}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def summarize(latencies, scale=1000.0):
+    """Latency statistics in milliseconds (by default) for a list of seconds."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"samples": 0}
+    return {
+        "samples": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * scale, 4),
+        "p50_ms": round(percentile(latencies, 0.50) * scale, 4),
+        "p90_ms": round(percentile(latencies, 0.90) * scale, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * scale, 4),
+        "max_ms": round(latencies[-1] * scale, 4),
+    }
+
+
+def lan_address():
+    """The address servers advertise to each other, so federated answers name the same hosts."""
+    from src.server.network_utils import get_ip_list
+    ips = get_ip_list()
+    return ips[0] if ips else "127.0.0.1"
+
+
+class BenchServer:
+    """A LocalSync server in its own process and data directory."""
+
+    def __init__(self, directory, port, cache_dirs, host="127.0.0.1", **config):
+        self.directory = directory
+        self.port = port
+        self.host = host
+        self.config = {
+            "port": port,
+            "cache_dirs": cache_dirs,
+            "eviction": False,
+            "federation": False,
+            **config,
+        }
+        self.process = None
+        self.log = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def peer(self):
+        return {"ip": self.host, "port": self.port, "properties": {}}
+
+    def reset(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+
+    def start(self):
+        """Start the server. Returns the monotonic time it was launched at."""
+        with open(os.path.join(self.directory, "config.json"), "w") as f:
+            json.dump(self.config, f, indent=4)
+        self.log = open(os.path.join(self.directory, "server.out"), "ab")
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+        started = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_ROOT, "main.py"), "serve"],
+            cwd=self.directory, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        return started
+
+    def wait_bound(self, timeout=READY_TIMEOUT):
+        """Poll the port until it accepts a TCP connection. Returns the monotonic time it did."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server in {self.directory} exited with {self.process.returncode}")
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return time.monotonic()
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"Server in {self.directory} not listening after {timeout}s")
+
+    def info(self):
+        return requests.get(f"{self.url}/api/server-info", timeout=5).json()
+
+    def wait(self, condition, timeout=READY_TIMEOUT):
+        """Poll server-info until ``condition(info)`` holds. Returns the monotonic time it did."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server in {self.directory} exited with {self.process.returncode}")
+            try:
+                if condition(self.info()):
+                    return time.monotonic()
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"Server in {self.directory} not ready after {timeout}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def ingested(expected):
+    return lambda info: info["ingestion"]["state"] == "complete" and info["package_count"] >= expected
+
+
+def measure_startup(server, expected):
+    """Seconds until the port is bound, until the server answers and until it has every package indexed."""
+    started = server.start()
+    bound = server.wait_bound()
+    answered = server.wait(lambda info: True)
+    done = server.wait(ingested(expected))
+    info = server.info()
+    return {
+        "bound_s": round(bound - started, 4),
+        "answer_s": round(answered - started, 4),
+        "ingested_s": round(done - started, 4),
+        "packages": info["package_count"],
+        "files_per_s": round(info["ingestion"]["done"] / max(done - answered, 1e-9), 1)
+        if info["ingestion"]["done"] else None,
+    }
+
+
+def load_test(make_request, count, concurrency, seed=0):
+    """Run ``make_request(session, i, rng)`` ``count`` times from ``concurrency`` threads.
+
+    Worker thread ``n`` draws from its own ``random.Random(seed + n)``.
+    ``make_request`` returns the number of body bytes received.
+    """
+    latencies = []
+    errors = 0
+    received = 0
+    lock = threading.Lock()
+    counter = iter(range(count))
+
+    def worker(index):
+        nonlocal errors, received
+        rng = random.Random(seed + index)
+        with requests.Session() as session:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    size = make_request(session, i, rng)
+                except requests.RequestException:
+                    with lock:
+                        errors += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    received += size
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return {
+        **summarize(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": round(seconds, 4),
+        "requests_per_s": round(len(latencies) / seconds, 1),
+        "mb_per_s": round(received / seconds / 1e6, 2),
+    }
+
+
+def http_benchmarks(server, names, filenames, large_filename, args):
+    """Latency under load for every endpoint clients and apt use."""
+    info = server.info()
+    url = server.url
+
+    def checked(response):
+        response.raise_for_status()
+        return len(response.content)
+
+    endpoints = {
+        "cache_list_full": lambda s, i, rng: checked(s.get(f"{url}/api/cache-list")),
+        "cache_list_delta": lambda s, i, rng: checked(
+            s.get(f"{url}/api/cache-list", params={"since": info["generation"], "epoch": info["epoch"]})),
+        "pkg": lambda s, i, rng: checked(s.get(f"{url}/api/pkg/{rng.choice(names)}")),
+        "pkgs_batch_50": lambda s, i, rng: checked(s.post(f"{url}/api/pkgs", json={"names": rng.sample(names, min(50, len(names)))})),
+        "pool_small": lambda s, i, rng: checked(s.get(f"{url}/pool/{rng.choice(filenames)}")),
+        "download_small": lambda s, i, rng: checked(s.post(f"{url}/api/download", json={"filename": rng.choice(filenames)})),
+        "pool_large": lambda s, i, rng: checked(s.get(f"{url}/pool/{large_filename}")),
+        "metrics": lambda s, i, rng: checked(s.get(f"{url}/metrics")),
+    }
+    results = {}
+    for name, make_request in endpoints.items():
+        count = max(args.concurrency, int(args.requests * REQUEST_SHARE.get(name, 1)))
+        results[name] = load_test(make_request, count, args.concurrency, args.seed)
+        print(f"  {name}: p50 {results[name].get('p50_ms')} ms, p99 {results[name].get('p99_ms')} ms, "
+              f"{results[name]['requests_per_s']} req/s")
+    return results
+
+
+def run_subcommand(name, directory, extra, env=None):
+    """Run ``bench.py <name>`` in ``directory`` and return the JSON it writes."""
+    output = os.path.join(directory, f"{name}.json")
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench", name, "--output", output, *extra],
+        cwd=directory, env={**os.environ, "PYTHONPATH": REPO_ROOT, **(env or {})}, check=True,
+    )
+    with open(output) as f:
+        return json.load(f)
+
+
+def micro_benchmarks(args):
+    """In-process timings against the catalogue in the current directory (run as a subcommand)."""
+    from src.lib.cache import CacheEventHandler
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    handler = CacheEventHandler(start_ingestion=False)
+    results = {"load_s": round(time.perf_counter() - started, 4)}
+
+    rows = handler.get_formatted_content()
+    names = sorted({row[0] for row in rows})
+    filenames = [record["filename"] for record in handler.index.records()]
+
+    def timed(func, inputs):
+        latencies = []
+        for value in inputs:
+            started = time.perf_counter()
+            func(value)
+            latencies.append(time.perf_counter() - started)
+        return summarize(latencies)
+
+    sample = [rng.choice(names) for _ in range(args.samples)]
+    results["get_package_first"] = timed(handler.get_package, list(dict.fromkeys(sample)))
+    results["get_package"] = timed(handler.get_package, sample)
+    results["resolve_file"] = timed(handler.resolve_file, [rng.choice(filenames) for _ in range(args.samples)])
+    results["describe_100"] = timed(handler.describe, [rng.sample(rows, min(100, len(rows))) for _ in range(50)])
+
+    # The full listing is cached until the index changes; drop the cache to time a rebuild.
+    def rebuild_listing(_):
+        handler.index._formatted = None
+        handler.get_formatted_content()
+    results["listing_rebuild"] = timed(rebuild_listing, range(20))
+
+    config = handler.config
+    items = [f"/benchmark/bench-fake{i:06d}_1.0_amd64.deb" for i in range(args.samples)]
+    record = {"filename": "bench-fake_1.0_amd64.deb", "sha256": "0" * 64, "size": 1}
+    results["add_to_cache"] = timed(lambda item: config.add_to_cache(item, record), items)
+    started = time.perf_counter()
+    config.flush_cache()
+    results["flush_after_adds_ms"] = round((time.perf_counter() - started) * 1000, 4)
+    results["remove_from_cache"] = timed(config.remove_from_cache, items)
+    config.flush_cache()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def install_benchmark(args):
+    """Resolve, plan and download packages from several servers (run as a subcommand).
+
+    Mirrors ``install_packages`` up to ``dpkg -i``, which needs root and
+    would install the synthetic packages for real.
+    """
+    from src.client.downloader import download_package
+    from src.client.package_manager import BULK_DOWNLOAD_WORKERS, plan_install
+    from src.client.peers import get_peer_stats
+
+    servers = [{"ip": args.host, "port": port, "properties": {}} for port in args.ports]
+    runs = []
+    for run in range(args.runs):
+        dest = os.path.join(os.getcwd(), f"install-{run}")
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+
+        started = time.perf_counter()
+        entries, plan = plan_install(args.packages, servers)
+        planned = time.perf_counter()
+
+        def fetch(entry):
+            name, server, details, sources = entry
+            filename = f"{name}_{details['version']}_{details['architecture']}.deb"
+            others = get_peer_stats().rank([s for s in sources if s != server], details.get('size'))
+            download_package([server] + others, filename, os.path.join(dest, filename),
+                             sha256=details.get('sha256'), size=details.get('size'))
+            return details.get('size') or 0
+
+        with ThreadPoolExecutor(max_workers=BULK_DOWNLOAD_WORKERS) as pool:
+            downloaded = sum(pool.map(fetch, entries))
+        finished = time.perf_counter()
+        runs.append({
+            "plan_s": round(planned - started, 4),
+            "download_s": round(finished - planned, 4),
+            "total_s": round(finished - started, 4),
+            "packages": len(entries),
+            "unresolved": len(plan.unresolved),
+            "bytes": downloaded,
+        })
+
+    totals = sorted(run["total_s"] for run in runs)
+    with open(args.output, "w") as f:
+        json.dump({"median_total_s": statistics.median(totals), "runs": runs}, f, indent=2)
+
+
+def benchmark_size(size, args):
+    print(f"== {size} packages ==")
+    result = {}
+    cache_dir = os.path.join(args.workdir, "caches", str(size))
+    large_dir = os.path.join(args.workdir, "caches", "large")
+    run_dir = os.path.join(args.workdir, "runs", str(size))
+
+    started = time.perf_counter()
+    paths = generate_cache(cache_dir, size, args.seed, args.payload_size)
+    large_path = generate_large(large_dir, args.large_size, args.seed)
+    result["generate_s"] = round(time.perf_counter() - started, 4)
+    result["files"] = len(paths)
+    filenames = [os.path.basename(path) for path in paths]
+    names = sorted({package_name(i) for i in range(size)})
+    expected = len(paths) + 1
+
+    server = BenchServer(
+        os.path.join(run_dir, "single"), args.port,
+        [cache_dir + os.sep, large_dir + os.sep], cache_store=args.store,
+    )
+    server.reset()
+    try:
+        result["startup_cold"] = measure_startup(server, expected)
+        print(f"  cold start: listening after {result['startup_cold']['bound_s']}s, "
+              f"answering after {result['startup_cold']['answer_s']}s, "
+              f"ingested after {result['startup_cold']['ingested_s']}s")
+        if "http" in args.stages:
+            result["http"] = http_benchmarks(server, names, filenames, os.path.basename(large_path), args)
+        server.stop()
+        result["startup_warm"] = measure_startup(server, expected)
+        print(f"  warm start: listening after {result['startup_warm']['bound_s']}s, "
+              f"answering after {result['startup_warm']['answer_s']}s, "
+              f"ingested after {result['startup_warm']['ingested_s']}s")
+    finally:
+        server.stop()
+
+    if "micro" in args.stages:
+        result["micro"] = run_subcommand("micro", server.directory, ["--samples", str(args.samples)])
+        print(f"  get_package p50 {result['micro']['get_package']['p50_ms']} ms, "
+              f"add_to_cache p50 {result['micro']['add_to_cache']['p50_ms']} ms")
+
+    if "install" in args.stages:
+        result["install"] = install_across_servers(size, paths, run_dir, args)
+        print(f"  install: median {result['install']['median_total_s']}s "
+              f"for {result['install']['runs'][0]['packages']} packages")
+    return result
+
+
+def install_across_servers(size, paths, run_dir, args):
+    """Spread the cache over several servers, two copies of each file, and time client installs."""
+    host = lan_address()
+    ports = [args.port + 1 + i for i in range(args.servers)]
+    servers = []
+    for i, port in enumerate(ports):
+        directory = os.path.join(run_dir, f"peer-{i}")
+        server = BenchServer(
+            directory, port, [os.path.join(directory, "cache") + os.sep], host=host,
+            cache_store=args.store, federation=True, federation_mdns=False, federation_interval=1,
+            peers=[f"{host}:{other}" for other in ports if other != port],
+        )
+        server.reset()
+        os.makedirs(os.path.join(directory, "cache"))
+        servers.append(server)
+
+    for n, path in enumerate(paths):
+        for copy in range(min(2, len(servers))):
+            server = servers[(n + copy) % len(servers)]
+            os.link(path, os.path.join(server.directory, "cache", os.path.basename(path)))
+
+    try:
+        for server in servers:
+            server.start()
+        for server in servers:
+            expected = len(os.listdir(os.path.join(server.directory, "cache")))
+            server.wait(ingested(expected))
+        # Let every server mirror the others' complete catalogues before the client asks.
+        counts = {f"{server.host}:{server.port}": server.info()["package_count"] for server in servers}
+        for server in servers:
+            mirrored = {key: count for key, count in counts.items() if key != f"{server.host}:{server.port}"}
+            server.wait(lambda info: {
+                key: peer["packages"] for key, peer in (info.get("federation") or {}).items()
+            } == mirrored)
+
+        targets = [package_name(i) for i in range(size - 1, max(size - 1 - args.install_packages, -1), -1)]
+        return run_subcommand("install", run_dir, [
+            "--host", host, "--ports", *map(str, ports), "--packages", *targets, "--runs", str(args.install_runs),
+        ], env={"XDG_CACHE_HOME": os.path.join(run_dir, "client-cache")})
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key != "func"},
+        },
+        "sizes": {},
+    }
+    for size in args.sizes:
+        results["sizes"][str(size)] = benchmark_size(size, args)
+        # Written after every size so an interrupted 100k run keeps the smaller results.
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def flatten(data, prefix=""):
+    """Numeric leaves of nested dicts as {"a.b.c": value}."""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)["sizes"])
+    with open(args.current) as f:
+        current = flatten(json.load(f)["sizes"])
+    from tabulate import tabulate
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[key], current[key]
+        change = f"{100.0 * (new - old) / old:+.1f}%" if old else ""
+        rows.append((key, old, new, change))
+    print(tabulate(rows, headers=["Metric", "Baseline", "Current", "Change"], tablefmt="simple"))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="LocalSync benchmarks")
+    sub = parser.add_subparsers(dest="command")
+
+    compare_parser = sub.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.set_defaults(func=compare)
+
+    micro_parser = sub.add_parser("micro", help=argparse.SUPPRESS)
+    micro_parser.add_argument("--output", required=True)
+    micro_parser.add_argument("--samples", type=int, default=2000)
+    micro_parser.add_argument("--seed", type=int, default=0)
+    micro_parser.set_defaults(func=micro_benchmarks)
+
+    install_parser = sub.add_parser("install", help=argparse.SUPPRESS)
+    install_parser.add_argument("--output", required=True)
+    install_parser.add_argument("--host", default="127.0.0.1")
+    install_parser.add_argument("--ports", type=int, nargs="+", required=True)
+    install_parser.add_argument("--packages", nargs="+", required=True)
+    install_parser.add_argument("--runs", type=int, default=3)
+    install_parser.set_defaults(func=install_benchmark)
+
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[1000, 10000, 100000], help="Comma-separated cache sizes (default: 1000,10000,100000)")
+    parser.add_argument("--stages", type=lambda value: value.split(","), default=["http", "micro", "install"],
+                        help="Comma-separated stages to run besides startup (default: http,micro,install)")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="Where caches and server data are kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--payload-size", type=int, default=2048, help="Payload bytes per synthetic package")
+    parser.add_argument("--large-size", type=int, default=32 * 1024 * 1024, help="Size of the throughput test package")
+    parser.add_argument("--store", choices=["log", "sqlite"], default="log", help="Catalogue store backend")
+    parser.add_argument("--port", type=int, default=54100, help="First of the ports the servers listen on")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=2000, help="Calls per in-process measurement")
+    parser.add_argument("--servers", type=int, default=3, help="Servers for the install benchmark")
+    parser.add_argument("--install-packages", type=int, default=5, help="Packages installed, with their dependencies")
+    parser.add_argument("--install-runs", type=int, default=3)
+    parser.set_defaults(func=run)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
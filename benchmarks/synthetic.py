@@ -0,0 +1,104 @@
+"""Synthetic apt caches for benchmarks.
+
+Packages are small but valid .deb files (an ar archive holding
+``debian-binary``, ``control.tar.gz`` and ``data.tar.gz``), so the server
+reads their control fields like real ones. Everything is derived from a
+seed, so the same arguments always produce byte-identical caches.
+"""
+import gzip
+import io
+import os
+import random
+import tarfile
+
+AR_MAGIC = b"!<arch>\n"
+
+
+def _ar_member(name, data):
+    header = f"{name:<16}{0:<12}{0:<6}{0:<6}{100644:<8}{len(data):<10}`\n".encode("ascii")
+    return header + data + (b"\n" if len(data) % 2 else b"")
+
+
+def _tar_gz(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return gzip.compress(buffer.getvalue(), compresslevel=1, mtime=0)
+
+
+def build_deb(name, version, depends=(), payload=b"", architecture="amd64"):
+    """Return the bytes of a minimal .deb package."""
+    control = (
+        f"Package: {name}\n"
+        f"Version: {version}\n"
+        f"Architecture: {architecture}\n"
+        "Maintainer: LocalSync Benchmarks <bench@localhost>\n"
+        f"Description: synthetic package {name}\n"
+    )
+    if depends:
+        control += f"Depends: {', '.join(depends)}\n"
+    return b"".join([
+        AR_MAGIC,
+        _ar_member("debian-binary", b"2.0\n"),
+        _ar_member("control.tar.gz", _tar_gz([("./control", control.encode())])),
+        _ar_member("data.tar.gz", _tar_gz([(f"./usr/share/{name}/payload", payload)])),
+    ])
+
+
+def package_name(i):
+    return f"bench-pkg{i:06d}"
+
+
+def plan_packages(count, seed=0, max_depends=3, old_versions=0.1):
+    """Describe ``count`` packages as (name, version, depends) tuples.
+
+    Package ``i`` depends on up to ``max_depends`` packages with lower
+    numbers, so every dependency graph is acyclic, and about
+    ``old_versions`` of the packages also have an older version cached.
+    """
+    rng = random.Random(seed)
+    packages = []
+    for i in range(count):
+        depends = sorted({package_name(rng.randrange(i)) for _ in range(rng.randint(0, max_depends))}) if i else []
+        packages.append((package_name(i), "1.1", depends))
+        if rng.random() < old_versions:
+            packages.append((package_name(i), "1.0", depends))
+    return packages
+
+
+def generate_cache(directory, count, seed=0, payload_size=2048):
+    """Write a synthetic cache of ``count`` packages. Returns the list of paths written.
+
+    An existing cache built with the same arguments is reused as is.
+    """
+    os.makedirs(directory, exist_ok=True)
+    marker = os.path.join(directory, ".generated")
+    stamp = f"{count} {seed} {payload_size}\n"
+    packages = plan_packages(count, seed)
+    paths = [os.path.join(directory, f"{name}_{version}_amd64.deb") for name, version, _ in packages]
+    if os.path.exists(marker) and open(marker).read() == stamp:
+        return paths
+
+    rng = random.Random(seed)
+    # One shared block keeps generation fast; the control file makes every package unique.
+    block = rng.randbytes(payload_size)
+    for path, (name, version, depends) in zip(paths, packages):
+        with open(path, "wb") as f:
+            f.write(build_deb(name, version, depends, block))
+    with open(marker, "w") as f:
+        f.write(stamp)
+    return paths
+
+
+def generate_large(directory, size, seed=0):
+    """Write one package with an incompressible payload of ``size`` bytes, for throughput tests."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "bench-large_1.0_amd64.deb")
+    if not os.path.exists(path) or os.path.getsize(path) < size:
+        with open(path, "wb") as f:
+            f.write(build_deb("bench-large", "1.0", payload=random.Random(seed).randbytes(size)))
+    return path
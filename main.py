@@ -1,30 +1,106 @@
 import sys
-from src.lib.cache import CacheEventHandler
-from watchdog.observers import Observer
-
-from src.server.server import app
-from src.client.client import client
-import uvicorn
+import threading
+import time
 
 from tabulate import tabulate
 
-def main(*args):
-    if "serve" in args:
-        event_handler = CacheEventHandler()
-        observer = Observer()
-        observer.schedule(event_handler, path="/var/cache/apt/archives/", recursive=False)
-        observer.start()
 
-        formatted_content = event_handler.get_formatted_content()
+SERVER_HOST = "0.0.0.0"
+
+
+def print_catalogue(event_handler):
+    formatted_content = event_handler.get_formatted_content()
+    if len(formatted_content) <= 50:
         headers = ["Package Name", "Version", "Architecture"]
         print(tabulate(formatted_content, headers=headers, tablefmt="grid"))
+    else:
+        print(f"Serving {len(formatted_content)} cached packages")
+
+
+def report_ready(server, started):
+    """Print the time from ``started`` until the uvicorn ``server`` is accepting connections."""
+    def wait():
+        # uvicorn sets ``started`` once the listening socket is bound, after lifespan startup.
+        while not server.started and not server.should_exit:
+            time.sleep(0.01)
+        if server.started:
+            print(f"Server ready after {time.monotonic() - started:.2f}s")
+
+    threading.Thread(target=wait, name="ready", daemon=True).start()
+
+
+def serve():
+    """Run the server with a single shared cache engine for the API, watcher and mDNS."""
+    started = time.monotonic()
+
+    # Server dependencies are imported here so client commands stay light.
+    import uvicorn
+    from watchdog.observers import Observer
+
+    from src.lib.data import Config
+
+    workers = Config().get("workers") or 1
+    if workers > 1:
+        serve_workers(workers)
+        return
+
+    from src.server.server import get_app
 
-        uvicorn.run(app, host="0.0.0.0", port=53456)
+    app = get_app()
 
-        observer.stop()
-        observer.join()
-    
+    event_handler = app.state.cache_event_handler
+    observer = Observer()
+    event_handler.watch(observer)
+    observer.start()
+
+    print_catalogue(event_handler)
+
+    # h11 keeps the absolute-form target of proxy requests; httptools reduces it to the path.
+    http = "h11" if event_handler.config.get("proxy") else "auto"
+    server = uvicorn.Server(uvicorn.Config(app, host=SERVER_HOST, port=event_handler.config.get_port(), http=http))
+    report_ready(server, started)
+    server.run()
+
+    observer.stop()
+    observer.join()
+
+
+def serve_workers(workers):
+    """Run several uvicorn workers; this process keeps ingestion, the watcher, eviction, federation and mDNS."""
+    import uvicorn
+    from watchdog.observers import Observer
+
+    from src.lib.cache import CacheEventHandler
+    from src.server.app_config import FEDERATION_FILE, start_background_services, start_federation
+    from src.server.mdns_service import mDNS_register, mDNS_unregister
+
+    event_handler = CacheEventHandler()
+    start_background_services(event_handler)
+    federation = None
+    if event_handler.config.get("federation") is not False:
+        federation = start_federation(event_handler.config, snapshot_path=FEDERATION_FILE)
+    observer = Observer()
+    event_handler.watch(observer)
+    observer.start()
+    mDNS_register(event_handler)
+
+    print_catalogue(event_handler)
+
+    uvicorn.run("src.server.worker:app", host=SERVER_HOST, port=event_handler.config.get_port(), workers=workers)
+
+    mDNS_unregister()
+    if federation is not None:
+        federation.stop()
+    observer.stop()
+    observer.join()
+
+
+def main(*args):
+    args = args or tuple(sys.argv[1:])
+    if "serve" in args:
+        serve()
     else:
+        from src.client.client import client
         client(*args)
 
 if __name__ == "__main__":
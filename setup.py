@@ -16,6 +16,14 @@ dependencies = [
     "zeroconf>=0.148.0",
 ]
 
+# Optional extras: msgpack for a compact wire format, zstandard for zstd compression
+extras = {
+    "fast": [
+        "msgpack>=1.0.0",
+        "zstandard>=0.22.0",
+    ],
+}
+
 setup(
     name="localsync",
     version="0.1.0",
@@ -45,6 +53,7 @@ setup(
     packages=find_packages(),
     python_requires=">=3.8",
     install_requires=dependencies,
+    extras_require=extras,
     entry_points={
         "console_scripts": [
             "localsync=main:main",
@@ -0,0 +1,104 @@
+"""Local mirrors of each server's package catalogue for LocalSync client."""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.client.query import MAX_QUERY_WORKERS, query_server
+from src.lib.data import CLIENT_CACHE_DIR
+
+CATALOGUE_DIR = os.path.join(CLIENT_CACHE_DIR, "catalogues")
+
+
+def _mirror_path(server):
+    return os.path.join(CATALOGUE_DIR, f"{server['ip']}_{server['port']}.json")
+
+
+def load_mirror(server):
+    try:
+        with open(_mirror_path(server)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_mirror(server, mirror):
+    try:
+        os.makedirs(CATALOGUE_DIR, exist_ok=True)
+        tmp_file = f"{_mirror_path(server)}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(mirror, f, separators=(",", ":"))
+        os.replace(tmp_file, _mirror_path(server))
+    except OSError as e:
+        print(f"Could not save catalogue mirror for {server['ip']}:{server['port']}: {e}")
+
+
+def _advertised_generation(server):
+    """Return the (epoch, generation) a server announced over mDNS or /api/server-info, if any."""
+    properties = server.get("properties") or {}
+    if properties.get("epoch") is None or properties.get("generation") is None:
+        return None
+    return properties["epoch"], int(properties["generation"])
+
+
+def _row_key(row):
+    return tuple(row[:3])
+
+
+def apply_delta(mirror, delta):
+    """Apply a /api/cache-list?since= response to a mirror and return the new mirror.
+
+    Rows are keyed by (name, version, architecture): an added row replaces
+    the one the mirror holds for the same key.
+    """
+    if delta["full"]:
+        packages = delta["packages"]
+    else:
+        changed = {_row_key(row) for row in delta["removed"]}
+        changed.update(_row_key(row) for row in delta["added"])
+        packages = [row for row in mirror["packages"] if _row_key(row) not in changed]
+        packages.extend(delta["added"])
+    return {"epoch": delta["epoch"], "generation": delta["generation"], "packages": packages}
+
+
+def fetch_catalogue(server):
+    """Return a server's package rows, syncing the local mirror with as little traffic as possible.
+
+    If the server advertised the generation the mirror already holds, no
+    request is made at all; otherwise only the changes since the mirrored
+    generation are fetched.
+    """
+    mirror = load_mirror(server)
+    if mirror is not None and _advertised_generation(server) == (mirror["epoch"], mirror["generation"]):
+        return mirror["packages"]
+
+    if mirror is None:
+        path = "/api/cache-list?since=0"
+    else:
+        path = f"/api/cache-list?since={mirror['generation']}&epoch={mirror['epoch']}"
+    response = query_server(server, path)
+
+    # Servers without generation support ignore ?since= and send the plain list.
+    if isinstance(response, list):
+        return response
+
+    mirror = apply_delta(mirror, response)
+    save_mirror(server, mirror)
+    return mirror["packages"]
+
+
+def fetch_catalogues(servers):
+    """Fetch every server's catalogue concurrently. Returns a list of (server, rows)."""
+    if not servers:
+        return []
+
+    def fetch(server):
+        try:
+            return server, fetch_catalogue(server)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Failed to connect to server {server['ip']}:{server['port']}. Error: {e}")
+            return server, None
+
+    with ThreadPoolExecutor(max_workers=min(MAX_QUERY_WORKERS, len(servers))) as pool:
+        return [(server, rows) for server, rows in pool.map(fetch, servers) if rows is not None]
@@ -8,4 +8,8 @@ def show_help():
     print("  h       Show this help message and exit")
     print("  serve   Start the client application")
     print("  list    List all available packages in the network")
-    print("  install <package_name>  Install a package from available servers")
\ No newline at end of file
+    print("  install <package_name>  Install a package from available servers")
+    print("  install <pkg> <pkg> ... Install several packages in one pass (newest compatible versions)")
+    print("  install --from-file <manifest>  Install every package listed in a manifest file")
+    print("  install --yes ...       Do not ask: pick the newest version from the fastest server")
+    print("  --quiet-period <secs>   End mDNS discovery this long after the last new server (default 0.3)")
\ No newline at end of file
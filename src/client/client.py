@@ -1,7 +1,7 @@
 """Main entry point for LocalSync client application."""
 from src.client.cli import show_help
 from src.client.network import discover_servers
-from src.client.package_manager import install_package, list_packages
+from src.client.package_manager import install_package, install_packages, list_packages, read_package_manifest
 
 
 def client(*args):
@@ -10,15 +10,47 @@ def client(*args):
         show_help()
         return
 
+    args = list(args)
+    quiet_period = None
+    if "--quiet-period" in args:
+        position = args.index("--quiet-period")
+        try:
+            quiet_period = float(args[position + 1])
+        except (IndexError, ValueError):
+            print("Error: --quiet-period needs a number of seconds.")
+            return
+        del args[position:position + 2]
+
     if "list" in args:
-        servers = discover_servers()
+        servers = discover_servers(quiet_period=quiet_period)
         list_packages(servers)
     
     if "install" in args:
-        package_index = args.index("install") + 1
-        if package_index < len(args):
-            package_name = args[package_index]
-            install_package(package_name)
-        else:
+        install_args = list(args[args.index("install") + 1:])
+        package_names = []
+        from_file = False
+        assume_yes = False
+        while install_args:
+            arg = install_args.pop(0)
+            if arg == "--from-file":
+                if not install_args:
+                    print("Error: --from-file needs a manifest path.")
+                    return
+                manifest = install_args.pop(0)
+                try:
+                    package_names.extend(read_package_manifest(manifest))
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Error: cannot read manifest {manifest}: {getattr(e, 'strerror', None) or e}")
+                    return
+                from_file = True
+            elif arg in ("--yes", "-y"):
+                assume_yes = True
+            else:
+                package_names.append(arg)
+
+        if not package_names:
             print("Error: No package name provided for installation.")
-    
\ No newline at end of file
+        elif len(package_names) == 1 and not from_file:
+            install_package(package_names[0], assume_yes, quiet_period)
+        else:
+            install_packages(package_names, assume_yes, quiet_period)
@@ -0,0 +1,136 @@
+"""Chunk-level delta downloads for LocalSync client.
+
+When an older version of a package is already in apt's archive directory,
+the client fetches the new version's chunk manifest, copies every chunk it
+already has from the old file and downloads only the byte ranges it lacks.
+The caller checks the rebuilt file against its SHA256 as for any download.
+"""
+import glob
+import os
+import time
+from urllib.parse import unquote
+
+import requests
+
+from src.client.peers import get_peer_stats
+from src.client.query import query_server
+from src.lib.chunks import CHUNKER, READ_SIZE, chunk_digest, iter_chunks
+from src.lib.data import APT_ARCHIVES_DIR
+from src.lib.debversion import version_key
+from src.lib.index import parse_deb_filename
+
+# Directories searched for an older version of a package.
+BASIS_DIRS = [APT_ARCHIVES_DIR, "/tmp/"]
+# Below this share of reusable bytes a plain download is cheaper.
+MIN_REUSE = 0.2
+# Missing ranges closer than this are fetched as one, re-downloading the bytes between them.
+MERGE_GAP = 16 * 1024
+TIMEOUT = (3, 30)
+
+
+def find_basis(filename, dirs=BASIS_DIRS):
+    """Return the newest other local version of the same package and architecture, or None."""
+    key = parse_deb_filename(filename)
+    if key is None:
+        return None
+    name, _, architecture = key
+    candidates = []
+    for directory in dirs:
+        for path in glob.glob(os.path.join(directory, f"{name}_*_{architecture}.deb")):
+            other = parse_deb_filename(path)
+            if other and other[0] == name and os.path.basename(path) != filename:
+                candidates.append((version_key(unquote(other[1])), path))
+    return max(candidates)[1] if candidates else None
+
+
+def fetch_manifest(servers, filename):
+    """Return (server, manifest) from the first server that has one, or None."""
+    for server in servers:
+        try:
+            manifest = query_server(server, f"/api/manifest/{filename}")
+        except (requests.RequestException, ValueError):
+            continue
+        if manifest.get("chunker") == CHUNKER:
+            return server, manifest
+    return None
+
+
+def plan_rebuild(manifest, basis):
+    """Split the new file into chunks copied from ``basis`` and ranges to download.
+
+    Returns (copies, ranges, reused bytes), where copies are
+    (source offset, target offset, length) and ranges are (start, end)
+    inclusive byte ranges of the new file.
+    """
+    have = {}
+    offset = 0
+    with open(basis, "rb") as f:
+        for chunk in iter_chunks(f):
+            have.setdefault(chunk_digest(chunk), offset)
+            offset += len(chunk)
+
+    copies = []
+    ranges = []
+    reused = 0
+    offset = 0
+    for digest, length in manifest["chunks"]:
+        source = have.get(digest)
+        if source is not None:
+            copies.append((source, offset, length))
+            reused += length
+        elif ranges and offset - ranges[-1][1] - 1 <= MERGE_GAP:
+            ranges[-1] = (ranges[-1][0], offset + length - 1)
+        else:
+            ranges.append((offset, offset + length - 1))
+        offset += length
+    return copies, ranges, reused
+
+
+def delta_download(servers, filename, part_path, size, basis=None):
+    """Rebuild ``filename`` at ``part_path`` from an older local version.
+
+    Returns False, leaving no file at ``part_path``, when there is no older
+    version, no server has a manifest, too little would be reused or a
+    range cannot be fetched.
+    """
+    basis = basis or find_basis(filename)
+    if basis is None:
+        return False
+    found = fetch_manifest(servers, filename)
+    if found is None or found[1]["size"] != size:
+        return False
+    server, manifest = found
+
+    copies, ranges, reused = plan_rebuild(manifest, basis)
+    if reused < MIN_REUSE * size:
+        return False
+
+    print(f"Rebuilding {filename} from {os.path.basename(basis)}: "
+          f"reusing {reused} of {size} bytes, fetching {len(ranges)} ranges")
+    url = f"http://{server['ip']}:{server['port']}/pool/{filename}"
+    with open(basis, "rb") as src, open(part_path, "wb") as f:
+        f.truncate(size)
+        for source, target, length in copies:
+            os.pwrite(f.fileno(), os.pread(src.fileno(), length, source), target)
+
+        with requests.Session() as session:
+            for start, end in ranges:
+                if not _fetch_range(session, server, url, f, start, end):
+                    print(f"Server {server['ip']}:{server['port']} did not return bytes {start}-{end}")
+                    f.close()
+                    os.unlink(part_path)
+                    return False
+    return True
+
+
+def _fetch_range(session, server, url, f, start, end):
+    started = time.monotonic()
+    written = 0
+    with session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code != 206:
+            return False
+        for data in response.iter_content(READ_SIZE):
+            os.pwrite(f.fileno(), data, start + written)
+            written += len(data)
+    get_peer_stats().record_transfer(server, written, time.monotonic() - started)
+    return written == end - start + 1
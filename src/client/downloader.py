@@ -0,0 +1,179 @@
+"""Streaming, multi-source package downloads for LocalSync client."""
+import hashlib
+import os
+import queue
+import threading
+import time
+
+import requests
+
+from src.client.delta import delta_download
+from src.client.peers import get_peer_stats
+from src.lib.chunks import MIN_DELTA_SIZE
+
+CHUNK_SIZE = 1024 * 1024
+MIN_PART_SIZE = 4 * 1024 * 1024
+MAX_PART_ATTEMPTS = 3
+TIMEOUT = (3, 30)
+
+
+class DownloadError(Exception):
+    """Raised when a package cannot be downloaded or fails verification."""
+
+
+def pool_url(server, filename):
+    return f"http://{server['ip']}:{server['port']}/pool/{filename}"
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _stream_to(response, f, offset=None):
+    """Write a streamed response body to ``f``, at ``offset`` if given."""
+    written = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if offset is None:
+            f.write(chunk)
+        else:
+            os.pwrite(f.fileno(), chunk, offset + written)
+        written += len(chunk)
+    return written
+
+
+def _open_single_source(server, filename, part_path, sha256, size):
+    if sha256 is None:
+        # Servers that predate /pool publish no digest; use the original POST endpoint.
+        return requests.post(
+            f"http://{server['ip']}:{server['port']}/api/download",
+            json={"filename": filename}, stream=True, timeout=TIMEOUT,
+        )
+
+    headers = {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset and (size is None or offset < size):
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = f'"{sha256}"'
+    return requests.get(pool_url(server, filename), headers=headers, stream=True, timeout=TIMEOUT)
+
+
+def _single_source(server, filename, part_path, sha256, size):
+    """Stream the whole file from one server, resuming a previous partial download."""
+    started = time.monotonic()
+    with _open_single_source(server, filename, part_path, sha256, size) as response:
+        if response.status_code == 206:
+            mode = "ab"
+        elif response.status_code == 200:
+            mode = "wb"
+        else:
+            raise DownloadError(f"HTTP {response.status_code} from {server['ip']}:{server['port']}")
+        with open(part_path, mode) as f:
+            written = _stream_to(response, f)
+    get_peer_stats().record_transfer(server, written, time.monotonic() - started)
+
+
+def _multi_source(servers, filename, part_path, size):
+    """Fetch byte ranges of the file from several servers at once."""
+    part_size = max(MIN_PART_SIZE, -(-size // (len(servers) * 4)))
+    parts = queue.Queue()
+    for start in range(0, size, part_size):
+        parts.put((start, min(start + part_size, size) - 1, 0))
+
+    errors = []
+    live = list(servers)
+    with open(part_path, "wb") as f:
+        f.truncate(size)
+
+        def worker(server):
+            with requests.Session() as session:
+                while True:
+                    try:
+                        start, end, attempts = parts.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        started = time.monotonic()
+                        with session.get(
+                            pool_url(server, filename),
+                            headers={"Range": f"bytes={start}-{end}"},
+                            stream=True,
+                            timeout=TIMEOUT,
+                        ) as response:
+                            if response.status_code != 206:
+                                raise DownloadError(f"HTTP {response.status_code}")
+                            if _stream_to(response, f, start) != end - start + 1:
+                                raise DownloadError("short read")
+                        get_peer_stats().record_transfer(server, end - start + 1, time.monotonic() - started)
+                    except (requests.RequestException, DownloadError) as e:
+                        # Hand the range to another server and stop using this one.
+                        if attempts + 1 < MAX_PART_ATTEMPTS:
+                            parts.put((start, end, attempts + 1))
+                        else:
+                            errors.append(f"bytes {start}-{end}: {e}")
+                        print(f"Server {server['ip']}:{server['port']} failed on bytes {start}-{end}: {e}")
+                        live.remove(server)
+                        return
+
+        # A failed range may be requeued after the other workers found the queue empty,
+        # so keep going in rounds while ranges are left and some server still works.
+        while not parts.empty() and live:
+            threads = [threading.Thread(target=worker, args=(server,), daemon=True) for server in list(live)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    if errors or not parts.empty():
+        raise DownloadError("Could not fetch every part: " + "; ".join(errors or ["no servers left"]))
+
+
+def _fetch_whole(servers, filename, part_path, sha256, size):
+    if len(servers) > 1 and size and size >= 2 * MIN_PART_SIZE:
+        print(f"Fetching {filename} in parallel from {len(servers)} servers...")
+        _multi_source(servers, filename, part_path, size)
+    else:
+        _single_source(servers[0], filename, part_path, sha256, size)
+
+
+def download_package(servers, filename, dest_path, sha256=None, size=None):
+    """Download ``filename`` to ``dest_path`` from one or more servers holding it.
+
+    When an older version is cached locally, only the chunks that changed
+    are fetched. Otherwise, with several servers and a known size the file
+    is split into byte ranges fetched in parallel, or else streamed from
+    the first server, resuming any earlier partial download. The result is
+    checked against ``sha256`` before it is moved into place.
+    """
+    part_path = f"{dest_path}.part"
+
+    rebuilt = False
+    if sha256 and size and size >= MIN_DELTA_SIZE:
+        try:
+            rebuilt = delta_download(servers, filename, part_path, size)
+        except (OSError, requests.RequestException) as e:
+            print(f"Delta download of {filename} failed: {e}")
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+    if not rebuilt:
+        _fetch_whole(servers, filename, part_path, sha256, size)
+
+    if sha256:
+        actual = hash_file(part_path)
+        if actual != sha256 and rebuilt:
+            print(f"Rebuilt {filename} does not match its checksum; downloading it whole.")
+            os.unlink(part_path)
+            _fetch_whole(servers, filename, part_path, sha256, size)
+            actual = hash_file(part_path)
+        if actual != sha256:
+            os.unlink(part_path)
+            raise DownloadError(f"Checksum mismatch for {filename}: expected {sha256}, got {actual}")
+    else:
+        print(f"Warning: server did not publish a checksum for {filename}; skipping verification.")
+
+    os.replace(part_path, dest_path)
+    get_peer_stats().save()
+    return dest_path
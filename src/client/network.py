@@ -1,8 +1,100 @@
 """Network-related functions for LocalSync client."""
+import json
+import os
+import threading
+import time
 
+from src.lib.data import CLIENT_CACHE_DIR
 
-def discover_servers():
-    """Discover available LocalSync servers on the network."""
+SERVER_CACHE_FILE = os.path.join(CLIENT_CACHE_DIR, "servers.json")
+# Cached servers older than this are ignored and rediscovered over mDNS.
+SERVER_CACHE_TTL = 600
+# Cached servers must answer within this (connect, read) timeout to be reused.
+SERVER_PROBE_TIMEOUT = (0.5, 1)
+
+
+def load_server_cache():
+    """Return servers seen recently, or an empty list if the cache is missing or stale."""
+    try:
+        with open(SERVER_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if time.time() - cache.get("saved_at", 0) > SERVER_CACHE_TTL:
+        return []
+    return cache.get("servers", [])
+
+
+def save_server_cache(servers):
+    """Remember discovered servers so the next run can skip mDNS."""
+    try:
+        os.makedirs(CLIENT_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{SERVER_CACHE_FILE}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"saved_at": time.time(), "servers": servers}, f)
+        os.replace(tmp_file, SERVER_CACHE_FILE)
+    except OSError as e:
+        print(f"Could not save server cache: {e}")
+
+
+def _server_key(server):
+    return f"{server.get('ip')}:{server.get('port')}"
+
+
+def refresh_server_cache(known, quiet_period=None):
+    """Browse mDNS and rewrite the server cache with what answers plus ``known``."""
     from src.client.service_discovery import run_client_mdns
-    clients = run_client_mdns()
-    return clients if clients else []
\ No newline at end of file
+    merged = {_server_key(server): server for server in known}
+    # Fresh announcements replace what the cache said about the same server.
+    found = run_client_mdns(quiet_period=quiet_period, verbose=False)
+    merged.update((_server_key(server), server) for server in found)
+    save_server_cache(list(merged.values()))
+
+
+def discover_servers(use_cache=True, quiet_period=None):
+    """Discover available LocalSync servers on the network.
+
+    Recently seen servers are probed concurrently first; if any of them
+    still answers, those are used straight away while an mDNS browse in
+    the background adds servers that came up since and refreshes the
+    cache for the next run. Otherwise fall back to a foreground browse,
+    which ends ``quiet_period`` seconds after the last new answer.
+    """
+    from src.client.query import query_servers
+
+    if use_cache:
+        cached = load_server_cache()
+        if cached:
+            responses = query_servers(
+                cached, "/api/server-info", timeout=SERVER_PROBE_TIMEOUT, report_errors=False
+            )
+            alive = []
+            for server, info in responses:
+                # Refresh what mDNS told us last time so catalogue mirrors can be validated.
+                properties = server.setdefault("properties", {})
+                for key in ("package_count", "epoch", "generation"):
+                    if info.get(key) is not None:
+                        properties[key] = str(info[key])
+                alive.append(server)
+            if alive:
+                print(f"Using {len(alive)} recently seen server(s).")
+                # A daemon thread, so a command that finishes first is not held up; the cache
+                # is then refreshed by a later run.
+                threading.Thread(
+                    target=refresh_server_cache, args=(alive, quiet_period), name="mdns-refresh", daemon=True
+                ).start()
+                return alive
+
+    from src.client.service_discovery import run_client_mdns
+    clients = run_client_mdns(quiet_period=quiet_period)
+    if clients:
+        save_server_cache(clients)
+    return clients if clients else []
+
+
+def servers_with_packages(servers):
+    """Drop servers whose last announcement says they have nothing cached."""
+    return [
+        server for server in servers
+        if (server.get("properties") or {}).get("package_count") != "0"
+    ]
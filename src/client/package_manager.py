@@ -1,10 +1,23 @@
 """Package management functions for LocalSync client."""
 import platform
-from turtle import down
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from tabulate import tabulate
 
-from src.client.network import discover_servers
+from src.client.catalogue import fetch_catalogues
+from src.client.downloader import DownloadError, download_package
+from src.client.network import discover_servers, servers_with_packages
+from src.client.peers import get_peer_stats, peer_key
+from src.client.planner import InstallPlanner
+from src.client.query import query_network, query_servers
+from src.lib.debversion import version_key
+
+# Number of servers holding a package after which install stops waiting for the rest.
+INSTALL_FIRST_RESPONDERS = 3
+# Number of packages downloaded at the same time by a bulk install.
+BULK_DOWNLOAD_WORKERS = 4
 
 
 def is_architecture_compatible(system_arch, package_arch):
@@ -56,9 +69,7 @@ def list_packages(servers):
     
     packages = []
     
-    for server in servers:
-        available_packages = requests.get(f"http://{server['ip']}:{server['port']}/api/cache-list").json()
-        
+    for server, available_packages in fetch_catalogues(servers):
         for pkg in available_packages:
             packages.append({
                 "IP": server["ip"],
@@ -73,18 +84,66 @@ def list_packages(servers):
         print("No packages found on any server.")
 
 
-def fetch_package_details(package_name, servers):
-    """Fetch package details from all available servers."""
+def federated_holders(server, item, known):
+    """Servers holding one entry of a federated answer from ``server``."""
+    holders = [server] if item.get('local') else []
+    for key in item.get('peers') or []:
+        if key in known:
+            holders.append(known[key])
+        else:
+            ip, _, port = key.rpartition(":")
+            holders.append({"ip": ip, "port": int(port), "properties": {}})
+    return holders
+
+
+def federated_details(server, items, servers):
+    """Expand federated entries from ``server`` into (server, details) pairs, one per holder."""
+    known = {peer_key(s): s for s in servers}
+    pairs = []
+    for item in items:
+        details = {key: value for key, value in item.items() if key not in ('local', 'peers')}
+        pairs.extend((holder, details) for holder in federated_holders(server, item, known))
+    return pairs
+
+
+def covered_servers(server, data):
+    """Keys of the servers a federated answer speaks for; an older server speaks only for itself."""
+    return {peer_key(server), *data.get("federated_peers", ())}
+
+
+def fetch_package_details(package_name, servers, first=None):
+    """Fetch package details from available servers.
+
+    One server is asked first for a federated answer covering itself and
+    its peers; only servers outside that answer are queried directly.
+    With ``first`` set, return once that many servers are known to have
+    the package instead of waiting for every server.
+    """
     package_details = []
-    for server in servers:
-        try:
-            response = requests.get(f"http://{server['ip']}:{server['port']}/api/pkg/{package_name}")
-            if response.status_code == 200 and "error" not in response.json():
-                for item in response.json():
-                    package_details.append((server, item))
-        except requests.RequestException as e:
-            print(f"Failed to connect to server {server['ip']}:{server['port']}. Error: {e}")
-            continue
+    covered = set()
+    answer = query_network(servers, f"/api/pkg/{package_name}?federated=true")
+    if answer is not None:
+        server, data = answer
+        if isinstance(data, dict) and "federated_peers" in data:
+            package_details = federated_details(server, data["packages"], servers)
+        elif isinstance(data, list):
+            package_details = [(server, item) for item in data]
+        covered = covered_servers(server, data if isinstance(data, dict) else {})
+
+    remaining = [server for server in servers if peer_key(server) not in covered]
+    holders = {peer_key(server) for server, _ in package_details}
+    if not remaining or (first is not None and len(holders) >= first):
+        return package_details
+
+    responses = query_servers(
+        remaining,
+        f"/api/pkg/{package_name}",
+        accept=lambda data: bool(data) and "error" not in data,
+        first=None if first is None else first - len(holders),
+    )
+    for server, items in responses:
+        for item in items:
+            package_details.append((server, item))
     return package_details
 
 
@@ -132,60 +191,146 @@ def get_user_package_choice(filtered_details):
         return None
 
 
-def download_and_install_package(package_name, selected_server, selected_package):
-    """Download and install the selected package."""
-    print(f"Installing package {package_name} from {selected_server['ip']}:{selected_server['port']}...")
-    
-    # Construct filename and API endpoint
+def peer_preference(server, details):
+    """Rank equal candidates by how fast their peer is expected to deliver them."""
+    return -get_peer_stats().expected_time(server, details.get('size'))
+
+
+def select_best_package(filtered_details):
+    """Pick the newest compatible version, preferring the fastest peer among equal versions."""
+    return max(filtered_details, key=lambda entry: (version_key(entry[1]['version']), peer_preference(*entry)))
+
+
+def find_package_sources(package_details, selected_package):
+    """Return every server offering the same file (name, version, architecture and digest)."""
+    sources = []
+    for server, details in package_details:
+        if (details['version'] == selected_package['version']
+                and details['architecture'] == selected_package['architecture']
+                and details.get('sha256') == selected_package.get('sha256')
+                and server not in sources):
+            sources.append(server)
+    return sources
+
+
+def _download_selected(package_name, selected_server, selected_package, sources):
     filename = f"{package_name}_{selected_package['version']}_{selected_package['architecture']}.deb"
-    download_url = f"http://{selected_server['ip']}:{selected_server['port']}/api/download"
-    print(f"Downloading {filename} from {download_url}...")
-    
-    try:
-        # Use POST request with filename in body
-        response = requests.post(download_url, json={"filename": filename})
-        if response.status_code == 200:
-            deb_file_path = f"/tmp/{package_name}_{selected_package['version']}_{selected_package['architecture']}.deb"
-            with open(deb_file_path, 'wb') as deb_file:
-                deb_file.write(response.content)
-            print(f"Downloaded package to {deb_file_path}. Installing...")
-            
-            import os
-            result = os.system(f"sudo dpkg -i {deb_file_path}")
-            if result == 0:
-                print(f"Package {package_name} installed successfully.")
-                return True
-            else:
-                print(f"Failed to install package {package_name}.")
-                return False
-        else:
-            print(f"Failed to download package. HTTP status: {response.status_code}")
-            return False
-    except requests.RequestException as e:
-        print(f"Error downloading package: {e}")
-        return False
+    deb_file_path = f"/tmp/{filename}"
+    others = get_peer_stats().rank([s for s in sources if s != selected_server], selected_package.get('size'))
+    ordered = [selected_server] + others
+    download_package(
+        ordered,
+        filename,
+        deb_file_path,
+        sha256=selected_package.get('sha256'),
+        size=selected_package.get('size'),
+    )
+    return deb_file_path
+
+
+def plan_install(package_names, servers, chosen=None, known=None):
+    """Plan the install of packages and every dependency the system lacks.
+
+    Returns (plan entries, InstallPlan). Entries are
+    (name, server, details, sources) tuples with dependencies first.
+    """
+    pc_architecture = platform.machine()
 
+    def lookup(names):
+        resolved = resolve_packages(names, servers)
+        return {name: filter_compatible_packages(details, pc_architecture) for name, details in resolved.items()}
 
-def fallback_apt_install(package_name):
-    """Fallback to using apt for package installation."""
-    print("Do you want to use apt to install the package? (y/n): ", end="")
-    choice = input().strip().lower()
+    planner = InstallPlanner(lookup, prefer=peer_preference)
+    planner.candidates.update(known or {})
+    plan = planner.plan(package_names, chosen)
+
+    entries = []
+    for package_name, (server, details) in reversed(plan.packages.items()):
+        sources = find_package_sources(planner.candidates.get(package_name) or [(server, details)], details)
+        entries.append((package_name, server, details, sources))
+    return entries, plan
+
+
+def show_install_plan(entries, plan, requested):
+    """Print the packages about to be downloaded and any dependency peers cannot supply."""
+    if entries:
+        print(tabulate(
+            [(name, pkg['version'], pkg['architecture'], len(sources), "" if name in requested else "dependency")
+             for name, _, pkg, sources in entries],
+            headers=["Package Name", "Version", "Architecture", "Servers", "Reason"],
+            tablefmt="grid",
+        ))
+    if plan.unresolved:
+        print(f"Dependencies not available from any server: {', '.join(plan.unresolved)}")
+
+
+def download_and_install(entries):
+    """Download every planned package concurrently and install them with one dpkg call.
+
+    If any download fails nothing is installed: dpkg would leave the
+    packages depending on it unconfigured.
+
+    Returns (success, names of packages that could not be downloaded).
+    """
+    deb_files = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=BULK_DOWNLOAD_WORKERS) as pool:
+        futures = {pool.submit(_download_selected, *entry): entry[0] for entry in entries}
+        for future, package_name in futures.items():
+            try:
+                deb_files.append(future.result())
+            except (requests.RequestException, DownloadError) as e:
+                print(f"Error downloading package {package_name}: {e}")
+                failed.append(package_name)
+
+    if failed:
+        print(f"Not installing anything; could not download: {' '.join(failed)}")
+        return False, failed
+    if not deb_files:
+        return True, failed
+
+    print(f"Installing {len(deb_files)} packages...")
+    result = subprocess.run(["sudo", "dpkg", "-i", *deb_files])
+    if result.returncode == 0:
+        print(f"Installed {len(deb_files)} packages successfully.")
+        return True, failed
+    print("dpkg reported errors; you may need to run 'sudo apt-get install -f'.")
+    return False, failed
+
+
+def fallback_apt_install(package_names, assume_yes=False):
+    """Fallback to using apt for package installation.
+
+    ``package_names`` is one name or a list of names; each is passed to apt
+    as its own argument, never through a shell.
+    """
+    if isinstance(package_names, str):
+        package_names = [package_names]
+    if assume_yes:
+        choice = 'y'
+    else:
+        print("Do you want to use apt to install the package? (y/n): ", end="")
+        choice = input().strip().lower()
     if choice == 'y':
-        import os
-        result = os.system(f"sudo apt install {package_name}")
-        return result == 0
+        result = subprocess.run(["sudo", "apt", "install", *(["-y"] if assume_yes else []), *package_names], check=False)
+        return result.returncode == 0
     else:
         print("Package installation aborted.")
         return False
 
 
-def install_package(package_name):
-    """Install a package from available servers."""
+def install_package(package_name, assume_yes=False, quiet_period=None):
+    """Install a package from available servers.
+
+    With ``assume_yes`` the newest compatible version is picked from the
+    fastest peer instead of asking the user. ``quiet_period`` is passed to
+    discover_servers.
+    """
     print(f"Attempting to install package: {package_name}")
-    servers = discover_servers()
+    servers = servers_with_packages(discover_servers(quiet_period=quiet_period))
     
     # Fetch package details from servers
-    package_details = fetch_package_details(package_name, servers)
+    package_details = fetch_package_details(package_name, servers, first=INSTALL_FIRST_RESPONDERS)
 
     if package_details:
         print(f"Package {package_name} details found:")
@@ -199,15 +344,90 @@ def install_package(package_name):
         has_compatible_packages = display_package_options(filtered_details, package_details)
         
         if has_compatible_packages:
-            # Get user's choice
-            selected_package_info = get_user_package_choice(filtered_details)
-            if selected_package_info:
+            # Get user's choice, or pick the best candidate when running unattended
+            if assume_yes:
+                selected_package_info = select_best_package(filtered_details)
                 selected_server, selected_package = selected_package_info
-                # Download and install the package
-                success = download_and_install_package(package_name, selected_server, selected_package)
-                if not success:
+                print(f"Selected version {selected_package['version']} from {selected_server['ip']}:{selected_server['port']}")
+            else:
+                selected_package_info = get_user_package_choice(filtered_details)
+            if selected_package_info:
+                # Plan the chosen package together with its missing dependencies
+                entries, plan = plan_install(
+                    [package_name],
+                    servers,
+                    chosen={package_name: selected_package_info},
+                    known={package_name: filtered_details},
+                )
+                show_install_plan(entries, plan, [package_name])
+                success, failed = download_and_install(entries)
+                if failed:
+                    # apt can fetch what the peers could not deliver and resolves the rest itself.
+                    fallback_apt_install(package_name, assume_yes)
+                elif not success:
                     print("Installation failed. You may want to try a different package or use apt.")
     else:
         print(f"No details found for package {package_name} on any server.")
-        fallback_apt_install(package_name)
+        fallback_apt_install(package_name, assume_yes)
+
+
+
+def read_package_manifest(path):
+    """Read package names from a manifest file: whitespace separated, '#' starts a comment.
+
+    Raises OSError or UnicodeDecodeError if the file cannot be read.
+    """
+    names = []
+    with open(path) as f:
+        for line in f:
+            names.extend(line.split("#", 1)[0].split())
+    return names
+
+
+def resolve_packages(package_names, servers):
+    """Look up every package with one batched request per server not covered by a federated answer.
+
+    Returns a {package_name: [(server, details), ...]} dict.
+    """
+    resolved = {name: [] for name in package_names}
+    covered = set()
+    answer = query_network(servers, "/api/pkgs?federated=true", method="POST", json={"names": package_names})
+    responses = []
+    if answer is not None:
+        server, found = answer
+        if "federated_peers" in found:
+            for name, items in found["packages"].items():
+                if name in resolved:
+                    resolved[name].extend(federated_details(server, items, servers))
+        else:
+            responses.append(answer)
+        covered = covered_servers(server, found)
+
+    remaining = [server for server in servers if peer_key(server) not in covered]
+    responses.extend(query_servers(remaining, "/api/pkgs", method="POST", json={"names": package_names}))
+    for server, found in responses:
+        for name, items in found.items():
+            if name in resolved:
+                resolved[name].extend((server, item) for item in items)
+    return resolved
+
+
+def install_packages(package_names, assume_yes=False, quiet_period=None):
+    """Install several packages with one discover, resolve, download and dpkg pass."""
+    # Keep the order given but drop duplicates
+    package_names = list(dict.fromkeys(package_names))
+    print(f"Attempting to install {len(package_names)} packages: {' '.join(package_names)}")
+    servers = servers_with_packages(discover_servers(quiet_period=quiet_period))
+    print(f"Detected architecture: {platform.machine()}")
+
+    entries, plan = plan_install(package_names, servers)
+    show_install_plan(entries, plan, package_names)
+    success, failed = download_and_install(entries)
 
+    if failed:
+        # Nothing was installed, so apt has to handle every requested package.
+        return fallback_apt_install(package_names, assume_yes)
+    if plan.missing:
+        print(f"Not available from any server: {' '.join(plan.missing)}")
+        success = fallback_apt_install(plan.missing, assume_yes) and success
+    return success
@@ -0,0 +1,99 @@
+"""Per-peer latency and throughput history for LocalSync client.
+
+Every metadata request records its round-trip time and every download its
+throughput. Values are kept as moving averages in ``peers.json`` so the
+client can prefer fast peers on the next run.
+"""
+import json
+import os
+import threading
+import time
+
+from src.lib.data import CLIENT_CACHE_DIR
+
+PEER_STATS_FILE = os.path.join(CLIENT_CACHE_DIR, "peers.json")
+# Weight of a new sample in the moving averages.
+EWMA_WEIGHT = 0.3
+# Assumed for peers we have never measured.
+DEFAULT_RTT = 0.1
+DEFAULT_THROUGHPUT = 10 * 1024 * 1024
+# Size used to weigh latency against throughput when the package size is unknown.
+TYPICAL_PACKAGE_SIZE = 1024 * 1024
+# Transfers smaller than this say more about latency than bandwidth.
+MIN_THROUGHPUT_SAMPLE = 64 * 1024
+
+
+def peer_key(server):
+    return f"{server['ip']}:{server['port']}"
+
+
+def _ewma(old, sample):
+    return sample if old is None else old + EWMA_WEIGHT * (sample - old)
+
+
+class PeerStats:
+    """Moving averages of RTT (seconds) and throughput (bytes/s) per peer."""
+
+    def __init__(self, path=PEER_STATS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._peers = json.load(f)
+        except (OSError, ValueError):
+            self._peers = {}
+
+    def _entry(self, server):
+        return self._peers.setdefault(peer_key(server), {"rtt": None, "throughput": None, "samples": 0})
+
+    def record_rtt(self, server, seconds):
+        with self._lock:
+            entry = self._entry(server)
+            entry["rtt"] = _ewma(entry["rtt"], seconds)
+            entry["updated"] = time.time()
+
+    def record_transfer(self, server, nbytes, seconds):
+        if nbytes < MIN_THROUGHPUT_SAMPLE or seconds <= 0:
+            return
+        with self._lock:
+            entry = self._entry(server)
+            entry["throughput"] = _ewma(entry["throughput"], nbytes / seconds)
+            entry["samples"] += 1
+            entry["updated"] = time.time()
+
+    def expected_time(self, server, size=None):
+        """Estimated seconds to fetch ``size`` bytes from a peer."""
+        with self._lock:
+            entry = self._peers.get(peer_key(server)) or {}
+            rtt = entry.get("rtt") or DEFAULT_RTT
+            throughput = entry.get("throughput") or DEFAULT_THROUGHPUT
+        return rtt + (size or TYPICAL_PACKAGE_SIZE) / throughput
+
+    def rank(self, servers, size=None):
+        """Return ``servers`` ordered fastest first."""
+        return sorted(servers, key=lambda server: self.expected_time(server, size))
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self._peers, separators=(",", ":"))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_file = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w") as f:
+                f.write(data)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            print(f"Could not save peer statistics: {e}")
+
+
+_peer_stats = None
+_peer_stats_lock = threading.Lock()
+
+
+def get_peer_stats():
+    """Return the process-wide PeerStats, loading it on first use."""
+    global _peer_stats
+    with _peer_stats_lock:
+        if _peer_stats is None:
+            _peer_stats = PeerStats()
+        return _peer_stats
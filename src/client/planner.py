@@ -0,0 +1,188 @@
+"""Dependency-aware install planning for LocalSync client.
+
+Starting from the packages the user asked for, the planner follows
+``Pre-Depends``/``Depends`` through what the peers hold, skipping anything
+the local dpkg database already satisfies, so the whole set can be
+downloaded from the network in one go.
+"""
+import re
+from dataclasses import dataclass, field
+
+from src.lib.debversion import compare_versions, version_key
+
+DPKG_STATUS_FILE = "/var/lib/dpkg/status"
+
+_RELATION_RE = re.compile(r"^([^\s(:]+)(?::\S+)?\s*(?:\(\s*(<<|<=|>=|>>|=|<|>)\s*([^)\s]+)\s*\))?")
+
+
+def parse_relations(text):
+    """Parse a Depends-style field into a list of alternative groups.
+
+    ``"a (>= 1), b | c"`` becomes ``[[("a", ">=", "1")], [("b", None, None), ("c", None, None)]]``.
+    """
+    groups = []
+    for clause in (text or "").split(","):
+        group = []
+        for alternative in clause.split("|"):
+            match = _RELATION_RE.match(alternative.strip())
+            if match:
+                group.append(match.groups())
+        if group:
+            groups.append(group)
+    return groups
+
+
+def version_satisfies(version, op, required):
+    """Check ``version`` against a relation such as ``>= 1.2``; no operator always matches."""
+    if op is None:
+        return True
+    result = compare_versions(version, required)
+    if op == "<<":
+        return result < 0
+    if op in ("<=", "<"):
+        return result <= 0
+    if op == "=":
+        return result == 0
+    if op in (">=", ">"):
+        return result >= 0
+    if op == ">>":
+        return result > 0
+    return False
+
+
+def format_relation(group):
+    return " | ".join(name if op is None else f"{name} ({op} {version})" for name, op, version in group)
+
+
+def read_dpkg_status(path=DPKG_STATUS_FILE):
+    """Return ({package: version}, {virtual package: [versions]}) for installed packages."""
+    installed = {}
+    provided = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            stanzas = f.read().split("\n\n")
+    except OSError:
+        return installed, provided
+
+    for stanza in stanzas:
+        fields = {}
+        for line in stanza.splitlines():
+            if line and line[0] not in " \t":
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+        if "Package" not in fields or not fields.get("Status", "").endswith(" installed"):
+            continue
+        installed[fields["Package"]] = fields.get("Version", "")
+        for name, op, version in (group[0] for group in parse_relations(fields.get("Provides"))):
+            provided.setdefault(name, []).append(version if op == "=" else None)
+    return installed, provided
+
+
+@dataclass
+class InstallPlan:
+    """Packages to fetch, as {name: (server, details)}, plus what peers cannot supply."""
+    packages: dict = field(default_factory=dict)
+    missing: list = field(default_factory=list)
+    unresolved: list = field(default_factory=list)
+
+
+def _provides(details):
+    return {group[0][0]: group[0] for group in parse_relations(details.get("provides"))}
+
+
+class InstallPlanner:
+    """Resolve the transitive closure of a set of packages against peers and the local system.
+
+    ``lookup`` takes a list of package names and returns
+    ``{name: [(server, details), ...]}`` for the compatible candidates the
+    peers hold; it is called once per dependency level. Among equal
+    versions the candidate with the highest ``prefer(server, details)``
+    wins.
+    """
+
+    def __init__(self, lookup, installed=None, provided=None, prefer=None):
+        self.lookup = lookup
+        self.prefer = prefer or (lambda server, details: 0)
+        if installed is None:
+            installed, provided = read_dpkg_status()
+        self.installed = installed
+        self.provided = provided or {}
+        self.candidates = {}
+
+    def _fetch(self, names):
+        names = [name for name in dict.fromkeys(names) if name not in self.candidates]
+        if names:
+            found = self.lookup(names)
+            for name in names:
+                self.candidates[name] = found.get(name) or []
+
+    def _satisfied(self, group, plan):
+        for name, op, version in group:
+            selected = plan.packages.get(name)
+            if selected is not None and version_satisfies(selected[1]["version"], op, version):
+                return True
+            if name in self.installed and version_satisfies(self.installed[name], op, version):
+                return True
+            for provided_version in self.provided.get(name, []):
+                if op is None or (provided_version and version_satisfies(provided_version, op, version)):
+                    return True
+            for _, details in plan.packages.values():
+                relation = _provides(details).get(name)
+                if relation and (op is None or (relation[1] == "=" and version_satisfies(relation[2], op, version))):
+                    return True
+        return False
+
+    def _choose(self, name, op, version):
+        """Return the newest candidate of ``name`` that satisfies the relation, or None."""
+        matching = [
+            entry for entry in self.candidates.get(name, [])
+            if version_satisfies(entry[1]["version"], op, version)
+        ]
+        if not matching:
+            return None
+        return max(matching, key=lambda entry: (version_key(entry[1]["version"]), self.prefer(*entry)))
+
+    def plan(self, package_names, chosen=None):
+        """Plan the install of ``package_names``; ``chosen`` pins {name: (server, details)} picks."""
+        plan = InstallPlan()
+        chosen = chosen or {}
+        self._fetch([name for name in package_names if name not in chosen])
+
+        pending = []
+        unresolved = []
+        for name in package_names:
+            entry = chosen.get(name) or self._choose(name, None, None)
+            if entry is None:
+                plan.missing.append(name)
+                continue
+            plan.packages[name] = entry
+            pending.append(entry)
+
+        while pending:
+            groups = []
+            for _, details in pending:
+                groups.extend(parse_relations(details.get("pre_depends")))
+                groups.extend(parse_relations(details.get("depends")))
+            groups = [group for group in groups if not self._satisfied(group, plan)]
+            self._fetch([name for group in groups for name, _, _ in group])
+
+            pending = []
+            for group in groups:
+                # An earlier group in this level may have pulled in what this one needs.
+                if self._satisfied(group, plan):
+                    continue
+                for name, op, version in group:
+                    entry = self._choose(name, op, version)
+                    if entry is not None:
+                        plan.packages[name] = entry
+                        pending.append(entry)
+                        break
+                else:
+                    unresolved.append(group)
+
+        # Packages pulled in later may provide what an earlier level was missing.
+        for group in unresolved:
+            relation = format_relation(group)
+            if not self._satisfied(group, plan) and relation not in plan.unresolved:
+                plan.unresolved.append(relation)
+        return plan
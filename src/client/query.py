@@ -0,0 +1,115 @@
+"""Concurrent queries against discovered LocalSync servers."""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+
+import requests
+import urllib3.response
+from requests.adapters import HTTPAdapter
+
+from src.client.peers import get_peer_stats
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+# (connect, read) timeouts for metadata requests.
+QUERY_TIMEOUT = (2, 5)
+MAX_QUERY_WORKERS = 32
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _wire_headers():
+    """Ask for msgpack and zstd when this client can decode them."""
+    headers = {}
+    if msgpack is not None:
+        headers["Accept"] = f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"
+    if getattr(urllib3.response, "HAS_ZSTD", False):
+        headers["Accept-Encoding"] = "zstd, gzip, deflate"
+    return headers
+
+
+def server_url(server, path):
+    return f"http://{server['ip']}:{server['port']}{path}"
+
+
+def get_session(server):
+    """Return a keep-alive session for a server, shared by every query to it."""
+    key = (server['ip'], server['port'])
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(_wire_headers())
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+            _sessions[key] = session
+        return session
+
+
+def query_server(server, path, method="GET", json=None, timeout=QUERY_TIMEOUT):
+    """Send one request to a server and return the decoded JSON or msgpack body."""
+    response = get_session(server).request(method, server_url(server, path), json=json, timeout=timeout)
+    get_peer_stats().record_rtt(server, response.elapsed.total_seconds())
+    response.raise_for_status()
+    if response.headers.get("Content-Type", "").startswith(MSGPACK_MEDIA_TYPE):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+
+def query_servers(servers, path, method="GET", json=None, timeout=QUERY_TIMEOUT,
+                  accept=None, first=None, deadline=None, report_errors=True):
+    """Run the same request against every server concurrently.
+
+    Returns a list of (server, data) pairs in the order servers answered.
+    ``accept`` filters which answers count as results, ``first`` returns
+    as soon as that many accepted answers are in, and ``deadline`` caps
+    the total wait in seconds. Servers that fail or time out are skipped
+    (and reported unless ``report_errors`` is False).
+    """
+    if not servers:
+        return []
+
+    results = []
+    pool = ThreadPoolExecutor(max_workers=min(MAX_QUERY_WORKERS, len(servers)), thread_name_prefix="query")
+    futures = {
+        pool.submit(query_server, server, path, method, json, timeout): server
+        for server in servers
+    }
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            server = futures[future]
+            try:
+                data = future.result()
+            except (requests.RequestException, ValueError) as e:
+                if report_errors:
+                    print(f"Failed to connect to server {server['ip']}:{server['port']}. Error: {e}")
+                continue
+            if accept is not None and not accept(data):
+                continue
+            results.append((server, data))
+            if first is not None and len(results) >= first:
+                break
+    except TimeoutError:
+        print(f"Stopped waiting for slow servers after {deadline} seconds.")
+    finally:
+        # Do not wait for stragglers; their own timeouts bound how long they linger.
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def query_network(servers, path, method="GET", json=None, timeout=QUERY_TIMEOUT):
+    """Ask servers one at a time, fastest first, until one answers.
+
+    Used for federated lookups, where a single answer covers the whole
+    network. Returns (server, data), or None if no server answered.
+    """
+    for server in get_peer_stats().rank(servers):
+        try:
+            return server, query_server(server, path, method, json, timeout)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Failed to connect to server {server['ip']}:{server['port']}. Error: {e}")
+    return None
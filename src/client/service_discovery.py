@@ -1,56 +1,100 @@
 import socket
+import threading
 import time
 from zeroconf import ServiceBrowser, Zeroconf
 from zeroconf import ServiceListener
 
 SERVICE_TYPE = "_localsync._tcp.local."  # Changed to match server
 
+# Give up on discovery after this many seconds without any answer.
+DISCOVERY_TIMEOUT = 2.0
+# Once servers answer, stop after this long without a new one (the client's --quiet-period).
+DISCOVERY_QUIET_PERIOD = 0.3
+
+
 class MyListener(ServiceListener):
-    def __init__(self, zeroconf_instance):
+    def __init__(self, zeroconf_instance, verbose=True):
         self.zeroconf = zeroconf_instance
         self.discovered_servers = []  # Store discovered servers
-        print(f"Listening for service type: {SERVICE_TYPE}")
+        self.changed = threading.Event()
+        self.verbose = verbose
+        if verbose:
+            print(f"Listening for service type: {SERVICE_TYPE}")
 
-    def add_service(self, zc, type_, name):
+    def _server_info(self, zc, type_, name):
         info = zc.get_service_info(type_, name)
-        
-        if info:
-            address = socket.inet_ntoa(info.addresses[0])
-            port = info.port
-            
-            # Extract server info
-            server_info = {
-                "name": info.name,
-                "ip": address,
-                "port": port,
-            }
-            
+        if not info or not info.addresses:
+            return None
+
+        # Extract server info
+        return {
+            "name": info.name,
+            "ip": socket.inet_ntoa(info.addresses[0]),
+            "port": info.port,
+            "properties": {
+                key.decode(): value.decode() if value is not None else None
+                for key, value in info.properties.items()
+            },
+        }
+
+    def add_service(self, zc, type_, name):
+        server_info = self._server_info(zc, type_, name)
+
+        if server_info:
+            self.discovered_servers = [s for s in self.discovered_servers if s["name"] != name]
             self.discovered_servers.append(server_info)
-            
+            self.changed.set()
+
+            if not self.verbose:
+                return
             print("--- SERVER FOUND ---")
-            print(f"Name: {info.name}")
-            print(f"Address: {address}:{port}")
+            print(f"Name: {server_info['name']}")
+            print(f"Address: {server_info['ip']}:{server_info['port']}")
+
+    def update_service(self, zc, type_, name):
+        server_info = self._server_info(zc, type_, name)
+        if server_info:
+            self.discovered_servers = [s for s in self.discovered_servers if s["name"] != name]
+            self.discovered_servers.append(server_info)
+            self.changed.set()
 
     def remove_service(self, zc, type_, name):
-        print(f"Service removed: {name}")
+        if self.verbose:
+            print(f"Service removed: {name}")
         # Remove from discovered servers list
         self.discovered_servers = [s for s in self.discovered_servers if s["name"] != name]
 
-def run_client_mdns():
+
+def run_client_mdns(timeout=DISCOVERY_TIMEOUT, quiet_period=None, verbose=True):
+    """Browse for servers, returning once answers stop arriving.
+
+    Waits up to ``timeout`` seconds for a first answer, then returns as
+    soon as ``quiet_period`` seconds (default ``DISCOVERY_QUIET_PERIOD``)
+    pass without a new or updated server.
+    """
+    if quiet_period is None:
+        quiet_period = DISCOVERY_QUIET_PERIOD
     zeroconf = Zeroconf()
-    listener = MyListener(zeroconf)
-    
+    listener = MyListener(zeroconf, verbose)
+
     ServiceBrowser(zeroconf, SERVICE_TYPE, listener)
-    
+
     try:
-        time.sleep(2)
+        deadline = time.monotonic() + timeout
+        if listener.changed.wait(timeout):
+            while True:
+                listener.changed.clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not listener.changed.wait(min(quiet_period, remaining)):
+                    break
     except KeyboardInterrupt:
         pass
     finally:
         zeroconf.close()
-        print("Client shut down.")
+        if verbose:
+            print("Client shut down.")
 
     return listener.discovered_servers  # Return the discovered servers
 
 if __name__ == "__main__":
-    run_client_mdns()
\ No newline at end of file
+    run_client_mdns()
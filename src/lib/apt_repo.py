@@ -0,0 +1,145 @@
+"""Flat apt repository view of the content store.
+
+Publishes ``Packages``, ``Packages.gz``, ``Packages.xz`` and ``Release`` so
+machines can use LocalSync as a regular apt source::
+
+    deb [trusted=yes] http://<server>:53456/apt ./
+
+Each package's stanza is built once from its cached control fields and
+kept in memory; index changes only rebuild the stanzas that changed, and
+the files are rewritten after a debounce so a burst of new archives
+costs one regeneration.
+"""
+import gzip
+import hashlib
+import lzma
+import os
+import threading
+from email.utils import formatdate
+
+from src.lib.data import APT_DIR
+from src.lib.debounce import Debouncer
+from src.lib.logger import Logger
+
+
+logger = Logger("AptRepository")
+
+INDEX_FILES = ("Packages", "Packages.gz", "Packages.xz", "Release")
+POOL_PREFIX = "pool/"
+# Fields we write ourselves from the blob store rather than copying from the control file.
+GENERATED_FIELDS = ("Filename", "Size", "SHA256", "MD5sum", "SHA1")
+
+
+def build_stanza(fields, filename, size, sha256):
+    """Render a Packages stanza for one .deb."""
+    lines = [
+        f"{key}: {value}" for key, value in fields.items() if key not in GENERATED_FIELDS
+    ]
+    lines.append(f"Filename: {POOL_PREFIX}{filename}")
+    lines.append(f"Size: {size}")
+    lines.append(f"SHA256: {sha256}")
+    return "\n".join(lines) + "\n"
+
+
+def row_filename(row):
+    """Turn a (name, version, architecture) row back into its .deb filename."""
+    return f"{row[0]}_{row[1]}_{row[2]}.deb"
+
+
+def _write_temp(path, data):
+    """Write ``data`` next to ``path`` under a temporary name and return that name."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    return tmp_path
+
+
+class AptRepository:
+    """Keeps the apt index files in sync with the package index."""
+
+    def __init__(self, cache_event_handler, directory=APT_DIR, delay=2.0, max_delay=30.0, publish=True):
+        """With ``publish`` false the repository only serves index files another process writes."""
+        self.handler = cache_event_handler
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stanzas = {}
+        self._pending = set()
+        self._debouncer = Debouncer(self.regenerate, delay, max_delay, name="apt-index")
+        if publish:
+            cache_event_handler.index.add_listener(self._on_change)
+
+    def start(self):
+        """Queue every indexed package and build the repository in the background."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._pending.update(row_filename(row) for row in self.handler.get_formatted_content())
+        self._debouncer.trigger()
+
+    def _on_change(self, op, key):
+        with self._lock:
+            self._pending.add(row_filename(key))
+        self._debouncer.trigger()
+
+    def path_for(self, name):
+        """Return the on-disk path of an index file, or None if it is not one of ours."""
+        if name not in INDEX_FILES:
+            return None
+        return os.path.join(self.directory, name)
+
+    def regenerate(self):
+        """Refresh stanzas for changed packages and rewrite the index files."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+
+        for filename in pending:
+            record = self.handler.index.lookup(filename)
+            stanza = None
+            if record is not None and record.get("sha256"):
+                fields = self.handler.controls.get(record["sha256"], self.handler.blobs.path_for(record["sha256"]))
+                if fields is not None:
+                    stanza = build_stanza(fields, filename, record["size"], record["sha256"])
+                else:
+                    logger.warning(f"Could not read control data from {filename}")
+            with self._lock:
+                if stanza is None:
+                    self._stanzas.pop(filename, None)
+                else:
+                    self._stanzas[filename] = stanza
+
+        self.write_indexes()
+
+    def write_indexes(self):
+        with self._lock:
+            packages = "\n".join(self._stanzas[name] for name in sorted(self._stanzas)).encode()
+            count = len(self._stanzas)
+
+        os.makedirs(self.directory, exist_ok=True)
+        variants = {
+            "Packages": packages,
+            "Packages.gz": gzip.compress(packages, compresslevel=9, mtime=0),
+            "Packages.xz": lzma.compress(packages),
+        }
+        release = [
+            "Origin: LocalSync",
+            "Label: LocalSync",
+            f"Date: {formatdate(usegmt=True)}",
+            "SHA256:",
+        ]
+        for name, data in variants.items():
+            release.append(f" {hashlib.sha256(data).hexdigest()} {len(data)} {name}")
+        variants["Release"] = ("\n".join(release) + "\n").encode()
+
+        # Everything is on disk before anything is swapped in, and each file is replaced in
+        # one rename with Release last, so a reader never sees a partly written file.
+        staged = []
+        try:
+            for name, data in variants.items():
+                path = os.path.join(self.directory, name)
+                staged.append((_write_temp(path, data), path))
+        except OSError:
+            for tmp_path, _ in staged:
+                os.unlink(tmp_path)
+            raise
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+        logger.info(f"Wrote apt index with {count} packages")
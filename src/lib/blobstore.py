@@ -0,0 +1,63 @@
+"""Content-addressed blob storage for cached packages.
+
+Blobs live under ``<root>/sha256/<first two hex digits>/<digest>``, so the
+same .deb found in several cache directories is stored exactly once and
+its digest doubles as an integrity check and HTTP ETag.
+"""
+import hashlib
+import os
+import threading
+
+from src.lib.ingest import IngestResult, ingest_file
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Digests share this many locks; enough that unrelated ingests rarely wait on each other.
+LOCK_STRIPES = 64
+
+
+def hash_file(path):
+    """Stream a file through SHA256. Returns (hex digest, size)."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+class BlobStore:
+    """Stores files by their SHA256 digest."""
+
+    def __init__(self, root):
+        self.root = os.path.join(root, "sha256")
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def lock(self, digest):
+        """Lock held while a blob gains or loses references, so it is never removed under a new one."""
+        return self._locks[int(digest[:4], 16) % LOCK_STRIPES]
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def add(self, src, digest, size, mode="auto"):
+        """Store ``src`` under ``digest`` unless an identical blob already exists."""
+        blob_path = self.path_for(digest)
+        if os.path.exists(blob_path):
+            return IngestResult(blob_path, "dedup", size, size)
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        return ingest_file(src, blob_path, mode)
+
+    def remove(self, digest):
+        blob_path = self.path_for(digest)
+        if os.path.exists(blob_path):
+            os.unlink(blob_path)
+            return True
+        return False
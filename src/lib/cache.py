@@ -1,75 +1,469 @@
+import atexit
 import os
 import glob
-import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from watchdog.events import FileSystemEventHandler
 
-from src.lib.data import CONTENT_DIR
-from src.lib.data import Config
+from src.lib.blobstore import BlobStore, hash_file
+from src.lib.chunks import MIN_DELTA_SIZE, ManifestStore
+from src.lib.data import ACCESS_STATS_FILE, CONTENT_DIR, CONTROL_CACHE_FILE, MANIFEST_DIR
+from src.lib.data import Config, get_store
+from src.lib.debounce import Debouncer
+from src.lib.debfile import ControlCache, relations
+from src.lib.eviction import AccessStats
+from src.lib.index import PackageIndex
+from src.lib.ingest import IngestProgress, IngestStats
 from src.lib.logger import Logger
+from src.lib.metrics import Counter, Histogram
+from src.lib.store import open_store
 
 
 logger = Logger("CacheEventHandler")
 
+INGEST_SECONDS = Histogram("localsync_ingest_seconds", "Time to hash, store and index one package file.")
+INGESTED_FILES = Counter("localsync_ingested_files_total", "Package files ingested, by strategy.", ["strategy"])
+INGESTED_BYTES = Counter("localsync_ingested_bytes_total", "Bytes of package files ingested.")
+INGEST_FAILURES = Counter("localsync_ingest_failures_total", "Package files that could not be ingested.")
+MANIFEST_SECONDS = Histogram("localsync_chunk_manifest_seconds", "Time to build a chunk manifest at ingestion.")
+EVENT_LAG = Histogram(
+    "localsync_watch_event_lag_seconds",
+    "Time from a filesystem event to the file being ingested or removed.",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+INDEX_LOOKUP = Histogram("localsync_index_lookup_seconds", "Time to answer an index lookup.", ["op"])
+
+# Quiet time before a burst of filesystem events is processed, and the longest a burst may defer it.
+EVENT_DELAY = 1.0
+EVENT_MAX_DELAY = 10.0
+DEFAULT_RESCAN_INTERVAL = 600
+
+
+def _is_package(path):
+    """True for .deb files outside apt's partial/ download directory."""
+    path = str(path)
+    return path.endswith(".deb") and "partial" not in path.split(os.sep)[:-1]
+
+
+def _signature(path):
+    """(size, mtime, inode) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _record_signature(record):
+    if record.get("mtime") is None or record.get("inode") is None:
+        return None
+    return record.get("size"), record["mtime"], record["inode"]
+
 class CacheEventHandler(FileSystemEventHandler):
     """Handles events in the cache directory."""
 
-    def __init__(self):
-        """Initializes the event handler."""    
+    def __init__(self, start_ingestion=True, read_only=False):
+        """Initializes the event handler.
+
+        The index is loaded from the catalogue store right away; new files in
+        the cache directories are ingested on a background thread pool so the
+        API can serve what is already indexed in the meantime.
+
+        A ``read_only`` handler (used by server worker processes) never writes
+        the stores; it follows the catalogue the primary process maintains.
+        """
         print("Initializing CacheEventHandler")
         super().__init__()
 
-        cache_file_list = []
+        config = Config()
+        self.config = config
+        self.read_only = read_only
+        store = get_store(config, read_only=read_only)
+        self.ingest_mode = config.get("ingest_mode") or "auto"
+        self.ingest_workers = config.get("ingest_workers") or min(8, os.cpu_count() or 1)
+        self.ingest_stats = IngestStats()
+        self.ingest_progress = IngestProgress()
+        self.blobs = BlobStore(CONTENT_DIR)
+        self.manifests = ManifestStore(MANIFEST_DIR)
+        self.chunk_manifests = config.get("chunk_manifests") is not False
+        control_store = open_store("log", CONTROL_CACHE_FILE, read_only=read_only)
+        atexit.register(control_store.close)
+        self.controls = ControlCache(control_store)
+        access_store = open_store("log", ACCESS_STATS_FILE, read_only=read_only)
+        atexit.register(access_store.close)
+        self.access = AccessStats(access_store)
+        self._ingest_thread = None
+        self.rescan_interval = config.get("rescan_interval") or DEFAULT_RESCAN_INTERVAL
+        self._rescan_thread = None
+        self._follow_thread = None
 
-        for cache_dir in Config().get_cache_dirs():
-            cache_file_list.extend(glob.glob(os.path.join(cache_dir, "*.deb")))
+        # Filesystem events are queued per path and handled in debounced batches.
+        self._events_lock = threading.Lock()
+        self._pending_events = {}
+        self._event_debouncer = Debouncer(self._process_events, EVENT_DELAY, EVENT_MAX_DELAY, name="cache-events")
 
-        logger.info(f"Found {len(cache_file_list)} cache files")
+        # Ingested source paths and their signature when ingested, so unchanged files are not
+        # ingested again. Entries from before content addressing have no digest and get re-ingested.
+        self._cached = {}
+        self.index = PackageIndex()
+        for item, record in config.get_cache_records().items():
+            if record.get("evicted"):
+                self._cached[item] = _record_signature(record)
+            elif record.get("sha256") and self.blobs.has(record["sha256"]):
+                self.index.add(item, record["sha256"], record.get("size"))
+                self._cached[item] = _record_signature(record)
+        if read_only:
+            self._follow_primary()
+        else:
+            # Every catalogue batch records the index state it reflects, for worker processes to adopt.
+            store.set_meta_source(lambda: {"epoch": self.index.epoch, "generation": self.index.generation})
+            store.write_meta()
 
         if not os.path.exists(CONTENT_DIR):
             logger.info(f"Creating content directory at {CONTENT_DIR}")
             os.makedirs(CONTENT_DIR)
             logger.info(f"Content directory created at {CONTENT_DIR}")
 
-        for file_path in cache_file_list:
-            cache = Config().get_cache()
-            if file_path not in cache:
-                result = shutil.copy(file_path, CONTENT_DIR)
-                if result: 
-                    Config().add_to_cache(file_path)
-                    logger.info(f"Copied {file_path} to {CONTENT_DIR}")
-                else:
-                    logger.error(f"Failed to copy {file_path} to {CONTENT_DIR}")
+        if start_ingestion:
+            self.start_ingestion()
+
+    def scan(self):
+        """Return .deb files in the configured cache directories that are not ingested yet."""
+        cache_file_list = []
+
+        for cache_dir in self.config.get_cache_dirs():
+            cache_file_list.extend(glob.glob(os.path.join(cache_dir, "*.deb")))
+
+        logger.info(f"Found {len(cache_file_list)} cache files")
+        return [file_path for file_path in cache_file_list if file_path not in self._cached]
+
+    def start_ingestion(self):
+        """Ingest pending cache files on a background thread."""
+        if self._ingest_thread is not None and self._ingest_thread.is_alive():
+            return
+        self._ingest_thread = threading.Thread(target=self._run_ingestion, name="ingest", daemon=True)
+        self._ingest_thread.start()
+
+    def wait_for_ingestion(self, timeout=None):
+        if self._ingest_thread is not None:
+            self._ingest_thread.join(timeout)
+
+    def _run_ingestion(self):
+        pending = self.scan()
+        self.ingest_progress.start(len(pending))
+        self._ingest_all(pending, self.ingest_progress.advance)
+        self.remove_legacy_content()
+        self.ingest_progress.finish()
+        logger.info(f"Ingestion summary: {self.ingest_stats.as_dict()}")
+
+    def _ingest_all(self, paths, on_done=None):
+        """Ingest files on the worker pool and commit the catalogue once at the end."""
+        # Bound the number of queued jobs so a 100k-file cache does not queue 100k futures.
+        # Every finished ingest lands in the catalogue store, which flushes in batches,
+        # so a restart resumes from the last committed batch.
+        slots = threading.BoundedSemaphore(self.ingest_workers * 2)
+
+        def job(file_path):
+            try:
+                ingested = self.ingest(file_path) is not None
+                if on_done is not None:
+                    on_done(ingested)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.ingest_workers, thread_name_prefix="ingest") as pool:
+            for file_path in paths:
+                slots.acquire()
+                pool.submit(job, file_path)
+
+        self.config.flush_cache()
+
+    def remove_legacy_content(self):
+        """Delete flat CONTENT_DIR/<filename> copies from before content addressing.
+
+        A copy is deleted only once a blob with the same digest is stored.
+        Copies without one (their source left the apt cache before the
+        upgrade) are kept and reported.
+        """
+        if self.read_only:
+            return
+        legacy = glob.glob(os.path.join(CONTENT_DIR, "*.deb"))
+        if not legacy:
+            return
+        removed = 0
+        for file_path in legacy:
+            try:
+                digest, _ = hash_file(file_path)
+                if self.blobs.has(digest):
+                    os.unlink(file_path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Failed to remove legacy copy {file_path}: {e}")
+        logger.info(f"Removed {removed} legacy content copies; {len(legacy) - removed} have no stored blob and were kept")
+
+    def ingest(self, file_path):
+        """Bring a .deb into the blob store and record it in the catalogue."""
+        started = time.perf_counter()
+        # Taken before hashing: a file changed while being read gets a new signature and is ingested again.
+        signature = _signature(file_path)
+        try:
+            digest, size = hash_file(file_path)
+            # Until the index refers to the blob, eviction must not remove it (see CacheEvictor.run_once).
+            with self.blobs.lock(digest):
+                result = self.blobs.add(file_path, digest, size, self.ingest_mode)
+                with self.config.cache_transaction():
+                    self.config.add_to_cache(file_path, self._catalogue_record(file_path, digest, size, signature))
+                    self.index.add(file_path, digest, size)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to ingest {file_path} into {CONTENT_DIR}: {e}")
+            INGEST_FAILURES.inc()
+            return None
+
+        self.access.added(digest)
+        self._cached[file_path] = signature
+        self.ingest_stats.record(result)
+        if self.chunk_manifests and size >= MIN_DELTA_SIZE:
+            try:
+                with MANIFEST_SECONDS.time():
+                    self.manifests.add(digest, result.path)
+            except OSError as e:
+                logger.error(f"Failed to build chunk manifest for {file_path}: {e}")
+        INGEST_SECONDS.observe(time.perf_counter() - started)
+        INGESTED_FILES.inc(strategy=result.strategy)
+        INGESTED_BYTES.inc(size)
+        logger.info(f"Ingested {file_path} via {result.strategy} ({result.bytes_saved} bytes saved)")
+        return result
 
+    @staticmethod
+    def _catalogue_record(file_path, digest, size, signature, **extra):
+        return {
+            "filename": os.path.basename(file_path),
+            "sha256": digest,
+            "size": size,
+            "mtime": signature[1] if signature else None,
+            "inode": signature[2] if signature else None,
+            **extra,
+        }
+
+    def mark_evicted(self, file_path, digest, size):
+        """Drop a source path from the index but remember it, so it is not ingested again unchanged.
+
+        The file itself belongs to apt (or the proxy cache) and is left alone.
+        """
+        signature = self._cached.get(file_path) or _signature(file_path)
+        with self.config.cache_transaction():
+            self.config.add_to_cache(file_path, self._catalogue_record(file_path, digest, size, signature, evicted=True))
+            self.index.remove(file_path)
+        self._cached[file_path] = signature
+
+    def remove(self, file_path):
+        """Drop a source path from the index and the catalogue store."""
+        # Together, so the generation written with a catalogue batch counts exactly its changes.
+        with self.config.cache_transaction():
+            self.config.remove_from_cache(file_path)
+            self.index.remove(file_path)
+        self._cached.pop(file_path, None)
+
+    def watch(self, observer):
+        """Schedule every configured cache directory on ``observer`` and start periodic rescans."""
+        for cache_dir in self.config.get_cache_dirs():
+            if os.path.isdir(cache_dir):
+                observer.schedule(self, path=cache_dir, recursive=False)
+                logger.info(f"Watching {cache_dir}")
+            else:
+                logger.warning(f"Cache directory {cache_dir} does not exist; not watching it")
+        if self._rescan_thread is None:
+            self._rescan_thread = threading.Thread(target=self._run_rescans, name="rescan", daemon=True)
+            self._rescan_thread.start()
+
+    def _run_rescans(self):
+        while True:
+            time.sleep(self.rescan_interval)
+            try:
+                self.rescan()
+            except Exception:
+                logger.exception("Rescan failed")
+
+    def rescan(self):
+        """Queue new files in the cache directories and sources that vanished without an event."""
+        for file_path in self.scan():
+            self._queue_event(file_path, "ingest")
+        for path in list(self._cached):
+            if not os.path.exists(path):
+                self._queue_event(path, "remove")
+
+    def follow_catalogue(self, interval=2.0):
+        """Keep the index in step with a catalogue store written by another process."""
+        if self._follow_thread is not None:
+            return
+
+        def run():
+            version = self.config.get_cache_version()
+            while True:
+                time.sleep(interval)
+                try:
+                    current = self.config.get_cache_version()
+                    if current != version:
+                        version = current
+                        self.sync_from_catalogue()
+                except Exception:
+                    logger.exception("Catalogue reload failed")
+
+        self._follow_thread = threading.Thread(target=run, name="catalogue-follow", daemon=True)
+        self._follow_thread.start()
+
+    def sync_from_catalogue(self):
+        """Re-read the catalogue store and apply the differences to the index."""
+        records = {
+            item: record for item, record in self.config.reload_cache_records().items()
+            if record.get("sha256") and not record.get("evicted") and self.blobs.has(record["sha256"])
+        }
+        for record in self.index.records():
+            for path in record["sources"]:
+                current = records.get(path)
+                if current is None:
+                    self.index.remove(path)
+                    self._cached.pop(path, None)
+                elif current["sha256"] == record["sha256"]:
+                    del records[path]
+        for item, record in records.items():
+            self.index.add(item, record["sha256"], record.get("size"))
+            self._cached[item] = _record_signature(record)
+        self._follow_primary()
+
+    def _follow_primary(self):
+        """Take over the epoch and generation the primary wrote with the catalogue just read."""
+        meta = self.config.get_cache_meta()
+        if meta and meta.get("epoch"):
+            self.index.follow(meta["epoch"], meta["generation"])
+
+    def _queue_event(self, path, action):
+        if not _is_package(path):
+            return
+        # Remember the size and mtime seen now; a file still changing at processing time is not ready.
+        # The time of the first event is kept to measure how long files wait.
+        with self._events_lock:
+            queued = self._pending_events.get(str(path), (None, None, time.monotonic()))[2]
+            self._pending_events[str(path)] = (action, _signature(path), queued)
+        self._event_debouncer.trigger()
+
+    def _process_events(self):
+        """Apply a batch of queued events: drop removed files, ingest settled ones."""
+        with self._events_lock:
+            events, self._pending_events = self._pending_events, {}
+
+        removed = 0
+        ready = []
+        unsettled = False
+        waited = []
+        for path, (action, seen, queued) in events.items():
+            signature = _signature(path)
+            if action == "remove" or signature is None:
+                if path in self._cached or path in self.index:
+                    self.remove(path)
+                    removed += 1
+                    waited.append(queued)
+            elif signature != seen:
+                # Still being written; look again after the next quiet period.
+                with self._events_lock:
+                    self._pending_events.setdefault(path, (action, signature, queued))
+                unsettled = True
+            elif self._cached.get(path) == signature:
+                # Already ingested and unchanged: attribute changes, including the ones our own
+                # hardlink ingest causes, and rescans of files we know.
+                continue
+            else:
+                ready.append(path)
+                waited.append(queued)
+
+        if ready:
+            self._ingest_all(ready)
+        elif removed:
+            self.config.flush_cache()
+        now = time.monotonic()
+        for queued in waited:
+            EVENT_LAG.observe(now - queued)
+        if ready or removed:
+            logger.info(f"Processed file events: {len(ready)} ingested, {removed} removed")
+        if unsettled:
+            self._event_debouncer.trigger()
 
     def on_created(self, event):
         if event.is_directory:
             return
-        
-        if str(event.src_path).endswith(".deb"):
-            os.system(f"cp {event.src_path} {CONTENT_DIR}")
-            logger.info(f"New cache file detected and copied: {event.src_path}")
-            Config().add_to_cache(event.src_path)
+        self._queue_event(event.src_path, "ingest")
+
+    def on_modified(self, event):
+        if event.is_directory:
+            return
+        self._queue_event(event.src_path, "ingest")
+
+    def on_closed(self, event):
+        if event.is_directory:
+            return
+        self._queue_event(event.src_path, "ingest")
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        self._queue_event(event.src_path, "remove")
+        self._queue_event(event.dest_path, "ingest")
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            return
+        self._queue_event(event.src_path, "remove")
 
     def get_formatted_content(self):
-        items = Config().get_cache()
-        formatted = [
-            os.path.basename(item).replace(".deb", "").split("_") for item in items
-        ]
-        return formatted
+        return self.index.formatted()
     
     def get_package(self, package_name):
-        items = Config().get_cache()
-        packages = []
-        for item in items:
-            parts = os.path.basename(item).replace(".deb", "").split("_")
-            if parts[0] == package_name:
-                packages.append({
-                    "name": parts[0],
-                    "version": parts[1],
-                    "architecture": parts[2],
-                })
-        return packages if packages else []
+        """Return every cached version of a package, with its dependency fields."""
+        with INDEX_LOOKUP.time(op="package"):
+            packages = self.index.get(package_name)
+            for package in packages:
+                fields = None
+                if package["sha256"]:
+                    fields = self.controls.get(package["sha256"], self.blobs.path_for(package["sha256"]))
+                package.update(relations(fields))
+        return packages
 
-    
-            
+    def describe(self, rows):
+        """Return get_package-style details for the [name, version, architecture] rows still cached."""
+        details = []
+        for name, version, architecture in rows:
+            record = self.index.find(name, version, architecture)
+            if record is None:
+                continue
+            fields = None
+            if record.get("sha256"):
+                fields = self.controls.get(record["sha256"], self.blobs.path_for(record["sha256"]))
+            details.append({
+                "name": name,
+                "version": version,
+                "architecture": architecture,
+                "sha256": record.get("sha256"),
+                "size": record.get("size"),
+                **relations(fields),
+            })
+        return details
+
+    def manifest(self, digest):
+        """Return the chunk manifest of a blob, building it for blobs ingested without one."""
+        if not self.chunk_manifests or not self.blobs.has(digest):
+            return None
+        try:
+            return self.manifests.add(digest, self.blobs.path_for(digest))
+        except OSError as e:
+            logger.error(f"Failed to build chunk manifest for {digest}: {e}")
+            return None
+
+    def resolve_file(self, filename):
+        """Return (blob path, sha256) for a cached .deb filename, or None."""
+        with INDEX_LOOKUP.time(op="file"):
+            record = self.index.lookup(filename)
+        if record is None or not record.get("sha256"):
+            return None
+        return self.blobs.path_for(record["sha256"]), record["sha256"]
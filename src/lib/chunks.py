@@ -0,0 +1,106 @@
+"""Content-defined chunking and chunk manifests for delta downloads.
+
+A chunk ends right after one of a few fixed two-byte anchors, at least
+``MIN_CHUNK`` and at most ``MAX_CHUNK`` bytes after it started. Boundaries
+depend only on the bytes around them, so content shared by two versions of
+a package splits into the same chunks even when it has moved. The anchors
+are found by the regex engine rather than a per-byte rolling hash in
+Python, which keeps chunking close to the speed of hashing the file.
+
+A manifest lists a file's chunks as ``[digest, length]`` pairs, in order.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+# Identifies the chunking scheme; clients only reuse chunks cut the same way.
+CHUNKER = "anchor2-v1"
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+# Eight anchors out of 65536 byte pairs give ~8 KiB chunks on compressed data.
+_ANCHOR_SEED = hashlib.sha256(b"localsync chunk anchors").digest()
+ANCHORS = re.compile(b"|".join(re.escape(_ANCHOR_SEED[i:i + 2]) for i in range(0, 16, 2)))
+# Bytes of the chunk SHA256 kept in manifests; the whole file is still checked against its full digest.
+CHUNK_DIGEST_SIZE = 16
+READ_SIZE = 4 * 1024 * 1024
+# Files smaller than this are downloaded whole.
+MIN_DELTA_SIZE = 256 * 1024
+
+
+def chunk_digest(chunk):
+    return hashlib.sha256(chunk).hexdigest()[:2 * CHUNK_DIGEST_SIZE]
+
+
+def _cut(buffer, start, end):
+    match = ANCHORS.search(buffer, start + MIN_CHUNK, min(start + MAX_CHUNK, end))
+    return match.end() if match else min(start + MAX_CHUNK, end)
+
+
+def iter_chunks(f):
+    """Yield the content-defined chunks of binary file ``f`` as memoryviews."""
+    buffer = b""
+    while True:
+        block = f.read(READ_SIZE)
+        buffer += block
+        view = memoryview(buffer)
+        start, end = 0, len(buffer)
+        # Without more input a chunk may only end early at the end of the file.
+        while end - start >= MAX_CHUNK or (not block and start < end):
+            cut = _cut(buffer, start, end)
+            yield view[start:cut]
+            start = cut
+        buffer = buffer[start:]
+        if not block:
+            return
+
+
+def build_manifest(path):
+    """Chunk a file. Returns {"chunker", "size", "chunks": [[digest, length], ...]}."""
+    chunks = []
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter_chunks(f):
+            chunks.append([chunk_digest(chunk), len(chunk)])
+            size += len(chunk)
+    return {"chunker": CHUNKER, "size": size, "chunks": chunks}
+
+
+class ManifestStore:
+    """Chunk manifests of blobs, stored as ``<root>/<first two hex digits>/<digest>.json``."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def get(self, digest):
+        try:
+            with open(self.path_for(digest)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get("chunker") == CHUNKER else None
+
+    def add(self, digest, blob_path):
+        """Return the manifest of a blob, building and saving it on first use."""
+        manifest = self.get(digest)
+        if manifest is not None:
+            return manifest
+
+        manifest = build_manifest(blob_path)
+        manifest_path = self.path_for(digest)
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, manifest_path)
+        return manifest
+
+    def remove(self, digest):
+        try:
+            os.unlink(self.path_for(digest))
+        except FileNotFoundError:
+            pass
@@ -1,10 +1,54 @@
-import json 
+import atexit
+import json
 import os
+import threading
+
+from src.lib.metrics import Counter, Histogram
+from src.lib.store import open_store
 
 DATA_DIR = "./"
 CONTENT_DIR = f"{DATA_DIR}content/"
+MANIFEST_DIR = f"{DATA_DIR}manifests/"
 LOG_FILE = f"{DATA_DIR}localsync.log"
 CONFIG_FILE = f"{DATA_DIR}config.json"
+APT_DIR = f"{DATA_DIR}apt/"
+CONTROL_CACHE_FILE = f"{DATA_DIR}control_cache.log"
+ACCESS_STATS_FILE = f"{DATA_DIR}access_stats.log"
+APT_ARCHIVES_DIR = "/var/cache/apt/archives/"
+DEFAULT_PORT = 53456
+CLIENT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "localsync"
+)
+CATALOGUE_FILES = {
+    "log": f"{DATA_DIR}catalogue.log",
+    "sqlite": f"{DATA_DIR}catalogue.db",
+}
+
+CATALOGUE_WRITES = Counter("localsync_catalogue_writes_total", "Catalogue store updates, by operation.", ["op"])
+CATALOGUE_FLUSH = Histogram("localsync_catalogue_flush_seconds", "Time to flush queued catalogue updates to disk.")
+CONFIG_SAVE = Histogram("localsync_config_save_seconds", "Time to write config.json.")
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(config=None, read_only=False):
+    """Return the shared catalogue store, opening it on first use.
+
+    ``read_only`` only matters on that first call: server worker processes
+    open the store read-only and leave every write to the primary process.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = config or Config()
+            backend = config.get("cache_store") or "log"
+            _store = open_store(backend, CATALOGUE_FILES[backend], read_only=read_only)
+            if not read_only:
+                config.migrate_saved_content(_store)
+            atexit.register(_store.close)
+        return _store
+
 
 class Config:
     def __init__(self, cache_age=2592000, current_cache=None):
@@ -13,21 +57,60 @@ class Config:
     def get(self, key):
         return self.config.get(key)
 
-    def add_to_cache(self, item):
-        if "saved_content" not in self.config:
-            self.config["saved_content"] = []
-        self.config["saved_content"].append(item)
-        self.save() 
+    def add_to_cache(self, item, record=None):
+        get_store(self).put(item, record)
+        CATALOGUE_WRITES.inc(op="put")
+
+    def remove_from_cache(self, item):
+        get_store(self).remove(item)
+        CATALOGUE_WRITES.inc(op="remove")
+
+    def flush_cache(self):
+        with CATALOGUE_FLUSH.time():
+            get_store(self).flush()
 
     def save(self):
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        # Write to a temporary file first so a crash never leaves a truncated config.
+        with CONFIG_SAVE.time():
+            tmp_file = f"{CONFIG_FILE}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, CONFIG_FILE)
+
+    def migrate_saved_content(self, store):
+        """Move a legacy saved_content list out of config.json into the catalogue store."""
+        if "saved_content" not in self.config:
+            return
+        for item in self.config.pop("saved_content"):
+            store.put(item)
+        store.flush()
+        self.save()
 
     def get_cache(self):
-        return self.config.get("saved_content", [])
+        return list(get_store(self).load())
+
+    def get_cache_records(self):
+        return get_store(self).load()
+
+    def reload_cache_records(self):
+        return get_store(self).reload()
+
+    def get_cache_version(self):
+        return get_store(self).version()
+
+    def get_cache_meta(self):
+        return get_store(self).meta()
+
+    def cache_transaction(self):
+        return get_store(self).transaction()
 
     def get_cache_dirs(self):
-        return self.config.get("cache_dirs", [])
+        return self.config.get("cache_dirs", [APT_ARCHIVES_DIR])
+
+    def get_port(self):
+        return self.config.get("port", DEFAULT_PORT)
 
     def get_cache_age(self):
-        return self.config.get("cache_age", 2592000)  # Default to 30 days if not set
\ No newline at end of file
+        return self.config.get("cache_age", 2592000)  # Default to 30 days if not set
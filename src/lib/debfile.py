@@ -0,0 +1,131 @@
+"""Read control metadata from .deb files without dpkg."""
+import io
+import lzma
+import tarfile
+import threading
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+# Control fields a client needs to plan an install, and the keys they are sent under.
+RELATION_FIELDS = {"Pre-Depends": "pre_depends", "Depends": "depends", "Provides": "provides"}
+
+
+class DebError(Exception):
+    """Raised when a file is not a readable .deb package."""
+
+
+def _ar_members(f):
+    """Yield (name, size) for each ar member, leaving ``f`` at the member's data."""
+    if f.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise DebError("not an ar archive")
+    while True:
+        header = f.read(AR_HEADER_SIZE)
+        if len(header) < AR_HEADER_SIZE:
+            return
+        name = header[0:16].decode("ascii", "replace").strip().rstrip("/")
+        try:
+            size = int(header[48:58].decode("ascii").strip())
+        except ValueError:
+            raise DebError("corrupt ar header")
+        start = f.tell()
+        yield name, size
+        # Members are padded to an even offset.
+        f.seek(start + size + (size % 2))
+
+
+def _open_control_tar(name, data):
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise DebError("zstd-compressed control archive needs the zstandard module")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return tarfile.open(fileobj=io.BytesIO(data), mode="r:")
+    if name.endswith(".xz"):
+        data = lzma.decompress(data)
+        return tarfile.open(fileobj=io.BytesIO(data), mode="r:")
+    return tarfile.open(fileobj=io.BytesIO(data), mode="r:*")
+
+
+def read_control_text(path):
+    """Return the raw text of a package's DEBIAN/control file."""
+    with open(path, "rb") as f:
+        for name, size in _ar_members(f):
+            if not name.startswith("control.tar"):
+                continue
+            with _open_control_tar(name, f.read(size)) as tar:
+                for member in tar.getmembers():
+                    if member.name in ("./control", "control"):
+                        return tar.extractfile(member).read().decode("utf-8", "replace")
+            raise DebError("control archive has no control file")
+    raise DebError("no control archive")
+
+
+def parse_control(text):
+    """Parse a deb822 stanza into an ordered {field: value} dict."""
+    fields = {}
+    current = None
+    for line in text.splitlines():
+        if not line.strip():
+            if fields:
+                break
+            continue
+        if line[0] in " \t" and current is not None:
+            fields[current] += "\n" + line
+            continue
+        key, sep, value = line.partition(":")
+        if sep:
+            current = key.strip()
+            fields[current] = value.strip()
+    return fields
+
+
+def read_control(path):
+    """Return the control fields of a .deb as a dict."""
+    try:
+        return parse_control(read_control_text(path))
+    except (OSError, tarfile.TarError, lzma.LZMAError, EOFError) as e:
+        raise DebError(str(e))
+
+
+def relations(fields):
+    """Return the dependency-related control fields as a {key: value} dict for the API."""
+    fields = fields or {}
+    return {key: " ".join(fields.get(field, "").split()) for field, key in RELATION_FIELDS.items()}
+
+
+class ControlCache:
+    """Control fields of ingested packages keyed by SHA256, so each .deb is read once.
+
+    Entries persist in a catalogue-style store (see src/lib/store.py), so a
+    restart does not re-read every archive.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._fields = store.load()
+
+    def get(self, digest, path):
+        """Return control fields for a blob, reading the .deb on first use. None if unreadable."""
+        with self._lock:
+            fields = self._fields.get(digest)
+        if fields is not None:
+            return fields
+
+        try:
+            fields = read_control(path)
+        except DebError:
+            return None
+        with self._lock:
+            self._fields[digest] = fields
+        self.store.put(digest, fields)
+        return fields
+
+    def peek(self, digest):
+        """Return cached control fields without touching the disk."""
+        with self._lock:
+            return self._fields.get(digest)
@@ -0,0 +1,62 @@
+"""Coalesce bursts of events into a single deferred callback."""
+import threading
+import time
+
+from src.lib.logger import Logger
+
+
+logger = Logger("Debouncer")
+
+
+class Debouncer:
+    """Run ``callback`` once triggers have been quiet for ``delay`` seconds.
+
+    A steady stream of triggers still fires at least every ``max_delay``
+    seconds. Triggering is cheap (a lock and two assignments), so it can be
+    called for every change on a hot path.
+    """
+
+    def __init__(self, callback, delay, max_delay=None, name="debouncer"):
+        self.callback = callback
+        self.delay = delay
+        self.max_delay = max_delay
+        self.name = name
+        self._cond = threading.Condition()
+        self._callback_lock = threading.Lock()
+        self._first_trigger = None
+        self._last_trigger = None
+        self._thread = None
+
+    def trigger(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._first_trigger is None:
+                self._first_trigger = now
+            self._last_trigger = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _due_in(self, now):
+        due = self._last_trigger + self.delay
+        if self.max_delay is not None:
+            due = min(due, self._first_trigger + self.max_delay)
+        return due - now
+
+    def _run(self):
+        with self._cond:
+            while True:
+                wait = self._due_in(time.monotonic())
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            self._first_trigger = None
+            self._last_trigger = None
+            self._thread = None
+
+        # Serialise callbacks in case a new burst fires while a slow one is still running.
+        with self._callback_lock:
+            try:
+                self.callback()
+            except Exception:
+                logger.exception(f"{self.name} callback failed")
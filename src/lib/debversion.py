@@ -0,0 +1,72 @@
+"""Debian version comparison (as in deb-version(7) and dpkg --compare-versions)."""
+import functools
+from urllib.parse import unquote
+
+
+def parse_version(version):
+    """Split a version into (epoch, upstream, revision).
+
+    Filenames in apt's archive directory encode the epoch colon as ``%3a``,
+    so the version is unquoted first.
+    """
+    version = unquote(version)
+    epoch, sep, rest = version.partition(":")
+    if not sep:
+        epoch, rest = "0", version
+    upstream, sep, revision = rest.rpartition("-")
+    if not sep:
+        upstream, revision = rest, "0"
+    return int(epoch or 0), upstream, revision
+
+
+def _order(char):
+    if char == "~":
+        return -1
+    if char.isdigit():
+        return 0
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _compare_part(a, b):
+    i = j = 0
+    while i < len(a) or j < len(b):
+        first_diff = 0
+        # Compare the non-digit prefix character by character.
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = _order(a[i]) if i < len(a) else 0
+            bc = _order(b[j]) if j < len(b) else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        # Then the digit run numerically.
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and a[i].isdigit():
+            return 1
+        if j < len(b) and b[j].isdigit():
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def compare_versions(a, b):
+    """Return a negative, zero or positive number as version ``a`` is lower, equal or higher than ``b``."""
+    a_epoch, a_upstream, a_revision = parse_version(a)
+    b_epoch, b_upstream, b_revision = parse_version(b)
+    if a_epoch != b_epoch:
+        return a_epoch - b_epoch
+    return _compare_part(a_upstream, b_upstream) or _compare_part(a_revision, b_revision)
+
+
+version_key = functools.cmp_to_key(compare_versions)
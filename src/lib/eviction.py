@@ -0,0 +1,249 @@
+"""Cache eviction for the LocalSync content store.
+
+A background pass runs every ``eviction_interval`` seconds and removes, at
+most ``EVICTION_BATCH`` packages at a time:
+
+- packages whose every source file has disappeared,
+- packages not downloaded (or ingested) for longer than ``cache_age``,
+- versions beyond the newest ``keep_versions`` of each package,
+- the least recently (``lru``) or least frequently (``lfu``) downloaded
+  packages while the store is over ``cache_max_bytes``.
+
+Evicting a package drops it from the index and, once nothing refers to
+it any more, deletes its blob and chunk manifest. Its source files belong
+to apt (or the proxy cache) and stay where they are; the catalogue keeps
+them marked as evicted so they are not ingested again unless they
+change. With ``evict_sources`` the source files are deleted as well.
+"""
+import os
+import threading
+import time
+
+from src.lib.debversion import version_key
+from src.lib.logger import Logger
+
+
+logger = Logger("CacheEvictor")
+
+EVICTION_POLICIES = ("lru", "lfu")
+DEFAULT_EVICTION_INTERVAL = 300
+# Upper bound on packages removed per pass, so one pass never holds things up for long.
+EVICTION_BATCH = 200
+
+
+class AccessStats:
+    """Download count, last download and first ingest time per blob digest."""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._stats = store.load()
+
+    def _update(self, digest, **changes):
+        with self._lock:
+            entry = dict(self._stats.get(digest) or {"hits": 0, "last": None, "added": time.time()})
+            entry.update(changes)
+            self._stats[digest] = entry
+        self.store.put(digest, entry)
+        return entry
+
+    def added(self, digest):
+        """Note that a blob entered the store; keeps the earliest time."""
+        with self._lock:
+            if digest in self._stats:
+                return
+        self._update(digest)
+
+    def record(self, digest):
+        """Count one download of a blob."""
+        with self._lock:
+            hits = (self._stats.get(digest) or {}).get("hits", 0)
+        self._update(digest, hits=hits + 1, last=time.time())
+
+    def get(self, digest):
+        with self._lock:
+            return self._stats.get(digest)
+
+    def forget(self, digest):
+        with self._lock:
+            if self._stats.pop(digest, None) is None:
+                return
+        self.store.remove(digest)
+
+    def last_used(self, digest, default):
+        entry = self.get(digest) or {}
+        return entry.get("last") or entry.get("added") or default
+
+    def hits(self, digest):
+        return (self.get(digest) or {}).get("hits", 0)
+
+
+class CacheEvictor:
+    """Keeps the content store within the configured age, version and size limits."""
+
+    def __init__(self, cache_event_handler, max_bytes=None, max_age=None, keep_versions=None,
+                 policy="lru", interval=DEFAULT_EVICTION_INTERVAL, evict_sources=False):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.handler = cache_event_handler
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep_versions = keep_versions
+        self.policy = policy
+        self.interval = interval
+        self.evict_sources = evict_sources
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.evicted = 0
+        self.bytes_freed = 0
+        self.last_run = None
+
+    @classmethod
+    def from_config(cls, cache_event_handler):
+        config = cache_event_handler.config
+        max_age = config.get_cache_age()
+        if max_age and (config.get("workers") or 1) > 1:
+            # Worker processes serve the downloads but cannot record them, so every package would look idle.
+            logger.warning("Age-based eviction is disabled with several workers: downloads are not counted")
+            max_age = None
+        return cls(
+            cache_event_handler,
+            max_bytes=config.get("cache_max_bytes"),
+            max_age=max_age,
+            keep_versions=config.get("keep_versions"),
+            policy=config.get("eviction_policy") or "lru",
+            interval=config.get("eviction_interval") or DEFAULT_EVICTION_INTERVAL,
+            evict_sources=bool(config.get("evict_sources")),
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="evict", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                # Keep going in batches while there is work left, yielding between them.
+                while self.run_once() >= EVICTION_BATCH and not self._stop.wait(1):
+                    pass
+            except Exception:
+                logger.exception("Eviction pass failed")
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "evicted": self.evicted,
+                "bytes_freed": self.bytes_freed,
+                "last_run": self.last_run,
+                "policy": self.policy,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+                "keep_versions": self.keep_versions,
+                "evict_sources": self.evict_sources,
+            }
+
+    def _usage_key(self, record):
+        """Sort key putting the first package to evict first."""
+        last = self.handler.access.last_used(record["sha256"], self.started)
+        if self.policy == "lfu":
+            return self.handler.access.hits(record["sha256"]), last
+        return last
+
+    def select(self, records, now=None):
+        """Return the records to evict this pass, in eviction order."""
+        now = now or time.time()
+        chosen = {}
+
+        def choose(record):
+            if len(chosen) < EVICTION_BATCH:
+                chosen.setdefault(record["filename"], record)
+
+        for record in records:
+            if not any(os.path.exists(path) for path in record["sources"]):
+                choose(record)
+        if self.max_age:
+            for record in records:
+                if now - self.handler.access.last_used(record["sha256"], self.started) > self.max_age:
+                    choose(record)
+        if self.keep_versions:
+            groups = {}
+            for record in records:
+                groups.setdefault((record["name"], record["architecture"]), []).append(record)
+            for group in groups.values():
+                group.sort(key=lambda record: version_key(record["version"]), reverse=True)
+                for record in group[self.keep_versions:]:
+                    choose(record)
+        if self.max_bytes:
+            sizes = {record["sha256"]: record["size"] or 0 for record in records}
+            for record in chosen.values():
+                sizes.pop(record["sha256"], None)
+            total = sum(sizes.values())
+            for record in sorted(records, key=self._usage_key):
+                if total <= self.max_bytes or len(chosen) >= EVICTION_BATCH:
+                    break
+                if record["filename"] not in chosen:
+                    choose(record)
+                    total -= sizes.pop(record["sha256"], 0)
+        return list(chosen.values())
+
+    def run_once(self):
+        """Run one eviction pass. Returns the number of packages evicted."""
+        records = [record for record in self.handler.index.records() if record.get("sha256")]
+        references = {}
+        for record in records:
+            references[record["sha256"]] = references.get(record["sha256"], 0) + 1
+
+        evicted = 0
+        freed = 0
+        for record in self.select(records):
+            if not self.evict(record):
+                continue
+            evicted += 1
+            references[record["sha256"]] -= 1
+            if references[record["sha256"]] == 0 and self.remove_blob(record["sha256"]):
+                freed += record["size"] or 0
+
+        if evicted:
+            self.handler.config.flush_cache()
+            logger.info(f"Evicted {evicted} packages, freed {freed} bytes")
+        with self._lock:
+            self.evicted += evicted
+            self.bytes_freed += freed
+            self.last_run = time.time()
+        return evicted
+
+    def remove_blob(self, digest):
+        """Delete a blob and its manifest unless a package refers to it again. True if it was deleted."""
+        # Ingestion holds the same lock from storing a blob until the index refers to it.
+        with self.handler.blobs.lock(digest):
+            if self.handler.index.has_digest(digest):
+                return False
+            removed = self.handler.blobs.remove(digest)
+            self.handler.manifests.remove(digest)
+        self.handler.access.forget(digest)
+        return removed
+
+    def evict(self, record):
+        """Drop a package from the index. False if a source file could not be deleted."""
+        for path in record["sources"]:
+            if not os.path.exists(path):
+                self.handler.remove(path)
+                continue
+            if not self.evict_sources:
+                self.handler.mark_evicted(path, record["sha256"], record["size"])
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Could not evict {path}: {e}")
+                return False
+            self.handler.remove(path)
+        return True
@@ -0,0 +1,244 @@
+"""In-memory package index for the LocalSync cache."""
+import os
+import threading
+import uuid
+from collections import deque
+
+# Number of changes kept for delta responses; older clients get a full listing.
+JOURNAL_SIZE = 10000
+
+
+def parse_deb_filename(path):
+    """Split a .deb path into (name, version, architecture), or None if malformed."""
+    parts = os.path.basename(path).replace(".deb", "").split("_")
+    if len(parts) < 3:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+class PackageIndex:
+    """Resident index of cached packages keyed by name -> version -> architecture.
+
+    Each leaf is a record holding the .deb filename, its SHA256 digest and
+    size, and the set of source paths it was seen at, so the same package
+    found in several cache directories is listed once.
+
+    Every change bumps ``generation`` and is written to a bounded journal,
+    so clients can ask for what changed since the generation they hold.
+    ``epoch`` identifies this run of the server: generations from another
+    epoch are meaningless and get a full listing. Server worker processes
+    ``follow`` the primary's epoch and generation, so every process of one
+    server answers deltas in the same numbering.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.generation = 0
+        self._journal = deque(maxlen=JOURNAL_SIZE)
+        # The journal holds every change after this generation.
+        self._journal_base = 0
+        self._followed = 0
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._packages = {}
+        self._sources = {}
+        self._filenames = {}
+        self._digests = {}
+        self._count = 0
+        self._formatted = None
+
+    def add(self, path, sha256=None, size=None):
+        """Add a source path to the index. Returns False if it is not a valid .deb name."""
+        key = parse_deb_filename(path)
+        if key is None:
+            return False
+
+        name, version, architecture = key
+        with self._lock:
+            if self._sources.get(path) == key:
+                # Same file seen again: only a changed digest is worth telling clients about.
+                record = self._packages[name][version][architecture]
+                if sha256 is not None and record.get("sha256") != sha256:
+                    self._set_digest(record, sha256, size)
+                    self._record_change("add", key)
+                return True
+            if path in self._sources:
+                self.remove(path)
+            versions = self._packages.setdefault(name, {})
+            architectures = versions.setdefault(version, {})
+            record = architectures.get(architecture)
+            if record is None:
+                record = {"filename": os.path.basename(path), "sources": set()}
+                architectures[architecture] = record
+                self._filenames[record["filename"]] = record
+                self._count += 1
+                self._formatted = None
+                self._record_change("add", key)
+            if sha256 is not None:
+                self._set_digest(record, sha256, size)
+            record["sources"].add(path)
+            self._sources[path] = key
+        return True
+
+    def remove(self, path):
+        """Remove a source path, dropping the package once no source is left."""
+        with self._lock:
+            key = self._sources.pop(path, None)
+            if key is None:
+                return False
+
+            name, version, architecture = key
+            versions = self._packages[name]
+            record = versions[version][architecture]
+            record["sources"].discard(path)
+            if not record["sources"]:
+                self._release_digest(record.get("sha256"))
+                del versions[version][architecture]
+                del self._filenames[record["filename"]]
+                if not versions[version]:
+                    del versions[version]
+                if not versions:
+                    del self._packages[name]
+                self._count -= 1
+                self._formatted = None
+                self._record_change("remove", key)
+        return True
+
+    def _set_digest(self, record, sha256, size):
+        """Point a package record at a blob, keeping the per-digest reference counts."""
+        self._release_digest(record.get("sha256"))
+        if sha256 is not None:
+            self._digests[sha256] = self._digests.get(sha256, 0) + 1
+        record["sha256"] = sha256
+        record["size"] = size
+
+    def _release_digest(self, sha256):
+        if sha256 is not None:
+            self._digests[sha256] -= 1
+            if not self._digests[sha256]:
+                del self._digests[sha256]
+
+    def has_digest(self, sha256):
+        """True while any package refers to the blob."""
+        with self._lock:
+            return sha256 in self._digests
+
+    def add_listener(self, listener):
+        """Call ``listener(op, key)`` after every change; it must be cheap and must not block."""
+        self._listeners.append(listener)
+
+    def _record_change(self, op, key):
+        self.generation += 1
+        if len(self._journal) == self._journal.maxlen:
+            self._journal_base = self._journal[0][0]
+        self._journal.append((self.generation, op, key))
+        for listener in self._listeners:
+            listener(op, key)
+
+    def follow(self, epoch, generation):
+        """Adopt another index's epoch and generation after applying its changes.
+
+        Changes made since the last call are renumbered to ``generation``:
+        they happened somewhere between the generation followed before and
+        this one, so a client at any generation in between gets them all.
+        """
+        with self._lock:
+            if epoch != self.epoch:
+                self.epoch = epoch
+                self._journal.clear()
+                self._journal_base = generation
+            else:
+                for i in range(len(self._journal) - 1, -1, -1):
+                    change_generation, op, key = self._journal[i]
+                    if change_generation <= self._followed:
+                        break
+                    self._journal[i] = (generation, op, key)
+            self.generation = generation
+            self._followed = generation
+
+    def changes_since(self, generation):
+        """Return (current generation, added, removed) since ``generation``.
+
+        Returns None if the journal no longer covers that generation.
+        """
+        with self._lock:
+            if generation > self.generation or generation < self._journal_base:
+                return None
+
+            # Collapse the journal to the last change per package. A package removed and
+            # added again (or re-added with a new digest) is sent as added, so the client
+            # replaces what it holds; one added and removed again is sent as removed.
+            net = {}
+            for change_generation, op, key in self._journal:
+                if change_generation > generation:
+                    net[key] = op
+            added = [list(key) for key, op in net.items() if op == "add"]
+            removed = [list(key) for key, op in net.items() if op == "remove"]
+            return self.generation, added, removed
+
+    def get(self, package_name):
+        """Return every cached version/architecture of a package."""
+        with self._lock:
+            versions = self._packages.get(package_name, {})
+            return [
+                {
+                    "name": package_name,
+                    "version": version,
+                    "architecture": architecture,
+                    "sha256": record.get("sha256"),
+                    "size": record.get("size"),
+                }
+                for version, architectures in versions.items()
+                for architecture, record in architectures.items()
+            ]
+
+    def records(self):
+        """Return a copy of every package record, with its name, version and architecture."""
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "version": version,
+                    "architecture": architecture,
+                    "filename": record["filename"],
+                    "sha256": record.get("sha256"),
+                    "size": record.get("size"),
+                    "sources": list(record["sources"]),
+                }
+                for name, versions in self._packages.items()
+                for version, architectures in versions.items()
+                for architecture, record in architectures.items()
+            ]
+
+    def find(self, name, version, architecture):
+        """Return the record for one package version and architecture, or None."""
+        with self._lock:
+            return self._packages.get(name, {}).get(version, {}).get(architecture)
+
+    def lookup(self, filename):
+        """Return the record for a .deb filename, or None."""
+        with self._lock:
+            return self._filenames.get(filename)
+
+    def formatted(self):
+        """Return all packages as [name, version, architecture] rows."""
+        with self._lock:
+            if self._formatted is None:
+                self._formatted = [
+                    [name, version, architecture]
+                    for name, versions in self._packages.items()
+                    for version, architectures in versions.items()
+                    for architecture in architectures
+                ]
+            return self._formatted
+
+    def snapshot(self):
+        """Return (generation, rows) read consistently."""
+        with self._lock:
+            return self.generation, self.formatted()
+
+    def __contains__(self, path):
+        return path in self._sources
+
+    def __len__(self):
+        return self._count
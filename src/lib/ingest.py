@@ -0,0 +1,179 @@
+"""In-process ingestion of cached .deb files into the content directory.
+
+Files are brought in with the cheapest strategy the filesystem allows:
+
+1. ``hardlink`` - share the inode with the source; no data is copied.
+2. ``reflink`` - copy-on-write clone (btrfs, XFS, ...); no data is copied.
+3. ``copy_file_range`` - in-kernel copy without a round trip through user space.
+4. ``copy`` - plain streamed copy.
+
+apt replaces archives by renaming a finished download over the target, so
+a hardlinked content file never sees a partially written package.
+"""
+import fcntl
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+
+from src.lib.logger import Logger
+
+
+logger = Logger("Ingest")
+
+# ioctl request number for FICLONE from <linux/fs.h>.
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 1024 * 1024
+
+INGEST_MODES = ("auto", "hardlink", "reflink", "copy_file_range", "copy")
+
+
+@dataclass
+class IngestResult:
+    """Outcome of ingesting a single file."""
+    path: str
+    strategy: str
+    size: int
+    bytes_saved: int
+
+
+class IngestStats:
+    """Running totals of ingestion strategies and bytes saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.strategies = {}
+        self.files = 0
+        self.bytes_ingested = 0
+        self.bytes_saved = 0
+
+    def record(self, result):
+        with self._lock:
+            self.strategies[result.strategy] = self.strategies.get(result.strategy, 0) + 1
+            self.files += 1
+            self.bytes_ingested += result.size
+            self.bytes_saved += result.bytes_saved
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "files": self.files,
+                "strategies": dict(self.strategies),
+                "bytes_ingested": self.bytes_ingested,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+class IngestProgress:
+    """Progress of a background ingestion run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "idle"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self, total):
+        with self._lock:
+            self.state = "running"
+            self.total = total
+            self.done = 0
+            self.failed = 0
+            self.started_at = time.time()
+            self.finished_at = None
+
+    def advance(self, ok):
+        with self._lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    def finish(self):
+        with self._lock:
+            self.state = "complete"
+            self.finished_at = time.time()
+
+    def as_dict(self):
+        with self._lock:
+            processed = self.done + self.failed
+            return {
+                "state": self.state,
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "percent": round(100.0 * processed / self.total, 1) if self.total else 100.0,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+def _hardlink(src, tmp_path):
+    os.link(src, tmp_path)
+
+
+def _reflink(src, tmp_path):
+    with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy_file_range(src, tmp_path):
+    with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+        if remaining > 0:
+            raise OSError(f"copy_file_range stopped with {remaining} bytes left")
+
+
+def _stream_copy(src, tmp_path):
+    with open(src, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+
+STRATEGIES = [
+    ("hardlink", _hardlink, True),
+    ("reflink", _reflink, True),
+    ("copy_file_range", _copy_file_range, False),
+    ("copy", _stream_copy, False),
+]
+
+
+def ingest_file(src, dest_path, mode="auto"):
+    """Place ``src`` at ``dest_path`` using the cheapest available strategy.
+
+    ``mode`` is ``auto`` to try every strategy in order, or the name of a
+    single strategy to use. The destination is replaced atomically.
+    Returns an IngestResult.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+
+    size = os.path.getsize(src)
+    # Unique per thread so concurrent ingests of identical content never share a temp file.
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+    candidates = STRATEGIES if mode == "auto" else [s for s in STRATEGIES if s[0] == mode]
+
+    last_error = None
+    for name, strategy, saves_space in candidates:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        try:
+            strategy(src, tmp_path)
+        except (OSError, AttributeError) as e:
+            # AttributeError covers os.copy_file_range missing on non-Linux platforms.
+            last_error = e
+            continue
+        os.replace(tmp_path, dest_path)
+        return IngestResult(dest_path, name, size, size if saves_space else 0)
+
+    if os.path.lexists(tmp_path):
+        os.unlink(tmp_path)
+    raise OSError(f"Could not ingest {src}: {last_error}")
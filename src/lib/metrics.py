@@ -0,0 +1,176 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+A small, dependency-free subset of what ``prometheus_client`` offers:
+metrics register themselves in ``REGISTRY`` when created and
+``REGISTRY.render()`` produces the body for ``/metrics``. Every server
+process keeps its own values.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; from sub-millisecond index lookups to multi-second ingests.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Metrics by name, rendered in registration order."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        # Re-creating a metric (e.g. building the app twice) replaces the old one.
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from ``func`` at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), func=None, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.func = func
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.func is not None:
+            return [f"{self.name} {_format_value(self.func())}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their count and sum."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in a ``with`` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return entry[1] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, count, total) in values:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
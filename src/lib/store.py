@@ -0,0 +1,316 @@
+"""Persistent stores for the cache catalogue.
+
+The catalogue (which .deb files have been ingested and what we know about
+them) is kept apart from the user settings in config.json. Two backends are
+available and selected with the ``cache_store`` setting:
+
+- ``log`` (default): an append-only JSON-lines journal that is compacted
+  into a fresh snapshot once it holds mostly superseded entries.
+- ``sqlite``: a SQLite database in WAL mode.
+
+Both buffer writes and commit them in batches, so ingesting thousands of
+packages costs a handful of fsyncs instead of one full rewrite per package.
+The writer can attach metadata (the index epoch and generation) to every
+batch, so processes reading the store know which state it reflects.
+"""
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.lib.logger import Logger
+
+
+logger = Logger("CacheStore")
+
+
+class CacheStore(abc.ABC):
+    """Key/record store for catalogue entries with batched writes.
+
+    Queued operations are written once ``batch_size`` of them accumulate,
+    and at the latest ``flush_interval`` seconds after the first one.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=2.0, read_only=False):
+        self.batch_size = batch_size
+        self.read_only = read_only
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._meta = None
+        self._meta_source = None
+
+    @abc.abstractmethod
+    def load(self):
+        """Return every stored entry as a {key: record} dict."""
+
+    def reload(self):
+        """Like load(), but re-read what other processes may have written."""
+        return self.load()
+
+    @abc.abstractmethod
+    def version(self):
+        """Return a token that changes whenever another process commits to the store."""
+
+    def meta(self):
+        """Metadata written with the last batch, as of the last load() or reload()."""
+        return self._meta
+
+    def set_meta_source(self, func):
+        """Write ``func()`` with every batch from now on."""
+        self._meta_source = func
+
+    def transaction(self):
+        """Lock to hold while queueing a change together with the state ``func()`` describes.
+
+        A batch is never written in between, so its metadata counts exactly
+        the changes it contains.
+        """
+        return self._lock
+
+    def write_meta(self):
+        """Write the current metadata now, even without pending changes."""
+        if self._meta_source is not None and not self.read_only:
+            with self._lock:
+                self._pending.append(("meta", None, self._meta_source()))
+                self.flush()
+
+    def put(self, key, record=None):
+        """Queue an insert or update of a catalogue entry."""
+        self._queue(("put", key, record or {}))
+
+    def remove(self, key):
+        """Queue the removal of a catalogue entry."""
+        self._queue(("del", key, None))
+
+    def flush(self):
+        """Write all queued operations to disk."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                # Read under the lock: every change the metadata counts was queued before it.
+                if self._meta_source is not None:
+                    self._pending.append(("meta", None, self._meta_source()))
+                self._write(self._pending)
+                self._pending = []
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def _queue(self, op):
+        # Read-only stores (server worker processes) leave writing to the primary process.
+        if self.read_only:
+            return
+        with self._lock:
+            self._pending.append(op)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+            elif self._timer is None:
+                # Without further updates nothing else would write this batch out.
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    @abc.abstractmethod
+    def _write(self, ops):
+        """Apply queued (kind, key, record) operations to disk."""
+
+
+class LogCacheStore(CacheStore):
+    """Append-only JSON-lines journal with periodic compaction."""
+
+    def __init__(self, path, compact_ratio=2.0, compact_min=1000, **kwargs):
+        super().__init__(**kwargs)
+        # Resolved now: a batch written after a chdir still goes to this file.
+        self.path = os.path.abspath(path)
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._entries = None
+        self._log_lines = 0
+
+    def load(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read()
+            return dict(self._entries)
+
+    def reload(self):
+        with self._lock:
+            self._entries = None
+            self._log_lines = 0
+            return self.load()
+
+    def version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _read(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        ops = []
+        for line in data[:complete].splitlines():
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring corrupt line in {self.path}")
+        if self.read_only:
+            # Changes after the last metadata line belong to a batch still being appended.
+            last_meta = max((i for i, op in enumerate(ops) if op.get("op") == "meta"), default=len(ops) - 1)
+            ops = ops[:last_meta + 1]
+        for op in ops:
+            self._apply(entries, op)
+        if complete < len(data):
+            self._repair_tail(entries, data[complete:], complete)
+        return entries
+
+    def _apply(self, entries, op):
+        self._log_lines += 1
+        if op.get("op") == "meta":
+            self._meta = op.get("meta")
+        elif op.get("op") == "del":
+            entries.pop(op["key"], None)
+        else:
+            entries[op["key"]] = op.get("record", {})
+
+    def _repair_tail(self, entries, tail, complete):
+        """Deal with a last line that has no newline, left by a crash mid-append.
+
+        The next append would be glued onto it and lost as well, so a
+        complete record gets its newline and a torn one is cut off.
+        """
+        if self.read_only:
+            # Most likely the writer is appending right now; it repairs the file when it loads it.
+            return
+        try:
+            op = json.loads(tail)
+        except ValueError:
+            op = None
+        if not isinstance(op, dict):
+            op = None
+        if op is not None:
+            self._apply(entries, op)
+            with open(self.path, "ab") as f:
+                f.write(b"\n")
+        else:
+            logger.warning(f"Truncating torn last line of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(complete)
+
+    def _write(self, ops):
+        entries = self._entries if self._entries is not None else self._read()
+        lines = []
+        for kind, key, record in ops:
+            if kind == "meta":
+                self._meta = record
+                lines.append(json.dumps({"op": "meta", "meta": record}))
+            elif kind == "del":
+                entries.pop(key, None)
+                lines.append(json.dumps({"op": "del", "key": key}))
+            else:
+                entries[key] = record
+                lines.append(json.dumps({"op": "put", "key": key, "record": record}))
+        self._entries = entries
+
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_lines += len(lines)
+
+        if (self._log_lines >= self.compact_min
+                and self._log_lines > self.compact_ratio * max(len(entries), 1)):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the journal as a snapshot of the live entries."""
+        with self._lock:
+            entries = self._entries if self._entries is not None else self._read()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for key, record in entries.items():
+                    f.write(json.dumps({"op": "put", "key": key, "record": record}) + "\n")
+                if self._meta is not None:
+                    f.write(json.dumps({"op": "meta", "meta": self._meta}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._log_lines = len(entries)
+            logger.info(f"Compacted {self.path} to {len(entries)} entries")
+
+
+class SqliteCacheStore(CacheStore):
+    """SQLite-backed store running in WAL mode."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, record TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY, meta TEXT NOT NULL)")
+        self._conn.commit()
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, record FROM entries").fetchall()
+            meta = self._conn.execute("SELECT meta FROM meta WHERE id = 0").fetchone()
+        if meta is not None:
+            self._meta = json.loads(meta[0])
+        return {key: json.loads(record) for key, record in rows}
+
+    def version(self):
+        # data_version changes whenever another connection commits.
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _write(self, ops):
+        with self._conn:
+            for kind, key, record in ops:
+                if kind == "meta":
+                    self._meta = record
+                    self._conn.execute("INSERT OR REPLACE INTO meta (id, meta) VALUES (0, ?)", (json.dumps(record),))
+                elif kind == "del":
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, record) VALUES (?, ?)",
+                        (key, json.dumps(record)),
+                    )
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+
+STORE_BACKENDS = {
+    "log": LogCacheStore,
+    "sqlite": SqliteCacheStore,
+}
+
+
+def open_store(backend, path, **kwargs):
+    """Open a catalogue store for the given backend name."""
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown cache store backend: {backend}")
+    return STORE_BACKENDS[backend](path, **kwargs)
@@ -1,4 +1,11 @@
 """LocalSync server package."""
-from .server import app
 
-__all__ = ['app']
\ No newline at end of file
+__all__ = ['app']
+
+
+def __getattr__(name):
+    # Build the application only when it is asked for, not on package import.
+    if name == "app":
+        from .server import get_app
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,20 @@
 """API endpoints for LocalSync server."""
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
+import anyio
 import socket
 import os
+from typing import Optional
+from src.lib.apt_repo import POOL_PREFIX
 from src.lib.cache import CacheEventHandler
+from src.lib.metrics import REGISTRY
+from .federation import merge_federated
+from .file_serving import serve_file
+from .throttle import ServingLimits
 from .network_utils import get_ip_list
-from .mdns_service import SERVICE_PORT, is_mdns_registered
+from .wire import EncodedCache, negotiated_response
+from .mdns_service import is_mdns_registered
 
 
 class FileRequest(BaseModel):
@@ -14,52 +22,200 @@ class FileRequest(BaseModel):
     filename: str
 
 
-def setup_api_routes(app: FastAPI, cache_event_handler: CacheEventHandler):
-    """Setup API routes for the FastAPI application."""
+class PackagesRequest(BaseModel):
+    """Request model for batched package lookups."""
+    names: list[str]
+
+
+def setup_api_routes(app: FastAPI, cache_event_handler: CacheEventHandler, apt_repository=None, evictor=None,
+                     limits=None, federation=None, profiler=None):
+    """Setup API routes for the FastAPI application.
+
+    Handlers are async. Blocking metadata work runs on the metadata thread
+    budget of ``limits`` and file bodies are sent by BlobResponse, so large
+    downloads never hold up catalogue requests. With a ``federation``,
+    package lookups can also answer for every peer it mirrors. A
+    ``profiler`` is exposed under ``/api/profiler``.
+    """
     
+    cache_list_bodies = EncodedCache()
+    limits = limits or ServingLimits()
+
     @app.get("/api/cache-list")
-    def get_cache_list():
-        return cache_event_handler.get_formatted_content()
+    async def get_cache_list(request: Request, since: Optional[int] = None, epoch: Optional[str] = None,
+                             detail: bool = False):
+        """List cached packages; with ``since`` only the changes after that generation.
+
+        ``detail`` lists added packages with their digest, size and
+        dependency fields instead of bare rows; peers mirror catalogues this way.
+        """
+        return await limits.run_metadata(cache_list_response, request, since, epoch, detail)
+
+    def cache_list_response(request, since, epoch, detail=False):
+        describe = cache_event_handler.describe if detail else list
+        if since is None and not detail:
+            return cache_list_bodies.response(request, cache_event_handler.get_formatted_content())
+
+        index = cache_event_handler.index
+        changes = index.changes_since(since) if epoch == index.epoch else None
+        if changes is None:
+            generation, rows = index.snapshot()
+            return negotiated_response(request, {
+                "epoch": index.epoch,
+                "generation": generation,
+                "full": True,
+                "packages": describe(rows),
+            })
+        generation, added, removed = changes
+        return negotiated_response(request, {
+            "epoch": index.epoch,
+            "generation": generation,
+            "full": False,
+            "added": describe(added),
+            "removed": removed,
+        })
 
     @app.get("/api/server-info")
-    def get_server_info():
+    async def get_server_info():
         """Endpoint to get current server information"""
         return {
             "hostname": socket.gethostname(),
             "ips": get_ip_list(),
-            "port": SERVICE_PORT,
-            "package_count": len(cache_event_handler.get_formatted_content()),
-            "mdns_registered": is_mdns_registered()
+            "port": cache_event_handler.config.get_port(),
+            "package_count": len(cache_event_handler.index),
+            "epoch": cache_event_handler.index.epoch,
+            "generation": cache_event_handler.index.generation,
+            "mdns_registered": is_mdns_registered(),
+            "ingestion": {
+                **cache_event_handler.ingest_progress.as_dict(),
+                **cache_event_handler.ingest_stats.as_dict(),
+            },
+            "eviction": evictor.as_dict() if evictor is not None else None,
+            "federation": federation.as_dict() if federation is not None else None,
+            "serving": limits.as_dict(),
         }
 
 
+    @app.get("/metrics")
+    async def get_metrics():
+        """Server metrics in the Prometheus text format"""
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    if profiler is not None:
+        @app.get("/api/profiler")
+        async def get_profile(format: str = "summary", limit: int = 20):
+            """Profiler state and hottest functions, or ``format=folded`` stacks for a flame graph"""
+            if format == "folded":
+                return PlainTextResponse(profiler.folded())
+            return profiler.as_dict(limit)
+
+        @app.post("/api/profiler/start")
+        async def start_profiler(interval: Optional[float] = None, reset: bool = True):
+            """Start sampling every ``interval`` seconds, by default discarding earlier samples"""
+            if reset:
+                profiler.reset()
+            profiler.start(interval)
+            return profiler.as_dict(0)
+
+        @app.post("/api/profiler/stop")
+        async def stop_profiler():
+            """Stop sampling; the samples stay available until the next start"""
+            await anyio.to_thread.run_sync(profiler.stop)
+            return profiler.as_dict()
+
     @app.get("/api/pkg/{package_name}")
-    def get_package_info(package_name: str):
+    async def get_package_info(package_name: str, federated: bool = False):
         """Endpoint to get information about a specific package"""
-        package = cache_event_handler.get_package(package_name)
+        if federated and federation is not None:
+            return await limits.run_metadata(federated_package, package_name)
+        package = await limits.run_metadata(cache_event_handler.get_package, package_name)
         if package:
             return package
         return {"error": "Package not found"}
 
-    @app.post("/api/download")
-    def download_file(file_request: FileRequest):
-        """Download a file by filename provided in POST request body."""
-        filename = file_request.filename
-        
+    def federated_package(package_name):
+        """Every version of a package on this server and its peers, with who holds each file."""
+        return {
+            "packages": merge_federated(cache_event_handler.get_package(package_name), federation.lookup(package_name)),
+            "federated_peers": federation.peers(),
+        }
+
+    @app.post("/api/pkgs")
+    async def get_packages_info(packages_request: PackagesRequest, request: Request, federated: bool = False):
+        """Endpoint to look up many packages in one call; unknown names are omitted"""
+        return await limits.run_metadata(packages_response, packages_request, request, federated)
+
+    def packages_response(packages_request, request, federated=False):
+        federated = federated and federation is not None
+        peers = federation.peers() if federated else None
+        found = {}
+        for package_name in packages_request.names:
+            if federated:
+                package = federated_package(package_name)["packages"]
+            else:
+                package = cache_event_handler.get_package(package_name)
+            if package:
+                found[package_name] = package
+        if federated:
+            return negotiated_response(request, {"packages": found, "federated_peers": peers})
+        return negotiated_response(request, found)
+
+    def resolve_download(filename):
+        """Validate a requested filename and resolve it to (blob path, sha256)."""
         # Validate filename (basic security check)
         if not filename or '..' in filename or filename.startswith('/'):
             raise HTTPException(status_code=400, detail="Invalid filename")
         
-        # Construct file path
-        file_path = os.path.join("content", filename)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
+        # Resolve the filename to its content-addressed blob
+        resolved = cache_event_handler.resolve_file(filename)
+        if resolved is None:
             raise HTTPException(status_code=404, detail="File not found")
-        
-        # Return file response
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='application/octet-stream'
-        )
\ No newline at end of file
+        return resolved
+
+    async def download(request, filename, attachment_name=None):
+        file_path, digest = resolve_download(filename)
+        try:
+            response = await serve_file(request, file_path, digest, attachment_name, limits)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        # Downloads feed the eviction policy; HEAD probes do not count.
+        if request.method != "HEAD":
+            await limits.run_metadata(cache_event_handler.access.record, digest)
+        return response
+
+    @app.get("/api/manifest/{filename}")
+    async def get_manifest(filename: str, request: Request):
+        """Chunk manifest of a cached file, so clients can fetch only the chunks they lack."""
+        _, digest = resolve_download(filename)
+        manifest = await limits.run_metadata(cache_event_handler.manifest, digest)
+        if manifest is None:
+            raise HTTPException(status_code=404, detail="No manifest for this file")
+        return negotiated_response(request, {"sha256": digest, **manifest})
+
+    @app.post("/api/download")
+    async def download_file(file_request: FileRequest, request: Request):
+        """Download a file by filename provided in POST request body."""
+        filename = file_request.filename
+        return await download(request, filename, filename)
+
+    @app.api_route("/pool/{filename}", methods=["GET", "HEAD"])
+    async def get_pool_file(filename: str, request: Request):
+        """Download a file with HTTP caching and Range/If-Range support."""
+        return await download(request, filename)
+
+    @app.api_route("/apt/{path:path}", methods=["GET", "HEAD"])
+    async def get_apt_file(path: str, request: Request):
+        """Serve the flat apt repository: index files and pool/ packages."""
+        if apt_repository is None:
+            raise HTTPException(status_code=404, detail="apt repository disabled")
+
+        # apt may ask for "./Packages" when the source line uses the "./" suite
+        path = path.removeprefix("./")
+        if path.startswith(POOL_PREFIX):
+            return await download(request, path[len(POOL_PREFIX):])
+
+        index_path = apt_repository.path_for(path)
+        if index_path is None or not os.path.exists(index_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(index_path, media_type="application/octet-stream")
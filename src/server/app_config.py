@@ -4,9 +4,16 @@ from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 
+from src.lib.apt_repo import AptRepository
 from src.lib.cache import CacheEventHandler
+from src.lib.eviction import CacheEvictor
+from .federation import FEDERATION_FILE, Federation, FederationSnapshot
+from .instrumentation import MetricsMiddleware, register_gauges
+from .profiler import SamplingProfiler, install_signal_toggle
+from .proxy import DEFAULT_PROXY_MIRRORS, ProxyCache, ProxyMiddleware
 from .mdns_service import mDNS_register, mDNS_unregister
 from .api_routes import setup_api_routes
+from .throttle import ServingLimits
 
 
 @asynccontextmanager
@@ -17,25 +24,57 @@ async def lifespan(app: FastAPI):
     # Get cache event handler from app state
     cache_event_handler = app.state.cache_event_handler
     
-    # Run mDNS registration in executor to avoid blocking
-    loop = asyncio.get_event_loop()
-    service_info, _ = await loop.run_in_executor(None, lambda: mDNS_register(cache_event_handler))
-    
-    if service_info:
-        print("mDNS service registered successfully")
-    else:
-        print("Failed to register mDNS service")
+    # Register over mDNS in the background; the port is bound as soon as this yields.
+    # With several worker processes the primary process registers instead.
+    if not app.state.worker:
+        mDNS_register(cache_event_handler)
     
     yield
     
     print("Shutting down LocalSync server...")
-    await loop.run_in_executor(None, mDNS_unregister)
+    if isinstance(app.state.federation, Federation):
+        app.state.federation.stop()
+    if not app.state.worker:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, mDNS_unregister)
     print("Server shutdown complete")
 
 
-def create_app():
-    """Create and configure the FastAPI application."""
+def start_federation(config, snapshot_path=None):
+    """Start mirroring peer catalogues; with ``snapshot_path`` also write them there for workers."""
+    federation = Federation.from_config(config, snapshot_path=snapshot_path)
+    federation.start()
+    return federation
+
+
+def start_background_services(cache_event_handler):
+    """Start the services that write to the cache directory. Returns (apt repository, evictor)."""
+    config = cache_event_handler.config
+
+    # Publish the content store as an apt repository unless disabled in config
+    apt_repository = None
+    if config.get("apt_repository") is not False:
+        apt_repository = AptRepository(cache_event_handler)
+        apt_repository.start()
+
+    # Keep the content store within its age and size limits unless disabled in config
+    evictor = None
+    if config.get("eviction") is not False:
+        evictor = CacheEvictor.from_config(cache_event_handler)
+        evictor.start()
+
+    return apt_repository, evictor
+
+
+def create_app(worker=False):
+    """Create and configure the FastAPI application.
+
+    A ``worker`` app is one of several server processes: it serves a
+    read-only view of the catalogue, while the primary process owns
+    ingestion, the apt index, eviction and mDNS.
+    """
     app = FastAPI(lifespan=lifespan)
+    app.state.worker = worker
     
     # Add CORS middleware
     app.add_middleware(
@@ -47,10 +86,55 @@ def create_app():
     )
 
     # Initialize cache event handler
-    cache_event_handler = CacheEventHandler()
+    if worker:
+        cache_event_handler = CacheEventHandler(start_ingestion=False, read_only=True)
+        cache_event_handler.follow_catalogue()
+        apt_repository = None
+        if cache_event_handler.config.get("apt_repository") is not False:
+            apt_repository = AptRepository(cache_event_handler, publish=False)
+        evictor = None
+    else:
+        cache_event_handler = CacheEventHandler()
+        apt_repository, evictor = start_background_services(cache_event_handler)
     app.state.cache_event_handler = cache_event_handler
+    app.state.apt_repository = apt_repository
+    app.state.evictor = evictor
+
+    config = cache_event_handler.config
+    limits = ServingLimits.from_config(config)
+    app.state.limits = limits
+
+    # Act as a caching apt proxy when enabled in config
+    if config.get("proxy"):
+        if worker:
+            print("Proxy mode needs a single server process; ignoring \"proxy\" with several workers")
+        else:
+            app.add_middleware(
+                ProxyMiddleware, proxy_cache=ProxyCache(cache_event_handler), limits=limits,
+                port=config.get_port(), mirrors=config.get("proxy_mirrors") or DEFAULT_PROXY_MIRRORS,
+            )
     
+    # Mirror peer servers' catalogues so lookups can answer for the whole network, unless disabled in config
+    # (workers read the mirrors the primary process writes instead of syncing their own)
+    federation = None
+    if config.get("federation") is not False:
+        if worker:
+            federation = FederationSnapshot()
+        else:
+            federation = start_federation(config)
+    app.state.federation = federation
+
+    # Sampling profiler: SIGUSR2 toggles it, the HTTP endpoints only when enabled in config
+    profiler = SamplingProfiler()
+    install_signal_toggle(profiler)
+    app.state.profiler = profiler
+
     # Setup API routes
-    setup_api_routes(app, cache_event_handler)
+    setup_api_routes(app, cache_event_handler, apt_repository, evictor, limits, federation,
+                     profiler if config.get("profiler") else None)
+
+    # Outermost, so proxied requests and errors are measured too
+    register_gauges(cache_event_handler, limits, federation)
+    app.add_middleware(MetricsMiddleware)
     
-    return app
\ No newline at end of file
+    return app
@@ -0,0 +1,341 @@
+"""Catalogue federation between LocalSync servers.
+
+Each server finds its peers over the ``_localsync._tcp`` mDNS service (and
+the ``peers`` setting, for hosts mDNS does not reach or several servers on
+one machine) and mirrors their catalogues with the same
+``/api/cache-list?since=`` deltas clients use. A client can then ask any
+one server about a package and learn which peers hold which file, instead
+of querying every server itself.
+
+With several server processes only the primary syncs; it writes the
+mirrors to ``federation.json`` and the workers read them from there.
+"""
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
+
+from src.client.query import MAX_QUERY_WORKERS, query_server
+from src.lib.data import DATA_DIR
+from src.lib.logger import Logger
+from .mdns_service import SERVICE_TYPE
+from .network_utils import get_ip_list
+
+
+logger = Logger("Federation")
+
+FEDERATION_INTERVAL = 10.0
+FEDERATION_FILE = f"{DATA_DIR}federation.json"
+
+
+def peer_key(peer):
+    return f"{peer['ip']}:{peer['port']}"
+
+
+def parse_peer(address):
+    """Turn ``"host:port"`` from the ``peers`` setting into a peer dict."""
+    host, _, port = address.rpartition(":")
+    return {"ip": socket.gethostbyname(host), "port": int(port)}
+
+
+def _entry(item):
+    # Servers without detail support send bare [name, version, architecture] rows.
+    if isinstance(item, dict):
+        return item
+    name, version, architecture = item[:3]
+    return {"name": name, "version": version, "architecture": architecture, "sha256": None, "size": None}
+
+
+class _PeerListener(ServiceListener):
+    def __init__(self, federation):
+        self.federation = federation
+        self.names = {}
+
+    def add_service(self, zc, type_, name):
+        info = zc.get_service_info(type_, name)
+        if not info or not info.addresses:
+            return
+        peer = {"ip": socket.inet_ntoa(info.addresses[0]), "port": info.port}
+        self.names[name] = peer_key(peer)
+        self.federation.add_peer(peer)
+
+    # A TXT update means the peer's generation moved on; sync it now.
+    update_service = add_service
+
+    def remove_service(self, zc, type_, name):
+        key = self.names.pop(name, None)
+        if key is not None:
+            self.federation.remove_peer(key)
+
+
+class _Mirrors:
+    """Read access to peer catalogues: {peer key: {epoch, generation, packages}}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogues = {}
+
+    def _refresh(self):
+        pass
+
+    def lookup(self, name):
+        """Return [(peer key, details)] for every peer holding a version of ``name``."""
+        self._refresh()
+        with self._lock:
+            return [
+                (key, entry)
+                for key, catalogue in self._catalogues.items()
+                for entry in catalogue["packages"].get(name, {}).values()
+            ]
+
+    def peers(self):
+        """Keys of the peers whose catalogues are mirrored right now."""
+        self._refresh()
+        with self._lock:
+            return sorted(self._catalogues)
+
+    def as_dict(self):
+        self._refresh()
+        with self._lock:
+            return {
+                key: {"generation": catalogue["generation"], "packages": sum(map(len, catalogue["packages"].values()))}
+                for key, catalogue in self._catalogues.items()
+            }
+
+
+class Federation(_Mirrors):
+    """Mirrors of every peer's catalogue, kept current in the background.
+
+    With a ``snapshot_path`` the mirrors are written there after every
+    sync round that changed them, for a ``FederationSnapshot`` to read.
+    """
+
+    def __init__(self, port, static_peers=(), interval=FEDERATION_INTERVAL, discover=True, snapshot_path=None):
+        super().__init__()
+        self.port = port
+        self.interval = interval
+        self.discover = discover
+        self.snapshot_path = snapshot_path
+        self._peers = {}
+        self._static = set()
+        self._changes = 0
+        self._saved_changes = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._zeroconf = None
+        self._thread = None
+        lan_ips = get_ip_list()
+        self._local_ips = set(lan_ips)
+        self._lan_ip = lan_ips[0] if lan_ips else "127.0.0.1"
+        for address in static_peers:
+            try:
+                peer = parse_peer(address)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring peer {address}: {e}")
+                continue
+            self._static.add(peer_key(peer))
+            self.add_peer(peer)
+
+    @classmethod
+    def from_config(cls, config, snapshot_path=None):
+        return cls(
+            config.get_port(),
+            static_peers=config.get("peers") or (),
+            interval=config.get("federation_interval") or FEDERATION_INTERVAL,
+            discover=config.get("federation_mdns") is not False,
+            snapshot_path=snapshot_path,
+        )
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.snapshot_path is not None:
+            # replace whatever a previous run left for the workers
+            self.save_snapshot()
+        if self.discover:
+            self._zeroconf = Zeroconf()
+            ServiceBrowser(self._zeroconf, SERVICE_TYPE, _PeerListener(self))
+        self._thread = threading.Thread(target=self._run, name="federation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._zeroconf is not None:
+            self._zeroconf.close()
+            self._zeroconf = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add_peer(self, peer):
+        if peer["ip"].startswith("127.") or peer["ip"] in self._local_ips:
+            if peer["port"] == self.port:
+                return
+            # A server on this host: list it under the address other hosts reach it by.
+            peer = {**peer, "ip": self._lan_ip}
+        with self._lock:
+            self._peers[peer_key(peer)] = peer
+        self._wake.set()
+
+    def remove_peer(self, key):
+        with self._lock:
+            if key in self._static:
+                return
+            self._peers.pop(key, None)
+            if self._catalogues.pop(key, None) is not None:
+                self._changes += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.sync_all()
+            if self.snapshot_path is not None:
+                self.save_snapshot()
+
+    def save_snapshot(self):
+        """Write the mirrors to ``snapshot_path`` if they changed since the last write."""
+        with self._lock:
+            if self._changes == self._saved_changes:
+                return
+            changes = self._changes
+            data = {
+                key: {**catalogue, "packages": {name: list(files.values()) for name, files in catalogue["packages"].items()}}
+                for key, catalogue in self._catalogues.items()
+            }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Could not write {self.snapshot_path}: {e}")
+            return
+        self._saved_changes = changes
+
+    def sync_all(self):
+        with self._lock:
+            peers = list(self._peers.values())
+        if not peers:
+            return
+        with ThreadPoolExecutor(max_workers=min(MAX_QUERY_WORKERS, len(peers)), thread_name_prefix="federate") as pool:
+            list(pool.map(self.sync_peer, peers))
+
+    def sync_peer(self, peer):
+        """Bring one peer's mirror up to date. A peer that does not answer is dropped until it does."""
+        key = peer_key(peer)
+        with self._lock:
+            mirror = self._catalogues.get(key)
+        if mirror is None:
+            path = "/api/cache-list?since=0&detail=true"
+        else:
+            path = f"/api/cache-list?since={mirror['generation']}&epoch={mirror['epoch']}&detail=true"
+
+        try:
+            response = query_server(peer, path)
+        except (requests.RequestException, ValueError) as e:
+            with self._lock:
+                dropped = self._catalogues.pop(key, None) is not None
+                if dropped:
+                    self._changes += 1
+            if dropped:
+                logger.warning(f"Lost peer {key}: {e}")
+            return
+
+        if isinstance(response, list):
+            response = {"epoch": None, "generation": 0, "full": True, "packages": response}
+
+        if response["full"]:
+            packages = {}
+            added, removed = response["packages"], []
+        else:
+            packages = {name: dict(files) for name, files in mirror["packages"].items()}
+            added, removed = response["added"], response["removed"]
+        for row in removed:
+            files = packages.get(row[0])
+            if files is not None:
+                files.pop((row[1], row[2]), None)
+                if not files:
+                    del packages[row[0]]
+        for item in added:
+            entry = _entry(item)
+            packages.setdefault(entry["name"], {})[(entry["version"], entry["architecture"])] = entry
+
+        with self._lock:
+            # The same server seen under a second address (static and mDNS) is mirrored once.
+            duplicate = response["epoch"] is not None and any(
+                other != key and catalogue["epoch"] == response["epoch"]
+                for other, catalogue in self._catalogues.items()
+            )
+            if key in self._peers and not duplicate:
+                previous = self._catalogues.get(key)
+                if previous is None or (previous["epoch"], previous["generation"]) != (
+                        response["epoch"], response["generation"]):
+                    self._changes += 1
+                self._catalogues[key] = {
+                    "epoch": response["epoch"],
+                    "generation": response["generation"],
+                    "packages": packages,
+                }
+
+
+class FederationSnapshot(_Mirrors):
+    """The mirrors a primary process's ``Federation`` writes, as seen by a server worker."""
+
+    def __init__(self, path=FEDERATION_FILE):
+        super().__init__()
+        self.path = path
+        self._version = None
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._version:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.path}: {e}")
+            return
+        catalogues = {
+            key: {**catalogue, "packages": {
+                name: {(entry["version"], entry["architecture"]): entry for entry in entries}
+                for name, entries in catalogue["packages"].items()
+            }}
+            for key, catalogue in data.items()
+        }
+        with self._lock:
+            self._catalogues = catalogues
+            self._version = version
+
+
+def merge_federated(local, remote):
+    """Combine local details and (peer, details) pairs into one entry per distinct file.
+
+    Every entry carries ``local`` (the answering server has it) and
+    ``peers`` (the other servers that do).
+    """
+    merged = {}
+
+    def slot(details):
+        key = (details["version"], details["architecture"], details.get("sha256"))
+        if key not in merged:
+            merged[key] = {**details, "local": False, "peers": []}
+        return merged[key]
+
+    for details in local:
+        slot(details)["local"] = True
+    for key, details in remote:
+        slot(details)["peers"].append(key)
+    return list(merged.values())
@@ -0,0 +1,167 @@
+"""Conditional and byte-range file responses for LocalSync downloads."""
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from fastapi import Request
+from fastapi.responses import Response
+
+CHUNK_SIZE = 256 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def parse_range(range_header, size):
+    """Parse a single-range ``bytes=`` header into (start, end) inclusive.
+
+    Returns None when the header should be ignored (not a byte range or
+    several ranges, which we answer with the full file) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if first == "":
+            # Suffix range: the last N bytes.
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _range_allowed(request, etag, last_modified):
+    # If-Range carries either the ETag or the Last-Modified date we handed out earlier;
+    # on a mismatch the client has a stale partial file and gets the whole thing.
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    return if_range.strip() in (etag, last_modified)
+
+
+class BlobResponse(Response):
+    """Send a byte range of a file without tying up a worker thread for the whole transfer.
+
+    Uses the ASGI zero-copy extension (sendfile) when the server offers it
+    and no bandwidth limit applies; otherwise reads chunks with ``pread`` on
+    a worker thread and sends them from the event loop. Holds a download
+    slot from ``limits`` for as long as the body is being sent.
+    """
+
+    media_type = "application/octet-stream"
+
+    def __init__(self, path, start, length, status_code=200, headers=None, limits=None):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.length = length
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if self.limits is None:
+            await self._send(scope, send)
+            return
+        async with self.limits.downloads:
+            await self._send(scope, send)
+
+    async def _send(self, scope, send):
+        shaper = self.limits.shaper if self.limits is not None else None
+        client = (scope.get("client") or ("unknown", 0))[0]
+
+        fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if (self.length > 0 and ZEROCOPY_EXTENSION in scope.get("extensions", {})
+                    and not (shaper and shaper.enabled)):
+                await send({"type": ZEROCOPY_EXTENSION, "file": fd, "offset": self.start, "count": self.length})
+                return
+
+            if shaper is not None:
+                shaper.open(client)
+            try:
+                offset, remaining = self.start, self.length
+                finished = False
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    finished = remaining == 0
+                    await send({"type": "http.response.body", "body": chunk, "more_body": not finished})
+                    if shaper is not None and not finished:
+                        await shaper.throttle(client, len(chunk))
+                if not finished:
+                    # An empty file, or one that shrank underneath us: the body still has to end.
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+            finally:
+                if shaper is not None:
+                    shaper.close(client)
+        finally:
+            os.close(fd)
+
+
+async def serve_file(request: Request, path, digest, filename=None, limits=None):
+    """Serve a blob with ETag/Last-Modified validators and Range support.
+
+    Raises FileNotFoundError if the blob is gone.
+    """
+    stat = await anyio.to_thread.run_sync(os.stat, path)
+    size = stat.st_size
+    etag = f'"{digest}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    status_code = 200
+    start, end = 0, size - 1
+    range_header = request.headers.get("range")
+    if range_header and _range_allowed(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = max(end - start + 1, 0)
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="application/octet-stream")
+
+    return BlobResponse(path, start, length, status_code=status_code, headers=headers, limits=limits)
@@ -0,0 +1,63 @@
+"""Request metrics for the LocalSync server.
+
+``MetricsMiddleware`` times every HTTP request until its last body byte is
+sent and counts the bytes, labelled by route template (``/pool/{filename}``
+rather than each file) so the number of series stays small.
+"""
+import time
+
+from src.lib.metrics import Counter, Gauge, Histogram
+from .file_serving import ZEROCOPY_EXTENSION
+
+REQUESTS = Counter("localsync_http_requests_total", "HTTP requests, by method, route and status.",
+                   ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("localsync_http_request_duration_seconds",
+                            "Time from receiving a request to sending its last byte.", ["route"])
+RESPONSE_BYTES = Counter("localsync_http_response_bytes_total", "Response body bytes sent, by route.", ["route"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency and bytes served."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_counting(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message["type"] == ZEROCOPY_EXTENSION:
+                sent += message.get("count") or 0
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counting)
+        finally:
+            # The router stores the matched route in the shared scope; proxied requests have none.
+            route = scope.get("route")
+            label = getattr(route, "path", None) or ("proxy" if scope.get("localsync.proxied") else "unmatched")
+            REQUESTS.inc(method=scope["method"], route=label, status=str(status))
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=label)
+            RESPONSE_BYTES.inc(sent, route=label)
+
+
+def register_gauges(cache_event_handler, limits, federation=None):
+    """Gauges read from live server state at scrape time."""
+    Gauge("localsync_packages", "Packages in the index.", func=lambda: len(cache_event_handler.index))
+    Gauge("localsync_index_generation", "Index generation; grows with every catalogue change.",
+          func=lambda: cache_event_handler.index.generation)
+    Gauge("localsync_active_downloads", "Downloads being sent right now.",
+          func=lambda: limits.as_dict()["active_downloads"])
+    if federation is not None:
+        Gauge("localsync_federated_peers", "Peers whose catalogues are mirrored.", func=lambda: len(federation.peers()))
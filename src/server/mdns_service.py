@@ -3,29 +3,69 @@ from zeroconf import ServiceInfo, Zeroconf
 import socket
 import threading
 
+from src.lib.data import DEFAULT_PORT
+from src.lib.debounce import Debouncer
+from src.lib.metrics import Counter, Gauge, Histogram
+
 SERVICE_TYPE = "_localsync._tcp.local."
-SERVICE_PORT = 53456
+SERVICE_PORT = DEFAULT_PORT
+
+# Re-announce once the catalogue has been quiet this long, but at least this often during a burst.
+ANNOUNCE_DEBOUNCE = 2.0
+ANNOUNCE_MAX_DELAY = 15.0
+
+ANNOUNCEMENTS = Counter("localsync_mdns_announcements_total", "mDNS registrations and TXT record updates.", ["kind"])
+ANNOUNCE_SECONDS = Histogram("localsync_mdns_announce_seconds", "Time to register or update the mDNS service.", ["kind"])
 
 # Global variables to store zeroconf instance
 zeroconf_instance = None
 service_info = None
 mdns_thread = None
+announcer = None
+
+
+def service_properties(index):
+    """TXT record properties describing the current catalogue."""
+    return {
+        'path': '/api/cache-list',
+        'package_count': str(len(index)),
+        'epoch': index.epoch,
+        'generation': str(index.generation),
+    }
+
+
+def announce_catalogue(index):
+    """Re-announce the service so browsers see the current package count and generation."""
+    global service_info
+    if zeroconf_instance is None or service_info is None:
+        return
+
+    service_info = ServiceInfo(
+        SERVICE_TYPE,
+        service_info.name,
+        addresses=service_info.addresses,
+        port=service_info.port,
+        properties=service_properties(index),
+        server=service_info.server,
+    )
+    with ANNOUNCE_SECONDS.time(kind="update"):
+        zeroconf_instance.update_service(service_info)
+    ANNOUNCEMENTS.inc(kind="update")
 
 
 def run_mdns_in_thread(cache_event_handler):
     """Run mDNS registration in a separate thread"""
-    global zeroconf_instance, service_info
+    global zeroconf_instance, service_info, announcer
     from .network_utils import get_ip_list
     
-    # Get current package count from cache
-    package_count = str(len(cache_event_handler.get_formatted_content()))
+    index = cache_event_handler.index
     
-    desc = {
-        'path': '/api/cache-list',
-        'package_count': package_count
-    }
+    desc = service_properties(index)
     hostname = socket.gethostname()
     local_ip = get_ip_list()
+    port = cache_event_handler.config.get_port()
+    # Several servers on one host need distinct instance names.
+    instance = hostname if port == SERVICE_PORT else f"{hostname}-{port}"
 
     if not local_ip:
         print("No valid IP address found for mDNS registration.")
@@ -33,27 +73,44 @@ def run_mdns_in_thread(cache_event_handler):
 
     service_info = ServiceInfo(
         SERVICE_TYPE,
-        f"{hostname}.{SERVICE_TYPE}",
+        f"{instance}.{SERVICE_TYPE}",
         addresses=[socket.inet_aton(ip) for ip in local_ip],
-        port=SERVICE_PORT,
+        port=port,
         properties=desc,
         server=f"{hostname}.local.",
     )
 
-    zeroconf_instance = Zeroconf()
-    print(f"Registering mDNS service {service_info.name} at {local_ip}:{SERVICE_PORT}")
-    zeroconf_instance.register_service(service_info)
+    zeroconf = Zeroconf()
+    print(f"Registering mDNS service {service_info.name} at {local_ip}:{port}")
+    with ANNOUNCE_SECONDS.time(kind="register"):
+        zeroconf.register_service(service_info)
+    ANNOUNCEMENTS.inc(kind="register")
+    zeroconf_instance = zeroconf
+    print("mDNS service registered successfully")
+
+    # A burst of apt downloads becomes a single TXT update.
+    if announcer is None:
+        announcer = Debouncer(
+            lambda: announce_catalogue(index),
+            ANNOUNCE_DEBOUNCE,
+            ANNOUNCE_MAX_DELAY,
+            name="mdns-announce",
+        )
+        index.add_listener(lambda op, key: announcer.trigger())
+    announcer.trigger()
     return True
 
 
 def mDNS_register(cache_event_handler):
-    """Start mDNS registration in a separate thread"""
+    """Start mDNS registration in a separate thread.
+
+    Registration (which probes the network for a few hundred milliseconds)
+    finishes in the background so the server can bind its port right away.
+    """
     global mdns_thread
     mdns_thread = threading.Thread(target=run_mdns_in_thread, args=(cache_event_handler,), daemon=True)
     mdns_thread.start()
-    # Give it a moment to register
-    threading.Event().wait(0.5)
-    return service_info, zeroconf_instance
+    return mdns_thread
 
 
 def mDNS_unregister():
@@ -78,4 +135,7 @@ def mDNS_unregister():
 
 def is_mdns_registered():
     """Check if mDNS service is currently registered"""
-    return zeroconf_instance is not None
\ No newline at end of file
+    return zeroconf_instance is not None
+
+
+Gauge("localsync_mdns_registered", "1 while the mDNS service is registered.", func=lambda: int(is_mdns_registered()))
@@ -0,0 +1,167 @@
+"""Sampling profiler that can be switched on in a running server.
+
+A background thread snapshots every thread's Python stack at a fixed
+interval and counts identical stacks. Overhead is one stack walk per
+thread per sample, and nothing at all while it is stopped. Results come
+as folded stacks (``thread;outer;...;inner count``), the input format of
+flamegraph.pl and speedscope, or as the functions most often on top.
+
+Toggle it with ``SIGUSR2`` (the folded stacks are written to a file when
+it stops) or, when ``"profiler": true`` is set, through ``/api/profiler``.
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from src.lib.data import DATA_DIR
+
+DEFAULT_INTERVAL = 0.01
+MIN_INTERVAL = 0.001
+# Samples stopped in these files are threads blocked waiting for work, not hot spots.
+# (A thread in time.sleep shows up as the function that called it.)
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "inotify_c.py")
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Counts sampled stacks of every thread but its own."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._elapsed = 0.0
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            if interval:
+                self.interval = max(float(interval), MIN_INTERVAL)
+            self._stop = threading.Event()
+            self._started = time.monotonic()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return False
+            self._stop.set()
+            self._elapsed += time.monotonic() - self._started
+        thread.join()
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+            self._elapsed = 0.0
+            if self._thread is not None:
+                self._started = time.monotonic()
+
+    def _run(self, stop):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks.append(";".join(reversed(labels)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self._samples += 1
+
+    def folded(self):
+        """Sampled stacks in folded format, most frequent first."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def top(self, limit=20):
+        """The functions most often executing when sampled, with their share of busy thread samples.
+
+        Returns (top functions, share of samples where the thread was idle).
+        """
+        leaves = Counter()
+        idle = 0
+        with self._lock:
+            for stack, count in self._stacks.items():
+                leaf = stack.rsplit(";", 1)[-1]
+                if leaf.rpartition("(")[2].startswith(IDLE_FILES):
+                    idle += count
+                else:
+                    leaves[leaf] += count
+        busy = sum(leaves.values())
+        top = [
+            {"function": function, "samples": count, "percent": round(100.0 * count / (busy or 1), 2)}
+            for function, count in leaves.most_common(limit)
+        ]
+        return top, round(100.0 * idle / ((busy + idle) or 1), 2)
+
+    def as_dict(self, limit=20):
+        with self._lock:
+            elapsed = self._elapsed + (time.monotonic() - self._started if self._thread is not None else 0)
+            state = {
+                "running": self._thread is not None,
+                "interval": self.interval,
+                "samples": self._samples,
+                "seconds": round(elapsed, 3),
+            }
+        top, idle_percent = self.top(limit)
+        return {**state, "idle_percent": idle_percent, "top": top}
+
+    def dump(self, path=None):
+        """Write the folded stacks to ``path`` (by default a timestamped file in DATA_DIR)."""
+        path = path or os.path.join(DATA_DIR, f"profile-{os.getpid()}-{int(time.time())}.folded")
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+
+def install_signal_toggle(profiler, signum=getattr(signal, "SIGUSR2", None)):
+    """Start the profiler on the first signal; stop it and dump the stacks on the next."""
+    if signum is None:
+        return False
+
+    def toggle():
+        if profiler.running:
+            profiler.stop()
+            print(f"Profiler stopped; stacks written to {profiler.dump()}")
+            profiler.reset()
+        else:
+            profiler.start()
+            print(f"Profiler started, sampling every {profiler.interval}s")
+
+    def handle(_signum, _frame):
+        # The handler interrupts the main thread, which may hold the profiler's lock; toggle elsewhere.
+        threading.Thread(target=toggle, name="profiler-toggle", daemon=True).start()
+
+    try:
+        signal.signal(signum, handle)
+    except ValueError:
+        # Signal handlers can only be installed from the main thread.
+        return False
+    return True
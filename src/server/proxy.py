@@ -0,0 +1,289 @@
+"""Caching HTTP proxy mode for apt clients (apt-cacher style).
+
+Point apt at the server with ``Acquire::http::Proxy "http://<server>:53456";``.
+Requests are proxied only to the hosts listed in ``proxy_mirrors``, whether
+apt names them in an absolute-form request target or in the Host header.
+Any other target is refused with a 403, as is another server on this
+server's own port; a target naming this server itself is served locally.
+Package downloads (``*.deb``) are answered from the content store when
+possible. On a miss the file is fetched from the upstream mirror once,
+streamed to every client asking for it at the same time, and then
+ingested like any other cached archive. Everything else (Release,
+Packages, ...) is passed through uncached.
+"""
+import asyncio
+import os
+import re
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import Request
+
+from src.lib.data import DATA_DIR
+from src.lib.logger import Logger
+from .file_serving import serve_file
+from .network_utils import get_ip_list
+
+
+logger = Logger("Proxy")
+
+PROXY_CACHE_DIR = f"{DATA_DIR}proxy-cache/"
+CHUNK_SIZE = 256 * 1024
+UPSTREAM_TIMEOUT = (10, 60)
+# Mirrors proxied when config.json does not list its own ``proxy_mirrors``.
+DEFAULT_PROXY_MIRRORS = (
+    "deb.debian.org", "security.debian.org", "archive.ubuntu.com", "security.ubuntu.com", "ports.ubuntu.com",
+)
+# name_version_arch.deb; anything else is not cached, so it can never name a path outside the cache.
+DEB_FILENAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9.+~-]*_[A-Za-z0-9.+~:%-]+_[A-Za-z0-9-]+\.deb")
+# How often a waiting client checks for more data from a shared upstream fetch.
+POLL_INTERVAL = 0.02
+# Request headers forwarded upstream on pass-through requests.
+FORWARDED_REQUEST_HEADERS = (
+    "if-modified-since", "if-none-match", "range", "user-agent", "accept", "accept-encoding",
+)
+# Response headers copied back to the client. Bodies are relayed undecoded,
+# so content-length and content-encoding describe exactly the bytes sent.
+FORWARDED_RESPONSE_HEADERS = (
+    "content-type", "content-length", "content-encoding", "last-modified", "etag", "content-range",
+)
+
+
+def deb_filename(url):
+    """Return the package filename a URL points at, or None if it is not a plain ``.deb`` name."""
+    filename = os.path.basename(urlsplit(url).path)
+    if DEB_FILENAME.fullmatch(filename) is None or ".." in filename:
+        return None
+    return filename
+
+
+class UpstreamFetch:
+    """One in-flight download from the upstream mirror, shared by every waiting client."""
+
+    def __init__(self, url, tmp_path):
+        self.url = url
+        self.tmp_path = tmp_path
+        self.status_code = None
+        self.headers = {}
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.headers_ready = threading.Event()
+
+    def run(self, on_complete):
+        try:
+            # The file is cached as is, so ask for it without transfer compression.
+            with requests.get(self.url, headers={"Accept-Encoding": "identity"},
+                              stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+                self.status_code = response.status_code
+                self.headers = {
+                    key: value for key, value in response.headers.items()
+                    if key.lower() in FORWARDED_RESPONSE_HEADERS
+                }
+                self.headers_ready.set()
+                if response.status_code == 200:
+                    with open(self.tmp_path, "r+b") as f:
+                        for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                            f.write(chunk)
+                            f.flush()
+                            self.written += len(chunk)
+                    expected = response.headers.get("content-length")
+                    if expected is not None and int(expected) != self.written:
+                        raise IOError(f"Upstream sent {self.written} of {expected} bytes")
+        except (requests.RequestException, OSError) as e:
+            self.error = e
+            logger.error(f"Upstream fetch of {self.url} failed: {e}")
+        finally:
+            self.headers_ready.set()
+            self.done = True
+            on_complete(self)
+
+    async def stream(self, f):
+        """Yield the file as it grows until the upstream fetch completes."""
+        offset = 0
+        try:
+            while True:
+                written = self.written
+                if offset < written:
+                    chunk = os.pread(f.fileno(), min(CHUNK_SIZE, written - offset), offset)
+                    offset += len(chunk)
+                    yield chunk
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise IOError(f"Upstream fetch of {self.url} failed")
+                    if offset < self.written:
+                        # The fetch finished after we last looked; read the rest.
+                        continue
+                    return
+                await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            f.close()
+
+
+class ProxyCache:
+    """Coalesces upstream fetches and feeds finished packages to the ingestion pipeline."""
+
+    def __init__(self, cache_event_handler, cache_dir=PROXY_CACHE_DIR):
+        self.handler = cache_event_handler
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._inflight = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def join(self, url, filename):
+        """Return (fetch, open file) for a URL, starting the upstream fetch if nobody has yet."""
+        with self._lock:
+            fetch = self._inflight.get(url)
+            if fetch is None:
+                tmp_path = os.path.join(self.cache_dir, f".{filename}.{threading.get_ident()}.part")
+                open(tmp_path, "wb").close()
+                fetch = UpstreamFetch(url, tmp_path)
+                self._inflight[url] = fetch
+                threading.Thread(
+                    target=fetch.run, args=(self._complete,), name="proxy-fetch", daemon=True
+                ).start()
+                logger.info(f"Cache miss, fetching {url}")
+            # Open while holding the lock so the file cannot be moved away first.
+            return fetch, open(fetch.tmp_path, "rb")
+
+    def _complete(self, fetch):
+        with self._lock:
+            self._inflight.pop(fetch.url, None)
+
+        if fetch.error is not None or fetch.status_code != 200:
+            os.unlink(fetch.tmp_path)
+            return
+
+        final_path = os.path.join(self.cache_dir, deb_filename(fetch.url))
+        os.replace(fetch.tmp_path, final_path)
+        self.handler.ingest(final_path)
+
+
+def _local_names():
+    hostname = socket.gethostname()
+    return {
+        "localhost", "127.0.0.1", "0.0.0.0", "::1",
+        hostname, f"{hostname}.local", socket.getfqdn(), *get_ip_list(),
+    }
+
+
+class ProxyMiddleware:
+    """ASGI middleware that answers proxy-style requests before they reach the API routes."""
+
+    def __init__(self, app, proxy_cache, limits=None, port=None, mirrors=DEFAULT_PROXY_MIRRORS):
+        self.app = app
+        self.proxy_cache = proxy_cache
+        self.limits = limits
+        self.port = port
+        self.mirrors = {mirror.lower() for mirror in mirrors}
+        self.local_names = _local_names()
+
+    def _target_url(self, scope):
+        """Return the upstream URL for a proxy request, or None for a normal API request."""
+        path = scope["path"]
+        query = scope.get("query_string", b"").decode("latin-1")
+        suffix = f"?{query}" if query else ""
+
+        # h11 hands over the absolute-form request target as the path; __call__ checks its host.
+        if path.startswith("http://"):
+            return path + suffix
+
+        # httptools strips it to the path, so only a Host naming a configured mirror is proxied.
+        host = dict(scope["headers"]).get(b"host", b"").decode("latin-1")
+        if host and urlsplit(f"http://{host}").hostname in self.mirrors:
+            return f"http://{host}{path}{suffix}"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        url = self._target_url(scope)
+        if url is None:
+            return await self.app(scope, receive, send)
+
+        target = urlsplit(url)
+        try:
+            port = target.port or 80
+        except ValueError:
+            return await Response(status_code=400)(scope, receive, send)
+        if port == self.port:
+            if target.hostname not in self.local_names:
+                # Most likely another LocalSync server, or this one under a name we do not know.
+                return await Response("Refusing to proxy to this server's own port", status_code=403)(
+                    scope, receive, send)
+            # apt using this server both as proxy and as a source (the /apt repository).
+            # The path is already decoded; raw_path keeps the target as sent.
+            raw_path = urlsplit(scope.get("raw_path", b"").decode("latin-1")).path or target.path
+            scope = {**scope, "path": target.path, "raw_path": raw_path.encode("latin-1")}
+            return await self.app(scope, receive, send)
+        if target.hostname not in self.mirrors:
+            return await Response("Not a configured proxy mirror", status_code=403)(scope, receive, send)
+
+        # Lets the metrics middleware label the request; no route matches a proxied URL.
+        scope["localsync.proxied"] = True
+        request = Request(scope, receive)
+        response = await self.handle(request, url)
+        await response(scope, receive, send)
+
+    async def handle(self, request, url):
+        if request.method not in ("GET", "HEAD"):
+            return Response(status_code=405)
+
+        filename = deb_filename(url)
+        if filename is None:
+            return await asyncio.to_thread(self._pass_through, request, url)
+
+        resolved = self.proxy_cache.handler.resolve_file(filename)
+        if resolved is not None:
+            file_path, digest = resolved
+            try:
+                response = await serve_file(request, file_path, digest, limits=self.limits)
+            except FileNotFoundError:
+                response = None
+            if response is not None:
+                if request.method != "HEAD":
+                    await asyncio.to_thread(self.proxy_cache.handler.access.record, digest)
+                return response
+
+        if request.method == "HEAD":
+            # Only a GET is worth a download to cache.
+            return await asyncio.to_thread(self._pass_through, request, url)
+
+        fetch, f = self.proxy_cache.join(url, filename)
+        await asyncio.to_thread(fetch.headers_ready.wait)
+        if fetch.status_code != 200:
+            f.close()
+            return Response(status_code=fetch.status_code or 502)
+        return StreamingResponse(fetch.stream(f), status_code=200, headers=fetch.headers)
+
+    def _pass_through(self, request, url):
+        # Without the client's own Accept-Encoding, ask for the body as is.
+        headers = {"Accept-Encoding": "identity"}
+        headers.update(
+            (key, value) for key, value in request.headers.items()
+            if key.lower() in FORWARDED_REQUEST_HEADERS
+        )
+        try:
+            upstream = requests.request(request.method, url, headers=headers, stream=True, timeout=UPSTREAM_TIMEOUT)
+        except requests.RequestException as e:
+            logger.error(f"Upstream request to {url} failed: {e}")
+            return Response(status_code=502)
+
+        response_headers = {
+            key: value for key, value in upstream.headers.items()
+            if key.lower() in FORWARDED_RESPONSE_HEADERS
+        }
+        if request.method == "HEAD":
+            upstream.close()
+            return Response(status_code=upstream.status_code, headers=response_headers)
+
+        def body():
+            with upstream:
+                yield from upstream.raw.stream(CHUNK_SIZE, decode_content=False)
+
+        return StreamingResponse(body(), status_code=upstream.status_code, headers=response_headers)
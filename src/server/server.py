@@ -1,5 +1,27 @@
-"""Main entry point for LocalSync server application."""
+"""Main entry point for LocalSync server application.
+
+The application, and with it the one CacheEventHandler shared by the API,
+the filesystem watcher and mDNS, is created on first use rather than at
+import time. ``uvicorn src.server.server:app`` keeps working.
+"""
+import threading
+
 from .app_config import create_app
 
-# Create the FastAPI application
-app = create_app()
\ No newline at end of file
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    """Return the FastAPI application, creating it on the first call."""
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+        return _app
+
+
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
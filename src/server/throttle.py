@@ -0,0 +1,114 @@
+"""Concurrency limits and bandwidth shaping for the LocalSync server.
+
+Downloads and metadata requests get separate budgets, so a classroom of
+clients pulling large packages cannot starve catalogue lookups. Download
+bandwidth can be capped overall and per client; with an overall cap each
+active client gets an equal share, however many parallel range requests
+it opens.
+"""
+import threading
+import time
+
+import anyio
+
+DEFAULT_MAX_DOWNLOADS = 64
+DEFAULT_MAX_METADATA = 16
+# Longest single pause; keeps slow clients' connections from looking dead.
+MAX_THROTTLE_SLEEP = 1.0
+
+
+class BandwidthShaper:
+    """Fair per-client rate limiting with a virtual finish time per client."""
+
+    def __init__(self, total_rate=None, client_rate=None):
+        self.total_rate = total_rate
+        self.client_rate = client_rate
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    @property
+    def enabled(self):
+        return bool(self.total_rate or self.client_rate)
+
+    def open(self, client):
+        """Register one stream for ``client``; pair with close()."""
+        with self._lock:
+            entry = self._clients.setdefault(client, {"streams": 0, "next": time.monotonic()})
+            entry["streams"] += 1
+
+    def close(self, client):
+        with self._lock:
+            entry = self._clients.get(client)
+            if entry is not None:
+                entry["streams"] -= 1
+                if entry["streams"] <= 0:
+                    del self._clients[client]
+
+    def rate_for(self, client):
+        """Bytes per second currently allowed for ``client``, or None for unlimited."""
+        rates = []
+        if self.client_rate:
+            rates.append(self.client_rate)
+        if self.total_rate:
+            rates.append(self.total_rate / max(len(self._clients), 1))
+        return min(rates) if rates else None
+
+    async def throttle(self, client, nbytes):
+        """Sleep long enough that ``client`` stays within its share after sending ``nbytes``."""
+        with self._lock:
+            rate = self.rate_for(client)
+            entry = self._clients.get(client)
+            if rate is None or entry is None:
+                return
+            now = time.monotonic()
+            entry["next"] = max(entry["next"], now) + nbytes / rate
+            delay = entry["next"] - now
+        while delay > 0:
+            await anyio.sleep(min(delay, MAX_THROTTLE_SLEEP))
+            delay -= MAX_THROTTLE_SLEEP
+
+
+class ServingLimits:
+    """Separate capacity for downloads and metadata work, plus the download shaper."""
+
+    def __init__(self, max_downloads=DEFAULT_MAX_DOWNLOADS, max_metadata=DEFAULT_MAX_METADATA,
+                 shaper=None):
+        self.max_downloads = max_downloads
+        self.max_metadata = max_metadata
+        self.shaper = shaper or BandwidthShaper()
+        self._downloads = None
+        self._metadata = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_downloads=config.get("max_downloads") or DEFAULT_MAX_DOWNLOADS,
+            max_metadata=config.get("max_metadata_requests") or DEFAULT_MAX_METADATA,
+            shaper=BandwidthShaper(config.get("download_rate_limit"), config.get("client_rate_limit")),
+        )
+
+    # anyio limiters must be created inside the event loop that uses them.
+    @property
+    def downloads(self):
+        if self._downloads is None:
+            self._downloads = anyio.CapacityLimiter(self.max_downloads)
+        return self._downloads
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = anyio.CapacityLimiter(self.max_metadata)
+        return self._metadata
+
+    async def run_metadata(self, func, *args):
+        """Run blocking metadata work on its own thread budget, apart from downloads."""
+        return await anyio.to_thread.run_sync(func, *args, limiter=self.metadata)
+
+    def as_dict(self):
+        return {
+            "max_downloads": self.max_downloads,
+            "active_downloads": self._downloads.borrowed_tokens if self._downloads else 0,
+            "max_metadata_requests": self.max_metadata,
+            "download_rate_limit": self.shaper.total_rate,
+            "client_rate_limit": self.shaper.client_rate,
+        }
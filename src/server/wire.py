@@ -0,0 +1,104 @@
+"""Content negotiation for metadata responses: JSON or msgpack, optionally gzip/zstd compressed.
+
+msgpack and zstandard are optional; without them the server answers with
+JSON and gzip only.
+"""
+import gzip
+import json
+import threading
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 512
+
+
+def _accepts(header_value, token):
+    """Check whether a comma-separated Accept-style header lists ``token`` with a non-zero q."""
+    for part in header_value.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == token:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def negotiate(request: Request):
+    """Return the (media type, content encoding) a request asks for."""
+    accept = request.headers.get("accept", "")
+    accept_encoding = request.headers.get("accept-encoding", "")
+
+    media_type = "application/json"
+    if msgpack is not None and _accepts(accept, MSGPACK_MEDIA_TYPE):
+        media_type = MSGPACK_MEDIA_TYPE
+
+    encoding = None
+    if zstandard is not None and _accepts(accept_encoding, "zstd"):
+        encoding = "zstd"
+    elif _accepts(accept_encoding, "gzip"):
+        encoding = "gzip"
+    return media_type, encoding
+
+
+def encode_body(payload, media_type, encoding):
+    """Serialise and compress a payload. Returns (body, content encoding or None)."""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def encoded_response(body, media_type, encoding):
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def negotiated_response(request: Request, payload):
+    """Build a response in the format and compression the client asked for."""
+    media_type, encoding = negotiate(request)
+    body, encoding = encode_body(payload, media_type, encoding)
+    return encoded_response(body, media_type, encoding)
+
+
+class EncodedCache:
+    """Keeps encoded bodies of a payload until the payload object changes.
+
+    The package index hands out the same list object until it is modified,
+    so a hit only needs an identity check.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self._bodies = {}
+
+    def response(self, request: Request, payload):
+        media_type, encoding = negotiate(request)
+        key = (media_type, encoding)
+        with self._lock:
+            if payload is not self._source:
+                self._source = payload
+                self._bodies = {}
+            if key not in self._bodies:
+                self._bodies[key] = encode_body(payload, media_type, encoding)
+            body, used_encoding = self._bodies[key]
+        return encoded_response(body, media_type, used_encoding)
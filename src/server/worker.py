@@ -0,0 +1,27 @@
+"""ASGI entry point for server worker processes.
+
+With ``"workers": N`` in config.json, ``localsync serve`` runs N uvicorn
+workers on ``src.server.worker:app``. Each serves a read-only view of the
+catalogue kept by the primary process.
+"""
+import threading
+
+from .app_config import create_app
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def get_app():
+    """Return this worker's FastAPI application, creating it on the first call."""
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = create_app(worker=True)
+        return _app
+
+
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
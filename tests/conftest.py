@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class Upstream:
+    """A stand-in mirror serving canned responses and counting requests per path.
+
+    A ``Range: bytes=start-end`` request gets that slice with a 206.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self._lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.do_GET(send_body=False)
+
+            def do_GET(self, send_body=True):
+                with upstream._lock:
+                    upstream.hits[self.path] = upstream.hits.get(self.path, 0) + 1
+                body, headers, pieces, delay = upstream.routes.get(self.path, (None, {}, 1, 0))
+                if body is None:
+                    self.send_error(404)
+                    return
+                requested = self.headers.get("Range", "")
+                if requested.startswith("bytes="):
+                    start, _, end = requested[len("bytes="):].partition("-")
+                    end = min(int(end), len(body) - 1) if end else len(body) - 1
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+                    body = body[int(start):end + 1]
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if not send_body:
+                    return
+                step = -(-len(body) // pieces)
+                for start in range(0, len(body), step):
+                    self.wfile.write(body[start:start + step])
+                    self.wfile.flush()
+                    time.sleep(delay)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def serve(self, path, body, headers=None, pieces=1, delay=0):
+        """Answer ``path`` with ``body``, sent in ``pieces`` writes ``delay`` seconds apart."""
+        self.routes[path] = (body, headers or {}, pieces, delay)
+
+
+@pytest.fixture
+def upstream():
+    server = Upstream()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """A server data directory (the working directory) with an empty apt cache in ``apt/``.
+
+    Every store opened meanwhile (catalogue, access stats, control cache) is
+    closed before the working directory is restored.
+    """
+    import src.lib.cache
+    import src.lib.data
+    import src.lib.store
+
+    stores = []
+
+    def open_store(*args, **kwargs):
+        store = src.lib.store.open_store(*args, **kwargs)
+        stores.append(store)
+        return store
+
+    cache_dir = tmp_path / "apt"
+    cache_dir.mkdir()
+    (tmp_path / "config.json").write_text(json.dumps({"cache_dirs": [f"{cache_dir}/"]}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(src.lib.data, "_store", None)
+    monkeypatch.setattr(src.lib.data, "open_store", open_store)
+    monkeypatch.setattr(src.lib.cache, "open_store", open_store)
+    yield tmp_path
+    for store in stores:
+        store.close()
+
+
+def http_scope(path, method="GET", headers=(), query=b""):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("latin-1"),
+        "root_path": "",
+        "query_string": query,
+        "headers": [(key.encode("latin-1"), value.encode("latin-1")) for key, value in headers],
+        "client": ("127.0.0.1", 40000),
+        "server": ("127.0.0.1", 53456),
+    }
+
+
+async def call_asgi(app, scope):
+    """Run one request through an ASGI app; returns (status, headers, body)."""
+    messages = []
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(message for message in messages if message["type"] == "http.response.start")
+    headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in start["headers"]}
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+    return start["status"], headers, body
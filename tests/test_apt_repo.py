@@ -0,0 +1,43 @@
+import gzip
+import hashlib
+import lzma
+import os
+import time
+
+from benchmarks.synthetic import build_deb
+from src.lib.apt_repo import AptRepository
+from src.lib.cache import CacheEventHandler
+
+
+def wait_for(path, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, f"{path} was not written"
+        time.sleep(0.02)
+
+
+def test_release_lists_the_hashes_of_the_written_indexes(workspace):
+    for name in ("a", "b"):
+        (workspace / "apt" / f"{name}_1.0_amd64.deb").write_bytes(build_deb(name, "1.0"))
+    handler = CacheEventHandler()
+    handler.wait_for_ingestion()
+    directory = workspace / "repo"
+    AptRepository(handler, directory=str(directory), delay=0.01, max_delay=0.01).start()
+    wait_for(directory / "Release")
+
+    release = (directory / "Release").read_text()
+    listed = {}
+    for line in release.split("SHA256:\n", 1)[1].splitlines():
+        digest, size, name = line.split()
+        listed[name] = (digest, int(size))
+    assert sorted(listed) == ["Packages", "Packages.gz", "Packages.xz"]
+    for name, (digest, size) in listed.items():
+        data = (directory / name).read_bytes()
+        assert (hashlib.sha256(data).hexdigest(), len(data)) == (digest, size)
+
+    packages = (directory / "Packages").read_bytes()
+    assert gzip.decompress((directory / "Packages.gz").read_bytes()) == packages
+    assert lzma.decompress((directory / "Packages.xz").read_bytes()) == packages
+    assert b"Package: a\n" in packages and b"Filename: pool/b_1.0_amd64.deb\n" in packages
+    # No temporary files are left behind.
+    assert sorted(os.listdir(directory)) == ["Packages", "Packages.gz", "Packages.xz", "Release"]
@@ -0,0 +1,36 @@
+import pytest
+
+from src.lib.debversion import compare_versions, parse_version, version_key
+
+
+@pytest.mark.parametrize("lower, higher", [
+    ("1.0", "1.1"),
+    ("1.9", "1.10"),
+    ("1.0~rc1", "1.0"),
+    ("1.0~~", "1.0~"),
+    ("1.0", "1.0a"),
+    ("1.0a", "1.0+"),
+    ("1.0-1", "1.0-2"),
+    ("1.0-9", "1.0-10"),
+    ("2.0", "1:0.1"),
+    ("1.0-1", "1.0-1ubuntu1"),
+    ("1.0", "1.0.1"),
+])
+def test_ordering(lower, higher):
+    assert compare_versions(lower, higher) < 0
+    assert compare_versions(higher, lower) > 0
+
+
+@pytest.mark.parametrize("a, b", [("1.0", "1.00"), ("0:1.0-1", "1.0-1"), ("1%3a2.0", "1:2.0")])
+def test_equal(a, b):
+    assert compare_versions(a, b) == 0
+
+
+def test_parse_version():
+    assert parse_version("1%3a2.3-4-5") == (1, "2.3-4", "5")
+    assert parse_version("2.3") == (0, "2.3", "0")
+
+
+def test_version_key_sorts():
+    versions = ["1:0.9", "1.0", "1.0~beta", "1.10", "1.2-1", "1.2"]
+    assert sorted(versions, key=version_key) == ["1.0~beta", "1.0", "1.2", "1.2-1", "1.10", "1:0.9"]
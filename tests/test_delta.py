@@ -0,0 +1,70 @@
+import json
+import random
+
+from src.client.delta import delta_download, find_basis, plan_rebuild
+from src.lib.chunks import build_manifest
+
+FILENAME = "demo_2.0-1_amd64.deb"
+
+
+def write_versions(tmp_path):
+    rng = random.Random(1)
+    old = rng.randbytes(600 * 1024)
+    # a changed stretch in the middle and a few bytes inserted near the start
+    new = old[:1000] + b"inserted" + old[1000:300_000] + rng.randbytes(20_000) + old[320_000:]
+    old_path = tmp_path / "demo_1.0-1_amd64.deb"
+    new_path = tmp_path / "new.deb"
+    old_path.write_bytes(old)
+    new_path.write_bytes(new)
+    return old_path, new_path, new
+
+
+def serve_package(upstream, new_path, new):
+    upstream.serve(f"/api/manifest/{FILENAME}", json.dumps(build_manifest(str(new_path))).encode(),
+                   {"Content-Type": "application/json"})
+    upstream.serve(f"/pool/{FILENAME}", new)
+
+
+def test_plan_reuses_shared_chunks_and_covers_the_file(tmp_path):
+    old_path, new_path, new = write_versions(tmp_path)
+    manifest = build_manifest(str(new_path))
+    copies, ranges, reused = plan_rebuild(manifest, str(old_path))
+
+    assert reused > len(new) * 0.8
+    covered = sorted([(target, target + length - 1) for _, target, length in copies] + ranges)
+    position = 0
+    for start, end in covered:
+        # merged ranges may re-download bytes a copy already wrote, but leave no gap
+        assert start <= position
+        position = max(position, end + 1)
+    assert position == len(new)
+
+
+def test_delta_download_rebuilds_the_new_version(tmp_path, upstream):
+    old_path, new_path, new = write_versions(tmp_path)
+    serve_package(upstream, new_path, new)
+    part_path = tmp_path / f"{FILENAME}.part"
+    server = {"ip": "127.0.0.1", "port": upstream.port}
+
+    assert delta_download([server], FILENAME, str(part_path), len(new), basis=str(old_path))
+    assert part_path.read_bytes() == new
+    assert upstream.hits[f"/pool/{FILENAME}"] < 10
+
+
+def test_delta_download_cleans_up_when_ranges_fail(tmp_path, upstream):
+    old_path, new_path, new = write_versions(tmp_path)
+    serve_package(upstream, new_path, new)
+    del upstream.routes[f"/pool/{FILENAME}"]
+    part_path = tmp_path / f"{FILENAME}.part"
+    server = {"ip": "127.0.0.1", "port": upstream.port}
+
+    assert not delta_download([server], FILENAME, str(part_path), len(new), basis=str(old_path))
+    assert not part_path.exists()
+
+
+def test_find_basis_picks_the_newest_other_version(tmp_path):
+    for version in ("1.0-1", "1.10-1", "1.9-1", "1:0.5-1"):
+        (tmp_path / f"demo_{version.replace(':', '%3a')}_amd64.deb").write_bytes(b"x")
+    (tmp_path / "demo_3.0-1_arm64.deb").write_bytes(b"x")
+    (tmp_path / FILENAME).write_bytes(b"x")
+    assert find_basis(FILENAME, dirs=[str(tmp_path)]).endswith("demo_1%3a0.5-1_amd64.deb")
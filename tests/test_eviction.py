@@ -0,0 +1,70 @@
+import json
+
+from benchmarks.synthetic import build_deb
+from src.lib.cache import CacheEventHandler
+from src.lib.eviction import CacheEvictor
+
+
+def write_deb(workspace, name, version, payload=b""):
+    path = workspace / "apt" / f"{name}_{version}_amd64.deb"
+    path.write_bytes(build_deb(name, version, payload=payload))
+    return str(path)
+
+
+def ingested_handler():
+    handler = CacheEventHandler()
+    handler.wait_for_ingestion()
+    return handler
+
+
+def test_eviction_keeps_source_files_and_does_not_reingest_them(workspace):
+    old = write_deb(workspace, "a", "1.0")
+    write_deb(workspace, "a", "1.1")
+    handler = ingested_handler()
+    digest = handler.index.lookup("a_1.0_amd64.deb")["sha256"]
+
+    assert CacheEvictor(handler, keep_versions=1).run_once() == 1
+
+    assert handler.index.lookup("a_1.0_amd64.deb") is None
+    assert not handler.blobs.has(digest)
+    assert open(old, "rb").read()
+    assert handler.scan() == []
+
+    handler.config.flush_cache()
+    restarted = CacheEventHandler(start_ingestion=False)
+    assert restarted.get_formatted_content() == [["a", "1.1", "amd64"]]
+    assert restarted.scan() == []
+
+
+def test_evict_sources_deletes_source_files(workspace):
+    old = write_deb(workspace, "a", "1.0")
+    write_deb(workspace, "a", "1.1")
+    handler = ingested_handler()
+
+    assert CacheEvictor(handler, keep_versions=1, evict_sources=True).run_once() == 1
+    assert not (workspace / "apt" / "a_1.0_amd64.deb").exists()
+    assert old not in handler.config.get_cache_records()
+
+
+def test_blob_referenced_again_is_not_removed(workspace):
+    write_deb(workspace, "a", "1.0", payload=b"shared")
+    handler = ingested_handler()
+    digest = handler.index.lookup("a_1.0_amd64.deb")["sha256"]
+
+    # Another cache directory got the same file while the evictor was deciding.
+    other = workspace / "other"
+    other.mkdir()
+    (other / "a_1.0_amd64.deb").write_bytes((workspace / "apt" / "a_1.0_amd64.deb").read_bytes())
+    handler.ingest(str(other / "a_1.0_amd64.deb"))
+    handler.index.remove(str(workspace / "apt" / "a_1.0_amd64.deb"))
+
+    assert CacheEvictor(handler).remove_blob(digest) is False
+    assert handler.blobs.has(digest)
+
+
+def test_age_eviction_is_off_with_workers(workspace):
+    config = json.loads((workspace / "config.json").read_text())
+    (workspace / "config.json").write_text(json.dumps({**config, "workers": 4, "cache_age": 60}))
+    handler = CacheEventHandler(start_ingestion=False)
+
+    assert CacheEvictor.from_config(handler).max_age is None
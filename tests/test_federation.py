@@ -0,0 +1,101 @@
+import json
+
+from src.server.federation import Federation, FederationSnapshot, merge_federated
+
+
+def details(name, version, sha256, architecture="amd64"):
+    return {"name": name, "version": version, "architecture": architecture, "sha256": sha256, "size": 10}
+
+
+def serve_list(upstream, path, payload):
+    upstream.serve(path, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+
+def make_federation(upstream, **kwargs):
+    federation = Federation(0, discover=False, **kwargs)
+    # the stand-in listens on loopback only, so keep it under that address
+    federation._lan_ip = "127.0.0.1"
+    peer = {"ip": "127.0.0.1", "port": upstream.port}
+    federation.add_peer(peer)
+    return federation, peer
+
+
+def test_merge_joins_the_same_file_and_keeps_distinct_ones():
+    local = [details("curl", "8.0", "aa")]
+    remote = [
+        ("10.0.0.2:8000", details("curl", "8.0", "aa")),
+        ("10.0.0.3:8000", details("curl", "8.0", "aa")),
+        ("10.0.0.3:8000", details("curl", "8.1", "bb")),
+    ]
+    merged = {entry["version"]: entry for entry in merge_federated(local, remote)}
+    assert merged["8.0"]["local"] is True
+    assert merged["8.0"]["peers"] == ["10.0.0.2:8000", "10.0.0.3:8000"]
+    assert merged["8.1"]["local"] is False
+    assert merged["8.1"]["peers"] == ["10.0.0.3:8000"]
+
+
+def test_sync_applies_full_list_then_delta(upstream):
+    federation, peer = make_federation(upstream)
+    key = f"127.0.0.1:{upstream.port}"
+    serve_list(upstream, "/api/cache-list?since=0&detail=true", {
+        "epoch": "e1", "generation": 2, "full": True,
+        "packages": [details("curl", "8.0", "aa"), details("wget", "1.21", "cc")],
+    })
+    federation.sync_peer(peer)
+    assert [entry["version"] for _, entry in federation.lookup("curl")] == ["8.0"]
+    assert federation.as_dict() == {key: {"generation": 2, "packages": 2}}
+
+    serve_list(upstream, "/api/cache-list?since=2&epoch=e1&detail=true", {
+        "epoch": "e1", "generation": 4, "full": False,
+        "added": [details("curl", "8.1", "bb")],
+        "removed": [["wget", "1.21", "amd64"]],
+    })
+    federation.sync_peer(peer)
+    assert sorted(entry["version"] for _, entry in federation.lookup("curl")) == ["8.0", "8.1"]
+    assert federation.lookup("wget") == []
+    assert federation.as_dict() == {key: {"generation": 4, "packages": 2}}
+
+
+def test_unreachable_peer_is_dropped(upstream):
+    federation, peer = make_federation(upstream)
+    serve_list(upstream, "/api/cache-list?since=0&detail=true", {
+        "epoch": "e1", "generation": 1, "full": True, "packages": [details("curl", "8.0", "aa")],
+    })
+    federation.sync_peer(peer)
+    assert federation.peers()
+
+    upstream.routes.clear()
+    federation.sync_peer(peer)
+    assert federation.peers() == []
+    assert federation.lookup("curl") == []
+
+
+def test_snapshot_carries_mirrors_to_workers(upstream, tmp_path):
+    path = tmp_path / "federation.json"
+    federation, peer = make_federation(upstream, snapshot_path=str(path))
+    snapshot = FederationSnapshot(str(path))
+    assert snapshot.peers() == []
+
+    serve_list(upstream, "/api/cache-list?since=0&detail=true", {
+        "epoch": "e1", "generation": 1, "full": True, "packages": [details("curl", "8.0", "aa")],
+    })
+    federation.sync_peer(peer)
+    federation.save_snapshot()
+    assert snapshot.lookup("curl") == federation.lookup("curl")
+    assert snapshot.as_dict() == federation.as_dict()
+
+    serve_list(upstream, "/api/cache-list?since=1&epoch=e1&detail=true", {
+        "epoch": "e1", "generation": 2, "full": False,
+        "added": [details("curl", "8.1", "bb")], "removed": [],
+    })
+    federation.sync_peer(peer)
+    federation.save_snapshot()
+    assert sorted(entry["version"] for _, entry in snapshot.lookup("curl")) == ["8.0", "8.1"]
+
+
+def test_stop_ends_the_sync_thread():
+    federation = Federation(0, discover=False, interval=60)
+    federation.start()
+    thread = federation._thread
+    federation.stop()
+    assert not thread.is_alive()
@@ -0,0 +1,99 @@
+import asyncio
+from email.utils import formatdate
+
+import pytest
+from starlette.requests import Request
+
+from src.server.file_serving import serve_file
+
+from conftest import call_asgi, http_scope
+
+DIGEST = "ab" * 32
+ETAG = f'"{DIGEST}"'
+
+
+@pytest.fixture
+def blob(tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(bytes(range(256)) * 4)
+    return path
+
+
+def app_for(path):
+    async def app(scope, receive, send):
+        response = await serve_file(Request(scope, receive), str(path), DIGEST)
+        await response(scope, receive, send)
+    return app
+
+
+def get(path, **headers):
+    scope = http_scope("/pool/a_1_amd64.deb", headers=[(key.replace("_", "-"), value) for key, value in headers.items()])
+    return asyncio.run(call_asgi(app_for(path), scope))
+
+
+def test_full_file(blob):
+    status, headers, body = get(blob)
+    assert status == 200
+    assert body == blob.read_bytes()
+    assert headers["content-length"] == "1024"
+    assert headers["etag"] == ETAG
+
+
+@pytest.mark.parametrize("header, content_range, expected", [
+    ("bytes=0-99", "bytes 0-99/1024", slice(0, 100)),
+    ("bytes=1000-", "bytes 1000-1023/1024", slice(1000, 1024)),
+    ("bytes=-24", "bytes 1000-1023/1024", slice(1000, 1024)),
+    ("bytes=1000-5000", "bytes 1000-1023/1024", slice(1000, 1024)),
+])
+def test_range(blob, header, content_range, expected):
+    status, headers, body = get(blob, range=header)
+    assert status == 206
+    assert headers["content-range"] == content_range
+    assert body == blob.read_bytes()[expected]
+    assert int(headers["content-length"]) == len(body)
+
+
+def test_unsatisfiable_range(blob):
+    status, headers, body = get(blob, range="bytes=2000-")
+    assert status == 416
+    assert headers["content-range"] == "bytes */1024"
+    assert body == b""
+
+
+def test_if_range_with_a_stale_validator_sends_the_whole_file(blob):
+    status, _, body = get(blob, range="bytes=0-9", if_range='"stale"')
+    assert (status, len(body)) == (200, 1024)
+
+    status, _, body = get(blob, range="bytes=0-9", if_range=ETAG)
+    assert (status, len(body)) == (206, 10)
+
+    last_modified = formatdate(blob.stat().st_mtime, usegmt=True)
+    status, _, body = get(blob, range="bytes=0-9", if_range=last_modified)
+    assert (status, len(body)) == (206, 10)
+
+
+def test_if_none_match(blob):
+    assert get(blob, if_none_match=ETAG)[0] == 304
+    assert get(blob, if_none_match=f'"other", W/{ETAG}')[0] == 304
+    assert get(blob, if_none_match='"other"')[0] == 200
+
+
+def test_empty_file_ends_its_body(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app_for(path)(http_scope("/pool/a_1_amd64.deb"), receive, send))
+    assert messages[0]["type"] == "http.response.start"
+    assert messages[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+def test_missing_blob_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        get(tmp_path / "gone")
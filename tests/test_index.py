@@ -0,0 +1,122 @@
+import pytest
+
+from src.lib.index import PackageIndex
+from src.lib.store import LogCacheStore, SqliteCacheStore
+
+
+def deb(name, version="1.0"):
+    return f"/var/cache/apt/archives/{name}_{version}_amd64.deb"
+
+
+def test_readding_an_unchanged_path_is_not_a_change():
+    index = PackageIndex()
+    index.add(deb("a"), "d1", 1)
+    index.add(deb("a"), "d1", 1)
+    assert index.generation == 1
+    index.add(deb("a"), "d2", 1)
+    assert index.generation == 2
+    assert index.changes_since(1) == (2, [["a", "1.0", "amd64"]], [])
+
+
+def test_package_removed_and_added_again_is_sent_as_added():
+    index = PackageIndex()
+    index.add(deb("a"), "d1", 1)
+    index.add(deb("b"), "d3", 1)
+    index.remove(deb("a"))
+    index.add(deb("a"), "d2", 1)
+    index.remove(deb("b"))
+    assert index.changes_since(2) == (5, [["a", "1.0", "amd64"]], [["b", "1.0", "amd64"]])
+    # added and removed again within the window: the client may hold it from before
+    assert index.changes_since(1) == (5, [["a", "1.0", "amd64"]], [["b", "1.0", "amd64"]])
+
+
+def test_client_mirror_replaces_readded_rows():
+    from src.client.catalogue import apply_delta
+
+    mirror = {"epoch": "e", "generation": 1, "packages": [["a", "1.0", "amd64"], ["b", "1.0", "amd64"]]}
+    delta = {"epoch": "e", "generation": 2, "full": False,
+             "added": [["a", "1.0", "amd64"], ["c", "1.0", "amd64"]], "removed": [["b", "1.0", "amd64"]]}
+    assert apply_delta(mirror, delta)["packages"] == [["a", "1.0", "amd64"], ["c", "1.0", "amd64"]]
+
+
+def test_digest_references_follow_records():
+    index = PackageIndex()
+    index.add(deb("a"), "d1", 1)
+    index.add("/other/a_1.0_amd64.deb", "d1", 1)
+    index.remove(deb("a"))
+    assert index.has_digest("d1")
+    index.remove("/other/a_1.0_amd64.deb")
+    assert not index.has_digest("d1")
+
+
+def test_worker_index_answers_deltas_in_the_primary_numbering():
+    primary = PackageIndex()
+    for name in ("a", "b", "c"):
+        primary.add(deb(name))
+
+    worker = PackageIndex()
+    for name in ("a", "b", "c"):
+        worker.add(deb(name))
+    worker.follow(primary.epoch, primary.generation)
+    assert (worker.epoch, worker.generation) == (primary.epoch, 3)
+    assert worker.changes_since(3) == (3, [], [])
+    assert worker.changes_since(2) is None
+
+    primary.add(deb("d"))
+    primary.remove(deb("a"))
+    worker.add(deb("d"))
+    worker.remove(deb("a"))
+    worker.follow(primary.epoch, primary.generation)
+
+    assert worker.generation == primary.generation == 5
+    # A client that saw generation 4 (from the primary) gets at least what changed since.
+    for since in (3, 4):
+        generation, added, removed = worker.changes_since(since)
+        assert generation == 5
+        assert removed == [["a", "1.0", "amd64"]]
+        assert added == [["d", "1.0", "amd64"]]
+
+
+@pytest.mark.parametrize("backend", [LogCacheStore, SqliteCacheStore])
+def test_store_keeps_the_metadata_of_the_last_batch(tmp_path, backend):
+    path = str(tmp_path / "catalogue")
+    state = {"epoch": "e1", "generation": 0}
+    writer = backend(path)
+    writer.set_meta_source(lambda: dict(state))
+    writer.write_meta()
+    state["generation"] = 7
+    writer.put("a")
+    writer.flush()
+
+    reader = backend(path, read_only=True)
+    assert reader.load() == {"a": {}}
+    assert reader.meta() == {"epoch": "e1", "generation": 7}
+    writer.close()
+
+
+def test_compaction_keeps_the_metadata(tmp_path):
+    path = str(tmp_path / "catalogue.log")
+    writer = LogCacheStore(path, compact_min=5)
+    writer.set_meta_source(lambda: {"epoch": "e1", "generation": 9})
+    for i in range(10):
+        writer.put("a", {"n": i})
+    writer.flush()
+    writer.compact()
+
+    reader = LogCacheStore(path)
+    assert reader.load() == {"a": {"n": 9}}
+    assert reader.meta() == {"epoch": "e1", "generation": 9}
+
+
+def test_reader_ignores_a_batch_still_being_appended(tmp_path):
+    path = tmp_path / "catalogue.log"
+    path.write_text(
+        '{"op": "put", "key": "a", "record": {}}\n'
+        '{"op": "meta", "meta": {"epoch": "e1", "generation": 1}}\n'
+        '{"op": "put", "key": "b", "record": {}}\n'
+    )
+
+    reader = LogCacheStore(str(path), read_only=True)
+    assert reader.load() == {"a": {}}
+    assert reader.meta() == {"epoch": "e1", "generation": 1}
+    assert LogCacheStore(str(path)).load() == {"a": {}, "b": {}}
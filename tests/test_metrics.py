@@ -0,0 +1,46 @@
+import pytest
+
+from src.lib.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_output_and_label_escaping():
+    registry = Registry()
+    requests = Counter("app_requests_total", "Requests served.", ["route"], registry=registry)
+    requests.inc(route="/pool")
+    requests.inc(2, route="/pool")
+    requests.inc(route='say "hi"\\n\nnext')
+    assert registry.render() == (
+        "# HELP app_requests_total Requests served.\n"
+        "# TYPE app_requests_total counter\n"
+        'app_requests_total{route="/pool"} 3\n'
+        'app_requests_total{route="say \\"hi\\"\\\\n\\nnext"} 1\n'
+    )
+
+
+def test_labels_must_match():
+    counter = Counter("app_things_total", "Things.", ["kind"], registry=Registry())
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("app_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'app_seconds_bucket{le="0.1"} 2',
+        'app_seconds_bucket{le="1.0"} 3',
+        'app_seconds_bucket{le="+Inf"} 4',
+        "app_seconds_count 4",
+        "app_seconds_sum 3.65",
+    ]
+    assert latency.count() == 4
+
+
+def test_gauge_reads_its_function_at_scrape_time():
+    registry = Registry()
+    value = [1]
+    Gauge("app_items", "Items.", func=lambda: value[0], registry=registry)
+    value[0] = 7
+    assert registry.render().splitlines()[-1] == "app_items 7"
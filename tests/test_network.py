@@ -0,0 +1,54 @@
+import sys
+import threading
+
+import src.client.client
+from src.client import network, service_discovery
+import src.client.query
+
+client = sys.modules["src.client.client"]
+
+SERVER = {"ip": "10.0.0.2", "port": 53456, "properties": {}}
+
+
+def test_cached_servers_are_refreshed_in_a_daemon_thread(monkeypatch):
+    browsed = threading.Event()
+    calls = []
+
+    def run_client_mdns(quiet_period=None, verbose=True):
+        calls.append(quiet_period)
+        browsed.set()
+        return [{"ip": "10.0.0.3", "port": 53456, "properties": {}}]
+
+    saved = []
+    monkeypatch.setattr(network, "load_server_cache", lambda: [dict(SERVER)])
+    monkeypatch.setattr(network, "save_server_cache", saved.append)
+    monkeypatch.setattr(src.client.query, "query_servers", lambda servers, *args, **kwargs: [
+        (server, {"generation": 4}) for server in servers])
+    monkeypatch.setattr(service_discovery, "run_client_mdns", run_client_mdns)
+
+    threads = []
+    start = threading.Thread.start
+    monkeypatch.setattr(threading.Thread, "start", lambda self: (threads.append(self), start(self))[1])
+
+    servers = network.discover_servers(quiet_period=1.5)
+    assert [server["ip"] for server in servers] == ["10.0.0.2"]
+    assert [thread.daemon for thread in threads] == [True]
+    assert browsed.wait(5)
+    threads[0].join(5)
+    assert calls == [1.5]
+    assert sorted(server["ip"] for server in saved[0]) == ["10.0.0.2", "10.0.0.3"]
+
+
+def test_quiet_period_option_reaches_discovery(monkeypatch):
+    seen = []
+    monkeypatch.setattr(client, "discover_servers", lambda quiet_period=None: seen.append(quiet_period) or [])
+    monkeypatch.setattr(client, "list_packages", lambda servers: None)
+    client.client("list", "--quiet-period", "2")
+    assert seen == [2.0]
+
+
+def test_quiet_period_option_needs_a_number(monkeypatch, capsys):
+    monkeypatch.setattr(client, "discover_servers", lambda quiet_period=None: [])
+    monkeypatch.setattr(client, "list_packages", lambda servers: None)
+    client.client("list", "--quiet-period", "soon")
+    assert "needs a number" in capsys.readouterr().out
@@ -0,0 +1,29 @@
+import subprocess
+import sys
+
+import pytest
+
+import src.client.client
+from src.client import package_manager
+
+# The package re-exports the client() function under the module's name.
+client = sys.modules["src.client.client"]
+
+
+def test_fallback_passes_names_as_separate_arguments(monkeypatch):
+    calls = []
+    monkeypatch.setattr(subprocess, "run", lambda argv, **kwargs: calls.append(argv) or subprocess.CompletedProcess(argv, 0))
+    assert package_manager.fallback_apt_install(["foo;rm", "-rf ~", "bar"], assume_yes=True)
+    assert calls == [["sudo", "apt", "install", "-y", "foo;rm", "-rf ~", "bar"]]
+
+
+def test_manifest_skips_comments_and_blank_lines(tmp_path):
+    manifest = tmp_path / "packages.txt"
+    manifest.write_text("curl wget  # fetchers\n\n# editors\nvim\n")
+    assert package_manager.read_package_manifest(str(manifest)) == ["curl", "wget", "vim"]
+
+
+def test_missing_manifest_is_reported_without_a_traceback(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(client, "install_packages", lambda *args: pytest.fail("nothing should be installed"))
+    client.client("install", "--from-file", str(tmp_path / "missing.txt"))
+    assert "Error: cannot read manifest" in capsys.readouterr().out
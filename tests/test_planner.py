@@ -0,0 +1,85 @@
+from src.client.planner import InstallPlanner, parse_relations, read_dpkg_status
+
+PEER = {"ip": "10.0.0.2", "port": 53456}
+
+
+def pkg(name, version, **fields):
+    return {"name": name, "version": version, "architecture": "amd64", **fields}
+
+
+def planner(available, installed=None, provided=None):
+    catalogue = {}
+    for details in available:
+        catalogue.setdefault(details["name"], []).append((PEER, details))
+    lookups = []
+
+    def lookup(names):
+        lookups.append(names)
+        return {name: catalogue[name] for name in names if name in catalogue}
+
+    result = InstallPlanner(lookup, installed=installed or {}, provided=provided or {})
+    result.lookups = lookups
+    return result
+
+
+def test_parse_relations():
+    assert parse_relations("a (>= 1.0), b:any | c, d (<< 2)") == [
+        [("a", ">=", "1.0")], [("b", None, None), ("c", None, None)], [("d", "<<", "2")],
+    ]
+
+
+def test_pre_depends_are_planned_before_depends():
+    plan = planner([
+        pkg("app", "1.0", pre_depends="loader", depends="lib"),
+        pkg("lib", "1.0"),
+        pkg("loader", "1.0"),
+    ]).plan(["app"])
+    assert list(plan.packages) == ["app", "loader", "lib"]
+    assert plan.missing == plan.unresolved == []
+
+
+def test_newest_satisfying_version_and_installed_packages_are_skipped():
+    p = planner([
+        pkg("app", "1.0", depends="lib (<< 2.0), base (>= 1.0)"),
+        pkg("lib", "1.5"), pkg("lib", "1.9"), pkg("lib", "2.1"),
+        pkg("base", "1.2"),
+    ], installed={"base": "1.1"})
+    plan = p.plan(["app"])
+    assert plan.packages["lib"][1]["version"] == "1.9"
+    assert "base" not in plan.packages
+    # One lookup per dependency level.
+    assert p.lookups == [["app"], ["lib"]]
+
+
+def test_virtual_package_is_satisfied_by_a_planned_provider():
+    plan = planner([
+        pkg("app", "1.0", depends="mail-transport-agent, libfoo | libfoo-compat"),
+        pkg("mta", "1.0", provides="mail-transport-agent"),
+        pkg("libfoo-compat", "2.0", provides="libfoo (= 2.0)"),
+        pkg("web", "1.0", depends="libfoo (>= 2.0)"),
+    ]).plan(["mta", "app", "web"])
+    assert sorted(plan.packages) == ["app", "libfoo-compat", "mta", "web"]
+    assert plan.unresolved == []
+
+
+def test_virtual_package_provided_by_the_system():
+    plan = planner([pkg("app", "1.0", depends="awk")], provided={"awk": [None]}).plan(["app"])
+    assert list(plan.packages) == ["app"]
+
+
+def test_missing_and_unresolved_are_reported():
+    plan = planner([pkg("app", "1.0", depends="libx (>= 3) | liby")]).plan(["app", "ghost"])
+    assert plan.missing == ["ghost"]
+    assert plan.unresolved == ["libx (>= 3) | liby"]
+
+
+def test_read_dpkg_status(tmp_path):
+    status = tmp_path / "status"
+    status.write_text(
+        "Package: mawk\nStatus: install ok installed\nVersion: 1.3.4\nProvides: awk\n\n"
+        "Package: exim4\nStatus: deinstall ok config-files\nVersion: 4.96\n\n"
+        "Package: libc6\nStatus: install ok installed\nVersion: 2.36-9\nProvides: libc (= 2.36)\n"
+    )
+    installed, provided = read_dpkg_status(str(status))
+    assert installed == {"mawk": "1.3.4", "libc6": "2.36-9"}
+    assert provided == {"awk": [None], "libc": ["2.36"]}
@@ -0,0 +1,176 @@
+import asyncio
+import gzip
+import os
+
+import pytest
+
+from src.server.proxy import ProxyCache, ProxyMiddleware, UpstreamFetch, deb_filename
+
+from conftest import call_asgi, http_scope
+
+PORT = 53456
+
+
+class StubHandler:
+    """Stands in for CacheEventHandler: an empty cache that records ingests."""
+
+    def __init__(self):
+        self.ingested = []
+
+    def resolve_file(self, filename):
+        return None
+
+    def ingest(self, path):
+        with open(path, "rb") as f:
+            self.ingested.append((path, f.read()))
+
+
+async def local_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"x-local", b"1")]})
+    await send({"type": "http.response.body", "body": scope["path"].encode()})
+
+
+def middleware(tmp_path=None, mirrors=("127.0.0.1",)):
+    proxy_cache = ProxyCache(StubHandler(), cache_dir=str(tmp_path)) if tmp_path is not None else None
+    return ProxyMiddleware(local_app, proxy_cache, port=PORT, mirrors=mirrors)
+
+
+def test_absolute_form_target_is_proxied():
+    proxy = middleware()
+    scope = http_scope("http://deb.debian.org/debian/dists/stable/Release", headers=[("host", "deb.debian.org")])
+    assert proxy._target_url(scope) == "http://deb.debian.org/debian/dists/stable/Release"
+
+
+def test_absolute_form_target_outside_mirrors_is_refused(upstream):
+    upstream.serve("/secret", b"internal")
+    proxy = middleware(mirrors=["deb.debian.org"])
+    status, _, _ = asyncio.run(call_asgi(proxy, http_scope(upstream.url("/secret"))))
+    assert status == 403
+    assert upstream.hits == {}
+
+
+def test_unknown_host_is_not_proxied():
+    proxy = middleware()
+    for host in ("deb.debian.org", "internal.example:8080", "[fe80::1]", "server.lan"):
+        assert proxy._target_url(http_scope("/pool/a.deb", headers=[("host", host)])) is None
+
+
+def test_configured_mirror_host_is_proxied():
+    proxy = middleware(mirrors=["deb.debian.org"])
+    scope = http_scope("/debian/pool/a.deb", headers=[("host", "deb.debian.org")], query=b"x=1")
+    assert proxy._target_url(scope) == "http://deb.debian.org/debian/pool/a.deb?x=1"
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("http://deb.debian.org/pool/main/c/curl/curl_8.0-1_amd64.deb", "curl_8.0-1_amd64.deb"),
+    ("http://deb.debian.org/pool/libc6_2.36-9%3a1_amd64.deb", "libc6_2.36-9%3a1_amd64.deb"),
+    ("http://deb.debian.org/pool/..%2F..%2Fetc%2Fevil_1_all.deb", None),
+    ("http://deb.debian.org/pool/.._1_all.deb", None),
+    ("http://deb.debian.org/pool/evil.deb", None),
+    ("http://deb.debian.org/dists/stable/Release", None),
+])
+def test_only_plain_package_names_are_cached(url, expected):
+    assert deb_filename(url) == expected
+
+
+def test_traversal_name_is_passed_through_not_cached(upstream, tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    proxy = middleware(cache_dir)
+    # the server has already decoded %2F once; the name must not be decoded again
+    asyncio.run(call_asgi(proxy, http_scope(upstream.url("/pool/..%2F..%2Fescape_1_all.deb"))))
+    assert proxy.proxy_cache.handler.ingested == []
+    assert sorted(os.listdir(tmp_path)) == ["cache"]
+    assert os.listdir(cache_dir) == []
+
+
+def test_head_on_a_miss_does_not_download(upstream, tmp_path):
+    upstream.serve("/pool/a_1_amd64.deb", b"x" * 1000)
+    proxy = middleware(tmp_path)
+    status, headers, _ = asyncio.run(call_asgi(proxy, http_scope(upstream.url("/pool/a_1_amd64.deb"), method="HEAD")))
+    assert status == 200
+    assert headers["content-length"] == "1000"
+    assert proxy.proxy_cache.handler.ingested == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_own_port_on_local_name_is_served_locally():
+    proxy = middleware()
+    status, headers, body = asyncio.run(call_asgi(proxy, http_scope(f"http://localhost:{PORT}/apt/Release")))
+    assert (status, headers.get("x-local"), body) == (200, "1", b"/apt/Release")
+
+
+def test_own_port_on_other_host_is_refused():
+    proxy = middleware()
+    status, _, _ = asyncio.run(call_asgi(proxy, http_scope(f"http://server.example:{PORT}/pool/a.deb")))
+    assert status == 403
+
+
+def test_concurrent_misses_share_one_upstream_fetch(upstream, tmp_path):
+    body = os.urandom(512 * 1024)
+    upstream.serve("/pool/a_1_amd64.deb", body, pieces=8, delay=0.05)
+    proxy = middleware(tmp_path)
+    scope = http_scope(upstream.url("/pool/a_1_amd64.deb"))
+
+    async def both():
+        return await asyncio.gather(call_asgi(proxy, scope), call_asgi(proxy, scope))
+
+    results = asyncio.run(both())
+    assert [(status, received) for status, _, received in results] == [(200, body), (200, body)]
+    assert upstream.hits == {"/pool/a_1_amd64.deb": 1}
+    assert proxy.proxy_cache.handler.ingested == [(str(tmp_path / "a_1_amd64.deb"), body)]
+
+
+class LateFetch(UpstreamFetch):
+    """A fetch that completes between the reader's check of ``written`` and of ``done``."""
+
+    reads = 0
+
+    @property
+    def written(self):
+        self.reads += 1
+        return 0 if self.reads == 1 else self._written
+
+    @written.setter
+    def written(self, value):
+        self._written = value
+
+
+def test_reader_behind_a_finished_fetch_gets_the_rest(tmp_path):
+    path = tmp_path / "part"
+    path.write_bytes(b"x" * 1000)
+    fetch = LateFetch("http://mirror/a.deb", str(path))
+    fetch.written = 1000
+    fetch.done = True
+
+    async def read():
+        return b"".join([chunk async for chunk in fetch.stream(open(path, "rb"))])
+
+    assert asyncio.run(read()) == b"x" * 1000
+
+
+def test_failed_fetch_raises_in_readers(tmp_path):
+    path = tmp_path / "part"
+    path.write_bytes(b"")
+    fetch = UpstreamFetch("http://mirror/a.deb", str(path))
+    fetch.error = IOError("reset")
+    fetch.done = True
+
+    async def read():
+        return [chunk async for chunk in fetch.stream(open(path, "rb"))]
+
+    with pytest.raises(IOError):
+        asyncio.run(read())
+
+
+def test_pass_through_relays_encoded_body_with_its_length(upstream):
+    encoded = gzip.compress(b"Package: a\n" * 1000)
+    upstream.serve("/dists/stable/Packages", encoded, headers={"Content-Encoding": "gzip"})
+    proxy = middleware()
+
+    status, headers, body = asyncio.run(call_asgi(proxy, http_scope(
+        upstream.url("/dists/stable/Packages"), headers=[("accept-encoding", "gzip")])))
+    assert status == 200
+    assert body == encoded
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(encoded)
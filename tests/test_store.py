@@ -0,0 +1,74 @@
+import json
+import time
+
+import pytest
+
+from src.lib.store import CacheStore, LogCacheStore, SqliteCacheStore
+
+
+def put_line(key):
+    return json.dumps({"op": "put", "key": key, "record": {}}) + "\n"
+
+
+def test_torn_tail_is_truncated_and_next_record_kept(tmp_path):
+    path = tmp_path / "catalogue.log"
+    path.write_text(put_line("a") + '{"op": "put", "ke')
+
+    store = LogCacheStore(str(path))
+    assert store.load() == {"a": {}}
+    store.put("b")
+    store.flush()
+
+    assert path.read_text() == put_line("a") + json.dumps({"op": "put", "key": "b", "record": {}}) + "\n"
+    assert LogCacheStore(str(path)).load() == {"a": {}, "b": {}}
+
+
+def test_complete_last_line_without_newline_is_kept(tmp_path):
+    path = tmp_path / "catalogue.log"
+    path.write_text(put_line("a").rstrip("\n"))
+
+    store = LogCacheStore(str(path))
+    assert store.load() == {"a": {}}
+    store.put("b")
+    store.flush()
+
+    assert LogCacheStore(str(path)).load() == {"a": {}, "b": {}}
+
+
+def test_read_only_store_leaves_torn_file_alone(tmp_path):
+    path = tmp_path / "catalogue.log"
+    content = put_line("a") + '{"op": "put", "ke'
+    path.write_text(content)
+
+    assert LogCacheStore(str(path), read_only=True).load() == {"a": {}}
+    assert path.read_text() == content
+
+
+@pytest.mark.parametrize("backend", [LogCacheStore, SqliteCacheStore])
+def test_single_update_is_flushed_by_timer(tmp_path, backend):
+    path = str(tmp_path / "catalogue")
+    store = backend(path, flush_interval=0.05)
+    store.put("a", {"size": 1})
+
+    deadline = time.monotonic() + 5
+    while store._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend(path).load() == {"a": {"size": 1}}
+    store.close()
+
+
+def test_compaction_keeps_live_entries(tmp_path):
+    path = tmp_path / "catalogue.log"
+    store = LogCacheStore(str(path), compact_min=10, compact_ratio=2.0)
+    for i in range(20):
+        store.put("a", {"n": i})
+    store.remove("b")
+    store.flush()
+
+    assert LogCacheStore(str(path)).load() == {"a": {"n": 19}}
+    assert len(path.read_text().splitlines()) < 20
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        CacheStore()
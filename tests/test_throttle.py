@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import anyio
+import pytest
+
+from src.server.file_serving import CHUNK_SIZE, BlobResponse
+from src.server.throttle import BandwidthShaper, ServingLimits
+
+from conftest import http_scope
+
+
+def blob(tmp_path, size):
+    path = tmp_path / "blob"
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+async def send_blob(path, size, limits, send):
+    response = BlobResponse(path, 0, size, limits=limits)
+    await response(http_scope("/pool/a_1_amd64.deb"), None, send)
+
+
+def test_transfer_keeps_to_the_client_rate(tmp_path):
+    size = 4 * CHUNK_SIZE
+    limits = ServingLimits(shaper=BandwidthShaper(client_rate=8 * CHUNK_SIZE))
+    received = []
+
+    async def send(message):
+        received.append(message.get("body", b""))
+
+    started = time.monotonic()
+    asyncio.run(send_blob(blob(tmp_path, size), size, limits, send))
+    elapsed = time.monotonic() - started
+
+    assert sum(map(len, received)) == size
+    # Three chunks are followed by a pause of CHUNK_SIZE / rate = 0.125 s each.
+    assert 0.35 <= elapsed < 2
+
+
+def test_total_rate_is_shared_between_active_clients():
+    shaper = BandwidthShaper(total_rate=1000)
+    shaper.open("a")
+    shaper.open("a")
+    assert shaper.rate_for("a") == 1000
+    shaper.open("b")
+    assert shaper.rate_for("a") == shaper.rate_for("b") == 500
+    shaper.close("b")
+    assert shaper.rate_for("a") == 1000
+
+
+def test_client_rate_caps_the_share():
+    shaper = BandwidthShaper(total_rate=1000, client_rate=100)
+    shaper.open("a")
+    assert shaper.rate_for("a") == 100
+
+
+def test_disconnect_releases_the_slot_and_the_share(tmp_path):
+    size = 4 * CHUNK_SIZE
+    shaper = BandwidthShaper(total_rate=100 * CHUNK_SIZE)
+    limits = ServingLimits(max_downloads=1, shaper=shaper)
+    sent = 0
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += 1
+            if sent == 2:
+                raise OSError("client went away")
+
+    async def run():
+        with pytest.raises(OSError):
+            await send_blob(blob(tmp_path, size), size, limits, send)
+        assert limits.downloads.borrowed_tokens == 0
+        assert shaper._clients == {}
+        # The single download slot is free for the next client.
+        with anyio.fail_after(1):
+            await send_blob(blob(tmp_path, size), size, limits, lambda message: asyncio.sleep(0))
+
+    asyncio.run(run())